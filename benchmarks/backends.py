@@ -0,0 +1,180 @@
+"""
+Parity checks and timings for the pandas and polars backends (see scripts.backend).
+
+Every pluggable transformation is run with both backends on synthetic inputs of
+increasing size. Results must be equal, dtypes included, and timings show where polars
+wins.
+
+    python -m benchmarks.backends
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from scripts import analysis, backend, config, sources, utils
+
+SCALES: tuple = (1, 10, 50)
+REPEATS: int = 3
+
+
+def _countries(n: int) -> list:
+    return [f"C{i:04d}" for i in range(n)]
+
+
+def weo_data(scale: int) -> pd.DataFrame:
+    """Raw WEO-like data: countries x indicators rows, one column per year"""
+
+    rng = np.random.default_rng(0)
+    countries, indicators = _countries(20 * scale), [f"IND{i}" for i in range(40)]
+    index = pd.MultiIndex.from_product([countries, indicators], names=["ISO", "code"])
+    years = {
+        str(y): [
+            f"{v:,.3f}" if v > -2500 else "--"
+            for v in (rng.random(len(index)) - 0.3) * 1e4
+        ]
+        for y in range(1980, 2028)
+    }
+
+    return pd.DataFrame(
+        {
+            "WEO Country Code": 0,
+            "ISO": index.get_level_values(0),
+            "WEO Subject Code": index.get_level_values(1),
+            "Country": index.get_level_values(0),
+            "Subject Descriptor": "descriptor",
+            "Subject Notes": "notes",
+            "Units": "units",
+            "Scale": "scale",
+            "Country/Series-specific Notes": "notes",
+        }
+        | years
+        | {"Estimates Start After": 2021}
+    )
+
+
+def fertilizer_data(scale: int) -> pd.DataFrame:
+    """Raw FAO fertilizer-like data"""
+
+    rng = np.random.default_rng(1)
+    elements = ["Agricultural Use", "Export Quantity", "Import Quantity", "Production"]
+    index = pd.MultiIndex.from_product(
+        [_countries(20 * scale), elements, ["Potash", "Nitrogen"], range(2010, 2021)],
+        names=["Area", "Element", "Item", "Year"],
+    )
+    return index.to_frame(index=False).assign(Value=rng.random(len(index)) * 1e5)
+
+
+def stunting_data(scale: int) -> pd.DataFrame:
+    """World Bank indicator-like long data"""
+
+    rng = np.random.default_rng(2)
+    index = pd.MultiIndex.from_product(
+        [_countries(20 * scale), range(1960, 2022)], names=["iso_code", "year"]
+    )
+    df = index.to_frame(index=False).assign(
+        country_name=lambda d: d.iso_code, value=rng.random(len(index)) * 50
+    )
+    return df.sample(frac=0.4, random_state=0).reset_index(drop=True)
+
+
+def write_undernourishment(scale: int, directory: str) -> None:
+    """Write a FAO undernourishment-like csv to a raw_data folder"""
+
+    original = pd.read_csv(f"{config.paths.raw_data}/FAO_undernourishment_data.csv")
+    copies = [original.assign(Area=original.Area + f"_{i}") for i in range(scale)]
+    pd.concat(copies).to_csv(f"{directory}/FAO_undernourishment_data.csv", index=False)
+
+
+CASES: dict = {
+    "get_latest_values": lambda scale: (
+        utils.get_latest_values,
+        (stunting_data(scale), "iso_code", "year"),
+    ),
+    "weo_indicator_latest": lambda scale: (
+        utils._weo_indicator_latest,
+        (weo_data(scale), "IND3", 2022, 2018),
+    ),
+    "reshape_fao_fertilizer": lambda scale: (
+        analysis._reshape_fao_fertilizer,
+        (fertilizer_data(scale),),
+    ),
+    "get_fao_undernourishment": lambda scale: (
+        analysis.get_fao_undernourishment,
+        (),
+    ),
+}
+
+
+def _time(func, args) -> tuple:
+    """best of REPEATS timings, and the result"""
+
+    timings = []
+    for _ in range(REPEATS):
+        sources.clear()
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings), result
+
+
+def run(scales: tuple = SCALES) -> pd.DataFrame:
+    """Timings for each case, backend and scale. Raises if results differ"""
+
+    rows = []
+    paths = config.paths
+    for scale in scales:
+        project_dir = tempfile.mkdtemp(prefix="food_security_bench_")
+        os.makedirs(f"{project_dir}/raw_data")
+        write_undernourishment(scale, f"{project_dir}/raw_data")
+        config.paths = config.Paths(project_dir)
+
+        try:
+            for case, build in CASES.items():
+                func, args = build(scale)
+                results = {}
+                for name in backend.BACKENDS:
+                    backend.set_backend(name)
+                    seconds, results[name] = _time(func, args)
+                    rows.append(
+                        {
+                            "case": case,
+                            "scale": scale,
+                            "rows": len(args[0]) if args else None,
+                            "backend": name,
+                            "seconds": seconds,
+                        }
+                    )
+
+                # dtypes included: the polars functions must return the pandas dtypes
+                pd.testing.assert_frame_equal(
+                    results["pandas"].reset_index(drop=True),
+                    results["polars"].reset_index(drop=True),
+                )
+        finally:
+            backend.set_backend("pandas")
+            config.paths = paths
+            shutil.rmtree(project_dir)
+
+    return (
+        pd.DataFrame(rows)
+        .pivot(index=["case", "scale", "rows"], columns="backend", values="seconds")
+        .assign(speedup=lambda d: d.pandas / d.polars)
+        .reset_index()
+    )
+
+
+if __name__ == "__main__":
+    try:
+        results = run()
+    except AssertionError as error:
+        sys.exit(f"Backends do not match:\n{error}")
+
+    print("All backends match\n")
+    print(results.to_string(index=False))
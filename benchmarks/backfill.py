@@ -0,0 +1,72 @@
+"""
+Checks for scripts.backfill on dated input folders.
+
+    python -m benchmarks.backfill
+
+Two dates with different IFPRI restrictions are built in a single worker process, as
+the second date reuses the process of the first. The check fails (non-zero exit) if
+the outputs of the two dates are equal.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+import pandas as pd
+
+from scripts import config
+from scripts.backfill import backfill
+
+DATES: tuple = ("2022-01-01", "2022-02-01")
+FILENAME: str = "ifpri_restriction.csv"
+
+
+def _dated_inputs(folder: str) -> None:
+    """dated copies of raw_data, the restrictions of the second date changed"""
+
+    for i, date in enumerate(DATES):
+        raw_data = os.path.join(folder, date, "raw_data")
+        shutil.copytree(config.paths.raw_data, raw_data)
+        path = os.path.join(raw_data, "restrictions_data.csv")
+        df = pd.read_csv(path)
+        df.iloc[0, 1:] = df.iloc[0, 1:] + i * 10
+        df.to_csv(path, index=False)
+
+
+def run() -> pd.DataFrame:
+    """Backfill statuses of each date. Raises AssertionError if a check fails"""
+
+    work = tempfile.mkdtemp(prefix="food_security_backfill_check_")
+    try:
+        _dated_inputs(os.path.join(work, "inputs"))
+        result = backfill(
+            list(DATES),
+            os.path.join(work, "inputs"),
+            os.path.join(work, "output"),
+            max_workers=1,
+        )
+
+        outputs = {}
+        for date in DATES:
+            path = os.path.join(work, "output", date, FILENAME)
+            if not os.path.exists(path):
+                raise AssertionError(f"{FILENAME} was not built for {date}")
+            with open(path, "rb") as file:
+                outputs[date] = file.read()
+        if outputs[DATES[0]] == outputs[DATES[1]]:
+            raise AssertionError(f"{DATES[1]} was built with the inputs of {DATES[0]}")
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    return result
+
+
+if __name__ == "__main__":
+    try:
+        results = run()
+    except AssertionError as error:
+        sys.exit(f"Backfill check failed: {error}")
+
+    print("All backfill checks passed\n")
+    print(results.drop(columns="origin").to_string(index=False))
@@ -0,0 +1,323 @@
+"""
+Allocation counts and peak memory of the loaders and charts, before and after the
+copy elimination: the previous implementations with defensive (deep) copies, against
+the current ones under pandas copy-on-write. Results must be equal, and the current
+functions must not modify their inputs.
+
+    python -m benchmarks.copies
+"""
+
+import sys
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from pandas.core.internals.blocks import Block
+
+from scripts import analysis, charts, sources, utils
+from scripts.data import data
+from scripts.output import writer
+
+SCALE: int = 20
+# country conversion takes milliseconds per row, so these inputs are kept small
+ITEMS: int = 4
+YEARS: int = 4
+
+
+# ==================================================================
+# Previous implementations
+# ==================================================================
+
+
+def old_ipc_charts(df: pd.DataFrame) -> dict:
+    captured = {}
+    for phase in ["phase_2", "phase_3", "phase_4", "phase_5", "phase_3plus"]:
+        df_phase = df.copy(deep=True)
+        captured[f"ipc_{phase}.csv"] = (
+            df_phase.sort_values(by=phase, ascending=False)
+            .reset_index(drop=True)
+            .loc[0:15, ["country", phase, "period_start", "period_end", "source"]]
+            .dropna(subset=phase)
+        )
+
+    return captured
+
+
+def old_fao_fertilizer(df: pd.DataFrame) -> pd.DataFrame:
+    df = (
+        df.loc[
+            df["Year"].isin([2019, 2018, 2017]),
+            ["Area", "Element", "Item", "Year", "Value"],
+        ]
+        .groupby(["Area", "Element", "Item"])
+        .agg("mean")["Value"]
+        .reset_index()
+        .pivot(index=["Area", "Item"], columns="Element", values="Value")
+        .reset_index()
+        .rename(
+            columns={
+                "Area": "country",
+                "Item": "fertiliser",
+                "Agricultural Use": "ag_use",
+                "Export Quantity": "export_quantity",
+                "Import Quantity": "import_quantity",
+                "Production": "production",
+            }
+        )
+        .replace({"China, Taiwan Province of": "Taiwan", "China, mainland": "China"})
+    )
+
+    cc = utils.get_country_converter()
+    df["iso_code"] = cc.convert(df.country)
+    df["continent"] = cc.convert(df.iso_code, to="continent")
+    df.country = cc.convert(df.country, to="name_short")
+
+    df["net_import_quantity"] = df.import_quantity - df.export_quantity
+    df["net_import_quantity_adj"] = df.net_import_quantity
+    df.loc[df.net_import_quantity_adj < 0, "net_import_quantity_adj"] = 0
+    df["dependence"] = (df.net_import_quantity_adj / df.ag_use) * 100
+    df.replace([np.inf, np.nan], 0, inplace=True)
+    df.loc[df.dependence > 100, "dependence"] = 100
+
+    return df
+
+
+def old_get_indices(sheet: pd.DataFrame, indices: list) -> pd.DataFrame:
+    df = sheet.copy()  # copy returned by the source cache
+
+    df = df.iloc[9:].reset_index(drop=True).replace("..", np.nan)
+    df.columns = ["period"] + INDICES
+    indices.insert(0, "period")
+    df = df.loc[:, indices]
+    df["period"] = pd.to_datetime(df.period, format="%YM%m")
+
+    return df
+
+
+def old_filter_countries(df: pd.DataFrame, by: str, values: list) -> pd.DataFrame:
+    cc = utils.get_country_converter()
+    df[by] = cc.convert(df["iso_code"], to=by)
+    return df[df[by].isin(values)].drop(columns=by).reset_index(drop=True)
+
+
+# ==================================================================
+# Inputs
+# ==================================================================
+
+
+INDICES: list = [
+    "Energy",
+    "Non-energy",
+    "Agriculture",
+    "Beverages",
+    "Food",
+    "Oils & Meals",
+    "Grains",
+    "Other Food",
+    "Raw Materials",
+    "Timber",
+    "Other Raw Mat.",
+    "Fertilizers",
+    "Metals & Minerals",
+    "Base Metals (ex. iron ore)",
+    "Precious Metals",
+]
+
+
+def _countries() -> pd.DataFrame:
+    return utils.get_country_converter().data.loc[:, ["name_short", "ISO3"]]
+
+
+def fertilizer_data(items: int) -> pd.DataFrame:
+    """Raw FAO fertilizer data for every country"""
+
+    rng = np.random.default_rng(0)
+    elements = ["Agricultural Use", "Export Quantity", "Import Quantity", "Production"]
+    index = pd.MultiIndex.from_product(
+        [
+            _countries().name_short,
+            elements,
+            [f"Item {i}" for i in range(items)],
+            range(2010, 2021),
+        ],
+        names=["Area", "Element", "Item", "Year"],
+    )
+    return index.to_frame(index=False).assign(Value=rng.random(len(index)) * 1e5)
+
+
+def indices_sheet(scale: int) -> pd.DataFrame:
+    """Monthly Indices sheet, as read from the CMO workbook, with each month scale times"""
+
+    rng = np.random.default_rng(1)
+    months = pd.date_range("1960-01-01", periods=760, freq="MS").repeat(scale)
+    values = pd.DataFrame(rng.random((len(months), len(INDICES))) * 100).astype(object)
+    values = values.mask(rng.random(values.shape) < 0.05, "..")
+    header = pd.DataFrame([[None] * (len(INDICES) + 1)] * 9)
+    body = pd.concat([pd.Series(months.strftime("%YM%m")), values], axis=1)
+    body.columns = header.columns
+
+    return pd.concat([header, body], ignore_index=True)
+
+
+def countries_data(years: int) -> pd.DataFrame:
+    """country-year data for every country"""
+
+    iso_codes = _countries().ISO3
+    index = pd.MultiIndex.from_product(
+        [iso_codes, range(2022 - years, 2022)], names=["iso_code", "year"]
+    )
+    return index.to_frame(index=False).assign(value=np.arange(len(index)) / 7)
+
+
+# ==================================================================
+# Cases: (old, new, input)
+# ==================================================================
+
+
+def _ipc_charts_new(df: pd.DataFrame) -> dict:
+    with writer.capture() as captured:
+        charts.ipc_charts()
+
+    return {filename: frame for filename, (frame, _) in captured.items()}
+
+
+def _get_indices_new(sheet: pd.DataFrame, indices: list) -> pd.DataFrame:
+    read = sources.cached("wb_commodities", snapshot=False)(lambda name: sheet)
+    previous, analysis._read_commodity_sheet = analysis._read_commodity_sheet, read
+    try:
+        read("Monthly Indices")  # loaded once, as by an earlier chart
+        return analysis.get_indices(indices)
+    finally:
+        analysis._read_commodity_sheet = previous
+        sources.refresh(["wb_commodities"])
+
+
+def cases(scale: int) -> dict:
+    sheet = indices_sheet(scale)
+    # the current loader reads '..' as NaN (na_values), the previous one replaced it
+    read_sheet = sheet.mask(sheet.eq(".."))
+
+    return {
+        "ipc_charts": (
+            lambda df: old_ipc_charts(df.copy()),
+            _ipc_charts_new,
+            (data.ipc_manual(),),
+        ),
+        "fao_fertilizer": (
+            old_fao_fertilizer,
+            lambda df: analysis.clean_fao_fertilizer(df).pipe(analysis._calculations),
+            (fertilizer_data(ITEMS),),
+        ),
+        "get_indices": (
+            old_get_indices,
+            lambda _, indices: _get_indices_new(read_sheet, indices),
+            (sheet, ["Food", "Grains", "Fertilizers"]),
+        ),
+        "filter_countries": (
+            old_filter_countries,
+            utils.filter_countries,
+            (countries_data(YEARS), "continent", ["Africa"]),
+        ),
+    }
+
+
+# ==================================================================
+# Measurements
+# ==================================================================
+
+
+@contextmanager
+def copy_on_write(enabled: bool):
+    previous = pd.get_option("mode.copy_on_write")
+    pd.set_option("mode.copy_on_write", enabled)
+    try:
+        yield
+    finally:
+        pd.set_option("mode.copy_on_write", previous)
+
+
+def _fingerprint(args: tuple) -> list:
+    return [
+        (list(arg.columns), pd.util.hash_pandas_object(arg, index=True).sum())
+        if isinstance(arg, pd.DataFrame)
+        else repr(arg)
+        for arg in args
+    ]
+
+
+def _measure(func, args: tuple) -> tuple:
+    """
+    call func and count the deep block copies and the peak memory it allocates.
+    Returns the measurements and the result
+    """
+
+    copies = 0
+    block_copy = Block.copy
+
+    def counted(self, deep: bool = True):
+        nonlocal copies
+        copies += bool(deep)
+        return block_copy(self, deep=deep)
+
+    before = _fingerprint(args)
+    Block.copy = counted
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        Block.copy = block_copy
+
+    measurements = {
+        "block_copies": copies,
+        "peak_mb": peak / 1024**2,
+        "mutates": _fingerprint(args) != before,
+    }
+    return measurements, result
+
+
+def _assert_equal(result, expected) -> None:
+    if isinstance(expected, dict):
+        assert result.keys() == expected.keys()
+        for key in expected:
+            pd.testing.assert_frame_equal(result[key], expected[key])
+    else:
+        pd.testing.assert_frame_equal(result, expected, check_names=False)
+
+
+def _copy(arg):
+    return arg.copy() if isinstance(arg, (pd.DataFrame, list)) else arg
+
+
+def run(scale: int = SCALE) -> pd.DataFrame:
+    """Copies and peak memory for each case. Raises if results differ"""
+
+    rows = []
+    for case, (old, new, args) in cases(scale).items():
+        with copy_on_write(False):
+            old_measurements, expected = _measure(old, [_copy(a) for a in args])
+        with copy_on_write(True):
+            new_measurements, result = _measure(new, args)
+
+        _assert_equal(result, expected)
+        assert not new_measurements["mutates"], f"{case} modifies its input"
+
+        rows.append(
+            {"case": case}
+            | {f"old_{k}": v for k, v in old_measurements.items()}
+            | {f"new_{k}": v for k, v in new_measurements.items()}
+        )
+
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    try:
+        results = run()
+    except AssertionError as error:
+        sys.exit(f"Results do not match:\n{error}")
+
+    print("All results match, and no function modifies its input\n")
+    print(results.to_string(index=False))
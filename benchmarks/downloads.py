@@ -0,0 +1,159 @@
+"""
+Checks and timings for segmented, resumable downloads (HttpClient.download_file)
+against the local stand-in server, on a synthetic file.
+
+    python -m benchmarks.downloads
+    python -m benchmarks.downloads --size 64 --bandwidth 20e6
+
+Each connection is throttled to the same bandwidth, as with a remote host that limits
+the speed of single transfers. The checks fail (non-zero exit) if a downloaded file
+differs from the original, if an interrupted download does not resume from its .part
+file, if short range responses leave gaps in the file, or if a checksum mismatch is not
+detected.
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+
+from benchmarks.stand_in_server import StandInConfig, recording_path, start
+from scripts.http_client import HttpClient
+
+URL: str = "https://example.org/large.bin"
+SIZE_MB: int = 32
+BANDWIDTH: float = 50e6  # bytes per second, per connection
+SEGMENTS: tuple = (1, 2, 4, 8)
+
+
+def _served(config: StandInConfig) -> int:
+    with config._lock:
+        size = sum(entry[2] for entry in config.log)
+        config.log.clear()
+    return size
+
+
+def _check(path: str, digest: str) -> None:
+    with open(path, "rb") as file:
+        if hashlib.sha256(file.read()).hexdigest() != digest:
+            raise AssertionError(f"{path} does not match the original file")
+    if os.path.exists(f"{path}.part") or os.path.exists(f"{path}.part.json"):
+        raise AssertionError(f"{path}.part was not removed")
+
+
+def run(size_mb: int = SIZE_MB, bandwidth: float = BANDWIDTH) -> pd.DataFrame:
+    """Timings and bytes served for each case. Raises AssertionError if a check fails"""
+
+    work = tempfile.mkdtemp(prefix="food_security_downloads_")
+    config = StandInConfig(directory=os.path.join(work, "recordings"))
+    server = start(config)
+    mirror = f"http://127.0.0.1:{server.server_address[1]}"
+
+    body = np.random.default_rng(0).bytes(size_mb * 1024**2)
+    digest = hashlib.sha256(body).hexdigest()
+    recording = recording_path(f"/{URL.split('://')[1]}", config.directory)
+    os.makedirs(os.path.dirname(recording))
+    with open(recording, "wb") as file:
+        file.write(body)
+
+    path = os.path.join(work, "large.bin")
+    rows = []
+    try:
+        # speed: one connection against parallel segments
+        config.bandwidth = bandwidth
+        for segments in SEGMENTS:
+            client = HttpClient(mirror=mirror)
+            start_time = time.perf_counter()
+            client.download_file(URL, path, segments, digest, min_segment_size=1)
+            seconds = time.perf_counter() - start_time
+            _check(path, digest)
+            rows.append(
+                {
+                    "case": f"{segments} segment(s)",
+                    "seconds": seconds,
+                    "served": _served(config),
+                }
+            )
+        config.bandwidth = None
+
+        # interrupted: every segment is cut, and the client gives up
+        os.remove(path)
+        config.drop_after, config.drops = len(body) // 8, 4
+        client = HttpClient(mirror=mirror, max_retries=0)
+        try:
+            client.download_file(URL, path, 4, digest, min_segment_size=1)
+        except requests.RequestException:
+            pass
+        else:
+            raise AssertionError("the interrupted download did not fail")
+        if not os.path.exists(f"{path}.part") or os.path.exists(path):
+            raise AssertionError("the interrupted download did not keep its .part file")
+        rows.append({"case": "interrupted", "seconds": None, "served": _served(config)})
+
+        # resumed: only the missing bytes are requested again
+        client.download_file(URL, path, 4, digest, min_segment_size=1)
+        _check(path, digest)
+        served = _served(config)
+        if served != len(body) - 4 * (len(body) // 8):
+            raise AssertionError(f"the resumed download fetched {served} bytes")
+        rows.append({"case": "resumed", "seconds": None, "served": served})
+
+        # retried: connections cut during a single call are resumed in place
+        os.remove(path)
+        config.drop_after, config.drops = len(body) // 8, 4
+        HttpClient(mirror=mirror, backoff=0.01).download_file(
+            URL, path, 4, digest, min_segment_size=1
+        )
+        _check(path, digest)
+        rows.append({"case": "retried", "seconds": None, "served": _served(config)})
+
+        # short ranges: the server sends less than each segment asked for, and the
+        # rest is requested again. No checksum, as for the pipeline's own downloads
+        os.remove(path)
+        config.max_range = len(body) // 64
+        HttpClient(mirror=mirror).download_file(URL, path, 4, min_segment_size=1)
+        config.max_range = None
+        _check(path, digest)
+        rows.append(
+            {"case": "short ranges", "seconds": None, "served": _served(config)}
+        )
+
+        # a wrong checksum is detected, and the partial file dropped
+        os.remove(path)
+        try:
+            client.download_file(URL, path, 4, "0" * 64, min_segment_size=1)
+            raise AssertionError("the checksum mismatch was not detected")
+        except ValueError:
+            pass
+        if os.path.exists(path) or os.path.exists(f"{path}.part"):
+            raise AssertionError("a file failing its checksum was kept")
+        rows.append(
+            {"case": "bad checksum", "seconds": None, "served": _served(config)}
+        )
+    finally:
+        server.shutdown()
+        shutil.rmtree(work, ignore_errors=True)
+
+    return pd.DataFrame(rows).assign(served_mb=lambda d: d.served / 1024**2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Segmented download checks")
+    parser.add_argument("--size", type=int, default=SIZE_MB, help="file size in MB")
+    parser.add_argument("--bandwidth", type=float, default=BANDWIDTH)
+    args = parser.parse_args()
+
+    try:
+        results = run(args.size, args.bandwidth)
+    except AssertionError as error:
+        sys.exit(f"Download check failed: {error}")
+
+    print("All download checks passed\n")
+    print(results.drop(columns="served").to_string(index=False))
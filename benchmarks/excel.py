@@ -0,0 +1,192 @@
+"""
+Parity checks and timings for the Excel ingestion layer (see scripts.excel) against
+the pd.read_excel calls it replaces, on synthetic workbooks shaped like the CMO,
+USDA food expenditure and OGHIST workbooks.
+
+    python -m benchmarks.excel
+"""
+
+import sys
+import time
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from scripts import analysis, excel
+
+REPEATS: int = 3
+
+
+# ==================================================================
+# Workbooks
+# ==================================================================
+
+
+def _workbook(sheets: dict) -> bytes:
+    """xlsx file with a sheet per list of rows"""
+
+    workbook = Workbook(write_only=True)
+    for name, rows in sheets.items():
+        sheet = workbook.create_sheet(name)
+        for row in rows:
+            sheet.append(row)
+
+    file = BytesIO()
+    workbook.save(file)
+    return file.getvalue()
+
+
+def _monthly(columns: int, rng) -> list:
+    """CMO-like monthly sheet: title rows, names, units, then one row per month"""
+
+    months = pd.date_range("1960-01-01", "2022-12-01", freq="MS").strftime("%YM%m")
+    values = np.round(rng.random((len(months), columns)) * 500, 2).tolist()
+    rows = [["World Bank Commodity Price Data (The Pink Sheet)"]] + [[]] * 3
+    rows += [[None] + [f"Commodity {i}" for i in range(columns)]]
+    rows += [[None] + ["($/mt)"] * columns, [None] + [f"C{i}" for i in range(columns)]]
+    return rows + [
+        [month] + [".." if v < 50 else v for v in row]
+        for month, row in zip(months, values)
+    ]
+
+
+def cmo_workbook() -> bytes:
+    rng = np.random.default_rng(0)
+    return _workbook(
+        {
+            "AFOSHEET": [["Notes"]] * 20,
+            "Monthly Prices": _monthly(71, rng),
+            "Monthly Indices": _monthly(15, rng),
+            "Annual Prices (Real)": _monthly(71, rng)[:70],
+            "Annual Prices (Nominal)": _monthly(71, rng)[:70],
+            "Description": [["Description"]] * 100,
+        }
+    )
+
+
+def usda_workbook() -> bytes:
+    rng = np.random.default_rng(1)
+    header = ["", "Consumer expenditures3", "Expenditure on food2"]
+    header += [f"Other {i}" for i in range(8)]
+
+    def sheet():
+        rows = [["Share of consumer expenditures spent on food"], []]
+        rows += [header]
+        return rows + [
+            [f"Country {i}"] + (rng.random(10) * 1e4).round(1).tolist()
+            for i in range(180)
+        ]
+
+    return _workbook({str(year): sheet() for year in range(2015, 2021)})
+
+
+def oghist_workbook() -> bytes:
+    rng = np.random.default_rng(2)
+    years = [f"FY{y % 100:02d}" for y in range(1989, 2025)]
+    groups = ["L", "LM", "UM", "H", ".."]
+    rows = [["World Bank Analytical Classifications"]] + [[]] * 3
+    rows += [["Data for calendar year :"] + list(range(1987, 2023))]
+    rows += [[None] + years]
+    rows += [
+        [f"{c}{d}{e}"] + rng.choice(groups, len(years)).tolist()
+        for c, d, e in zip("ABCDEFGHIJ" * 23, "KLMNOPQRST" * 23, "UVWXYZABCD" * 23)
+    ]
+    return _workbook({"Country Analytical History": rows, "Notes": [["Notes"]] * 40})
+
+
+# ==================================================================
+# Cases: (old, new, workbook)
+# ==================================================================
+
+
+def _old_usda(workbook: bytes) -> dict:
+    return {
+        year: pd.read_excel(BytesIO(workbook), sheet_name=year, skiprows=2).loc[
+            :, list(analysis.USDA_COLUMNS)
+        ]
+        for year in ["2020", "2019", "2018"]
+    }
+
+
+def _new_usda(workbook: bytes) -> dict:
+    return excel.read_sheets(
+        workbook, ["2020", "2019", "2018"], skiprows=2, usecols=analysis._usda_column
+    )
+
+
+CASES: dict = {
+    "cmo": (
+        lambda w: {
+            s: pd.read_excel(BytesIO(w), sheet_name=s)
+            for s in ["Monthly Prices", "Monthly Indices"]
+        },
+        lambda w: excel.read_sheets(w, ["Monthly Prices", "Monthly Indices"]),
+        cmo_workbook,
+    ),
+    "usda": (_old_usda, _new_usda, usda_workbook),
+    "oghist": (
+        lambda w: {
+            "history": pd.read_excel(
+                BytesIO(w), sheet_name="Country Analytical History", header=None
+            )
+        },
+        lambda w: {
+            "history": excel.read_sheet(w, "Country Analytical History", header=None)
+        },
+        oghist_workbook,
+    ),
+}
+
+
+def _time(func, workbook: bytes, cold: bool = True) -> tuple:
+    """best of REPEATS timings, and the result"""
+
+    timings = []
+    for _ in range(REPEATS):
+        if cold:
+            excel.clear()
+        start = time.perf_counter()
+        result = func(workbook)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings), result
+
+
+def run() -> pd.DataFrame:
+    """Timings for each case and engine. Raises if results differ"""
+
+    rows = []
+    engine = excel.get_engine()
+    try:
+        for case, (old, new, make_workbook) in CASES.items():
+            workbook = make_workbook()
+            old_seconds, expected = _time(old, workbook)
+            row = {"case": case, "bytes": len(workbook), "read_excel": old_seconds}
+
+            for name in excel.ENGINES:
+                try:
+                    excel.set_engine(name)
+                except ImportError:
+                    continue
+                row[name], result = _time(new, workbook)
+                for sheet, df in expected.items():
+                    pd.testing.assert_frame_equal(result[sheet], df)
+
+            row["cached"], _ = _time(new, workbook, cold=False)
+            rows.append(row)
+    finally:
+        excel.set_engine(engine)
+
+    return pd.DataFrame(rows).assign(speedup=lambda d: d.read_excel / d[engine])
+
+
+if __name__ == "__main__":
+    try:
+        results = run()
+    except AssertionError as error:
+        sys.exit(f"Sheets do not match:\n{error}")
+
+    print(f"All sheets match (default engine: {excel.get_engine()})\n")
+    print(results.to_string(index=False))
@@ -0,0 +1,94 @@
+"""
+Import time benchmark for the scripts package.
+
+Each module is imported in a fresh interpreter with `python -X importtime`.
+Results are appended to benchmarks/import_time.csv so the metric can be tracked over time.
+
+    python -m benchmarks.import_time
+"""
+
+import datetime
+import os
+import subprocess
+import sys
+from csv import writer
+
+import pandas as pd
+
+MODULES: list = [
+    "scripts.utils",
+    "scripts.ipc_data",
+    "scripts.analysis",
+    "scripts.charts",
+]
+HEAVY_MODULES: list = ["weo", "country_converter", "bs4", "requests"]
+RUNS: int = 5
+BUDGET_SECONDS: float = 1.0
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(PROJECT_DIR, "benchmarks", "import_time.csv")
+
+
+def _parse_importtime(stderr: str) -> dict:
+    """Parse `-X importtime` output into {module: cumulative seconds}"""
+
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative) / 1e6
+
+    return times
+
+
+def measure(module: str) -> dict:
+    """Import a module in a fresh interpreter and return its import times"""
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = _parse_importtime(result.stderr)
+
+    return {
+        "module": module,
+        "seconds": times[module],
+        "heavy_imported": ",".join(m for m in HEAVY_MODULES if m in times),
+    }
+
+
+def run(runs: int = RUNS) -> pd.DataFrame:
+    """Median import time per module over several runs"""
+
+    df = pd.DataFrame([measure(m) for m in MODULES for _ in range(runs)])
+
+    return df.groupby("module", sort=False, as_index=False).agg(
+        seconds=("seconds", "median"), heavy_imported=("heavy_imported", "first")
+    )
+
+
+def record(df: pd.DataFrame) -> None:
+    """Append results to the tracked csv"""
+
+    new_file = not os.path.exists(RESULTS)
+    today = datetime.datetime.today().isoformat(timespec="seconds")
+
+    with open(RESULTS, "a+", newline="") as file:
+        csv_writer = writer(file)
+        if new_file:
+            csv_writer.writerow(["date", "module", "seconds", "heavy_imported"])
+        for row in df.itertuples(index=False):
+            csv_writer.writerow([today, row.module, row.seconds, row.heavy_imported])
+
+
+if __name__ == "__main__":
+    results = run()
+    record(results)
+    print(results.to_string(index=False))
+
+    if (results.seconds > BUDGET_SECONDS).any():
+        sys.exit(f"Import time above {BUDGET_SECONDS}s budget")
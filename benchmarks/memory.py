@@ -0,0 +1,206 @@
+"""
+Memory budgets for the loaders and chart functions, on scaled synthetic inputs.
+
+Each stage runs in its own process. Its peak memory is measured twice: the peak of the
+Python allocations (tracemalloc) and the growth of the resident set size (RSS, Linux
+only). The run fails (non-zero exit) when a stage's tracemalloc peak goes above its
+budget in BUDGETS, and prints the stages ranked by peak memory.
+
+    python -m benchmarks.memory
+    python -m benchmarks.memory --scale 20 (budgets only apply at the default scale)
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import pandas as pd
+
+from benchmarks import backends, copies
+from benchmarks.parsers import thousands
+from scripts import analysis, charts, config, parsers, regions, sources, utils
+from scripts.data import data
+from scripts.output import writer
+
+SCALE: int = 10
+
+# peak Python allocations allowed for each stage at SCALE, in MB (about 1.5x the
+# measured peaks, so that regressions fail but noise does not)
+BUDGETS: dict = {
+    "clean_weo": 100,
+    "weo_indicator_latest": 100,
+    "parse_numbers": 90,
+    "get_fao_undernourishment": 32,
+    "undernourishment_world": 32,
+    "add_flourish_geometries": 24,
+    "potash_dependence_chart": 24,
+    "regions.aggregate": 10,
+    "get_fao_fertilizer": 4,
+    "get_ipc": 2,
+    "get_latest_values": 2,
+    "ipc_charts": 2,
+    "ifpri_restriction_chart": 2,
+}
+
+
+# ==================================================================
+# Stages: functions returning (function, arguments) for a scale
+# ==================================================================
+
+
+def _chart(chart) -> tuple:
+    def run():
+        with writer.capture() as captured:
+            chart()
+        return captured
+
+    return run, ()
+
+
+STAGES: dict = {
+    "clean_weo": lambda scale: (utils._clean_weo, (backends.weo_data(scale),)),
+    "weo_indicator_latest": lambda scale: (
+        utils._weo_indicator_latest,
+        (backends.weo_data(scale), "IND3", 2022, 2018),
+    ),
+    "add_flourish_geometries": lambda scale: (
+        utils.add_flourish_geometries,
+        (copies.countries_data(5 * scale),),
+    ),
+    "get_latest_values": lambda scale: (
+        utils.get_latest_values,
+        (backends.stunting_data(scale), "iso_code", "year"),
+    ),
+    "regions.aggregate": lambda scale: (
+        regions.aggregate,
+        (copies.countries_data(5 * scale), ["value"]),
+    ),
+    "parse_numbers": lambda scale: (
+        parsers.parse_numbers,
+        (thousands(50_000 * scale),),
+    ),
+    "get_ipc": lambda scale: (analysis.get_ipc, ()),
+    "get_fao_undernourishment": lambda scale: (analysis.get_fao_undernourishment, ()),
+    "get_fao_fertilizer": lambda scale: (analysis.get_fao_fertilizer, (None,)),
+    "ipc_charts": lambda scale: _chart(charts.ipc_charts),
+    "undernourishment_world": lambda scale: _chart(charts.undernourishment_world),
+    "potash_dependence_chart": lambda scale: _chart(charts.potash_dependence_chart),
+    "ifpri_restriction_chart": lambda scale: _chart(charts.ifpri_restriction_chart),
+}
+
+
+def write_project(scale: int, project_dir: str) -> None:
+    """project folder with the manually downloaded raw files, scaled"""
+
+    shutil.copytree(config.paths.glossaries, f"{project_dir}/glossaries")
+    os.makedirs(f"{project_dir}/raw_data")
+    os.makedirs(f"{project_dir}/output")
+
+    for file in ["IPC_data.csv", "restrictions_data.csv"]:
+        shutil.copy(f"{config.paths.raw_data}/{file}", f"{project_dir}/raw_data")
+
+    backends.write_undernourishment(scale, f"{project_dir}/raw_data")
+
+    # every country, a few items: country conversion takes milliseconds per row
+    fertilizer = copies.fertilizer_data(2).replace(
+        {"Item 0": "Nutrient potash K2O (total)"}
+    )
+    fertilizer.to_csv(f"{project_dir}/raw_data/FAO_fertilizer.csv", index=False)
+
+
+# ==================================================================
+# Measurements
+# ==================================================================
+
+
+def _status(field: str) -> float:
+    """a memory field of /proc/self/status, in MB. NaN if not available"""
+
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    return float("nan")
+
+
+def _reset_rss_peak() -> None:
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        pass
+
+
+def _reset_caches() -> None:
+    sources.clear()
+    data.invalidate()
+
+
+def measure(stage: str, scale: int, project_dir: str) -> dict:
+    """peak memory of a stage, in MB. Runs in a worker process"""
+
+    config.paths = config.Paths(project_dir)
+    func, args = STAGES[stage](scale)
+
+    # a first call imports modules and loads shared lookups (e.g. country_converter)
+    func(*args)
+
+    _reset_caches()
+    _reset_rss_peak()
+    rss = _status("VmRSS")
+    func(*args)
+    rss_peak = _status("VmHWM") - rss
+
+    _reset_caches()
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {"stage": stage, "peak_mb": peak / 1024**2, "rss_mb": rss_peak}
+
+
+def run(scale: int = SCALE, stages: list = None) -> pd.DataFrame:
+    """Peak memory of each stage, ranked, with its budget"""
+
+    project_dir = tempfile.mkdtemp(prefix="food_security_memory_")
+    try:
+        write_project(scale, project_dir)
+        rows = []
+        for stage in stages or STAGES:
+            # a new process per stage, so stages do not share their peaks
+            with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                rows.append(pool.submit(measure, stage, scale, project_dir).result())
+    finally:
+        shutil.rmtree(project_dir, ignore_errors=True)
+
+    df = pd.DataFrame(rows)
+    df["budget_mb"] = df.stage.map(BUDGETS) if scale == SCALE else float("nan")
+    df["over_budget"] = df.peak_mb > df.budget_mb
+
+    return df.sort_values("peak_mb", ascending=False, ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Peak memory of each stage")
+    parser.add_argument("--scale", type=int, default=SCALE)
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES))
+    args = parser.parse_args()
+
+    results = run(args.scale, args.stages)
+    print(results.to_string(index=False, float_format="{:.1f}".format))
+
+    over = results.loc[results.over_budget, "stage"].tolist()
+    if over:
+        sys.exit(f"\nStages over their memory budget: {', '.join(over)}")
@@ -0,0 +1,166 @@
+"""
+Parity checks and timings for the vectorized parsers (see scripts.parsers) against
+the row-by-row parsing they replace, on million-row inputs.
+
+    python -m benchmarks.parsers
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from scripts import parsers
+
+ROWS: int = 1_000_000
+REPEATS: int = 3
+
+
+# ==================================================================
+# Previous implementations
+# ==================================================================
+
+
+def old_clean_numeric(column: pd.Series) -> pd.Series:
+    return pd.to_numeric(column.str.replace("<", "").str.replace(",", ""))
+
+
+def old_clean_weo(column: pd.Series) -> pd.Series:
+    column = column.map(lambda x: str(x).replace(",", "").replace("-", ""))
+    return pd.to_numeric(column, errors="coerce")
+
+
+def old_parse_dates(column: pd.Series, format: str) -> pd.Series:
+    return pd.to_datetime(column, format=format)
+
+
+# ==================================================================
+# Inputs
+# ==================================================================
+
+
+def thousands(rows: int) -> pd.Series:
+    """IPC-like population counts with thousands separators and gaps"""
+
+    rng = np.random.default_rng(0)
+    values = pd.Series([f"{v:,}" for v in rng.integers(0, 50_000_000, rows)])
+    return values.mask(rng.random(rows) < 0.1)
+
+
+def fao(rows: int) -> pd.Series:
+    """FAO-like values: repeated small numbers, '<2.5' qualifiers and gaps"""
+
+    rng = np.random.default_rng(1)
+    values = pd.Series(rng.integers(25, 600, rows) / 10).map("{:.1f}".format)
+    values = values.mask(rng.random(rows) < 0.2, "<2.5")
+    return values.mask(rng.random(rows) < 0.1)
+
+
+def weo(rows: int) -> pd.Series:
+    """WEO-like values: thousands separators, negative numbers and '--' or 'n/a'"""
+
+    rng = np.random.default_rng(2)
+    values = pd.Series([f"{v:,.3f}" for v in (rng.random(rows) - 0.3) * 1e5])
+    values = values.mask(rng.random(rows) < 0.1, "--")
+    return values.mask(rng.random(rows) < 0.05, "n/a")
+
+
+def periods(rows: int, format: str) -> pd.Series:
+    """Repeated monthly periods, like the commodity and IPC dates"""
+
+    months = pd.date_range("1960-01-01", "2022-12-01", freq="MS").strftime(format)
+    return pd.Series(np.random.default_rng(3).choice(months, rows))
+
+
+# ==================================================================
+# Cases: (old, new, input)
+# ==================================================================
+
+
+def cases(rows: int) -> dict:
+    return {
+        "thousands": (
+            old_clean_numeric,
+            parsers.parse_numbers,
+            thousands(rows),
+        ),
+        "fao": (old_clean_numeric, parsers.parse_numbers, fao(rows)),
+        "weo": (
+            # the old parser dropped the sign of negative numbers
+            old_clean_weo,
+            lambda s: parsers.parse_numbers(s, errors="coerce").abs(),
+            weo(rows),
+        ),
+        "dates %YM%m": (
+            lambda s: old_parse_dates(s, "%YM%m"),
+            lambda s: parsers.parse_dates(s, "%YM%m"),
+            periods(rows, "%YM%m"),
+        ),
+        "dates %b %Y": (
+            lambda s: old_parse_dates(s, "%b %Y"),
+            lambda s: parsers.parse_dates(s, "%b %Y"),
+            periods(rows, "%b %Y"),
+        ),
+    }
+
+
+def _time(func, values: pd.Series) -> tuple:
+    """best of REPEATS timings, and the result"""
+
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        result = func(values)
+        timings.append(time.perf_counter() - start)
+
+    return min(timings), result
+
+
+def check_details() -> None:
+    """qualifiers, flags and negative numbers are kept"""
+
+    values = pd.Series(["<2.5", "1,234.5 F", "-12", "..", None, ">= 3e2"])
+    result = parsers.parse_numbers(values, details=True)
+
+    expected = pd.DataFrame(
+        {
+            "value": [2.5, 1234.5, -12, np.nan, np.nan, 300],
+            "qualifier": ["<", None, None, None, None, ">="],
+            "flag": [None, "F", None, None, None, None],
+        }
+    )
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def run(rows: int = ROWS) -> pd.DataFrame:
+    """Timings for each case. Raises if results differ"""
+
+    check_details()
+
+    results = []
+    for case, (old, new, values) in cases(rows).items():
+        old_seconds, expected = _time(old, values)
+        new_seconds, result = _time(new, values)
+        pd.testing.assert_series_equal(result, expected, check_names=False)
+        results.append(
+            {
+                "case": case,
+                "rows": rows,
+                "unique": values.nunique(),
+                "old": old_seconds,
+                "new": new_seconds,
+            }
+        )
+
+    return pd.DataFrame(results).assign(speedup=lambda d: d.old / d.new)
+
+
+if __name__ == "__main__":
+    try:
+        results = run()
+    except AssertionError as error:
+        sys.exit(f"Parsers do not match:\n{error}")
+
+    print("All parsers match\n")
+    print(results.to_string(index=False))
@@ -0,0 +1,196 @@
+"""
+End-to-end benchmark of update_charts against the local stand-in server.
+
+Every remote source (FAO, World Bank CMO/WDI API, USDA, IMF WEO, IPC) is replayed
+from benchmarks/recordings with configurable latency and bandwidth. The run goes through
+update_charts (source budgets, staging, panel and run report). Outputs are written to
+a temporary copy of the project, so output/ and raw_data/ are not touched.
+
+Record the sources once (needs network access), then benchmark offline:
+
+    python -m benchmarks.pipeline --record
+    python -m benchmarks.pipeline --latency 0.1 --bandwidth 2e6
+    python -m benchmarks.pipeline --save-baseline
+
+Without network access, --synthetic replays generated responses instead (see
+benchmarks.synthetic_sources). Its baseline, benchmarks/pipeline_baseline_synthetic.json,
+is committed. The benchmark fails (non-zero exit) if any chart fails.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks import synthetic_sources
+from benchmarks.stand_in_server import RECORDINGS, StandInConfig, start
+from scripts import config, sources
+from scripts.http_client import client
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES: dict = {
+    mode: os.path.join(PROJECT_DIR, "benchmarks", f"pipeline_baseline{suffix}.json")
+    for mode, suffix in [("recorded", ""), ("synthetic", "_synthetic")]
+}
+
+
+def _project_copy(synthetic: bool = False) -> str:
+    """Temporary project folder with copies of the raw data and glossaries"""
+
+    directory = tempfile.mkdtemp(prefix="food_security_bench_")
+    for folder in ("raw_data", "glossaries"):
+        shutil.copytree(os.path.join(PROJECT_DIR, folder), f"{directory}/{folder}")
+    os.makedirs(f"{directory}/output")
+    if synthetic:
+        synthetic_sources.write_raw_data(directory)
+
+    return directory
+
+
+def run(
+    latency: float = 0.0,
+    bandwidth: float = None,
+    record: bool = False,
+    synthetic: bool = False,
+) -> dict:
+    """
+    Run update_charts against the stand-in server.
+    Returns total wall time, per chart times and the time spent on each source
+        synthetic: replay generated responses instead of the recordings
+    """
+
+    from scripts.charts import update_charts
+
+    work = tempfile.mkdtemp(prefix="food_security_recordings_")
+    directory = RECORDINGS
+    if synthetic:
+        directory = work
+        synthetic_sources.write_recordings(directory)
+
+    server_config = StandInConfig(
+        directory=directory, latency=latency, bandwidth=bandwidth, record=record
+    )
+    server = start(server_config)
+    mirror, client.mirror = (
+        client.mirror,
+        f"http://127.0.0.1:{server.server_address[1]}",
+    )
+    ipc_key = os.environ.get("IPC_WEB_API")
+    if ipc_key is None:
+        os.environ["IPC_WEB_API"] = "stand-in"
+
+    project_dir = _project_copy(synthetic)
+    paths = config.paths
+    config.paths = config.Paths(project_dir)
+
+    # start cold, without sources loaded earlier in this process
+    sources.clear()
+
+    start_time = time.perf_counter()
+    try:
+        report = update_charts(offline=False)
+    finally:
+        total = time.perf_counter() - start_time
+        server.shutdown()
+        client.mirror = mirror
+        if ipc_key is None:
+            os.environ.pop("IPC_WEB_API")
+        config.paths = paths
+        shutil.rmtree(project_dir)
+        shutil.rmtree(work)
+
+    served = pd.DataFrame(
+        server_config.log, columns=["host", "path", "bytes", "seconds"]
+    )
+
+    return {
+        "total_seconds": total,
+        "latency": latency,
+        "bandwidth": bandwidth,
+        "synthetic": synthetic,
+        "charts": {
+            name: {
+                "seconds": chart["seconds"],
+                "status": chart["status"],
+                "sources": {
+                    s: report["sources"].get(s, {}).get("seconds", 0.0)
+                    for s in chart["sources"]
+                },
+                "error": chart["error"],
+            }
+            for name, chart in report["charts"].items()
+        },
+        "sources": served.groupby("host")[["bytes", "seconds"]].sum().to_dict("index"),
+    }
+
+
+def critical_path(result: dict) -> pd.DataFrame:
+    """
+    Charts run one after the other, so the critical path is the sequence of charts.
+    For each chart, the slowest source it waited on and the time spent outside sources
+    """
+
+    rows = []
+    for chart, timing in result["charts"].items():
+        waited = timing["sources"]
+        slowest = max(waited, key=waited.get) if waited else None
+        rows.append(
+            {
+                "chart": chart,
+                "seconds": timing["seconds"],
+                "slowest_source": slowest,
+                "source_seconds": sum(waited.values()),
+                # source times are per run: a source shared with an earlier chart
+                # can count for more than the time this chart waited on it
+                "compute_seconds": max(0.0, timing["seconds"] - sum(waited.values())),
+                "error": timing["error"],
+            }
+        )
+
+    return pd.DataFrame(rows).assign(cumulative_seconds=lambda d: d.seconds.cumsum())
+
+
+def compare(result: dict, baseline: dict) -> pd.DataFrame:
+    """Chart and total times against a stored baseline"""
+
+    current = {k: v["seconds"] for k, v in result["charts"].items()}
+    previous = {k: v["seconds"] for k, v in baseline["charts"].items()}
+    current["total"] = result["total_seconds"]
+    previous["total"] = baseline["total_seconds"]
+
+    return pd.DataFrame({"seconds": current, "baseline": previous}).assign(
+        change_pct=lambda d: (d.seconds / d.baseline - 1) * 100
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark update_charts offline")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--bandwidth", type=float, default=None, help="bytes/second")
+    parser.add_argument("--record", action="store_true")
+    parser.add_argument("--synthetic", action="store_true")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args()
+
+    result = run(args.latency, args.bandwidth, args.record, args.synthetic)
+    baseline = BASELINES["synthetic" if args.synthetic else "recorded"]
+
+    print(f"Total: {result['total_seconds']:.2f}s\n")
+    print(critical_path(result).to_string(index=False), "\n")
+    print(pd.DataFrame(result["sources"]).T.to_string(), "\n")
+
+    failed = [k for k, v in result["charts"].items() if v["status"] == "failed"]
+    if failed:
+        sys.exit(f"Charts failed: {', '.join(failed)}")
+
+    if args.save_baseline:
+        with open(baseline, "w") as file:
+            json.dump(result, file, indent=2)
+    elif os.path.exists(baseline):
+        with open(baseline) as file:
+            print(compare(result, json.load(file)).to_string())
@@ -0,0 +1,246 @@
+"""
+Local stand-in server for all remote sources.
+
+Requests arrive as /{host}/{path}?{query}, which is how scripts.http_client rewrites urls
+when a mirror is set. Responses are replayed from a recordings folder, with configurable
+latency and bandwidth. Single byte ranges (Range: bytes=a-b) are answered with 206, and
+responses can be cut after a number of bytes to test resumed downloads. In record mode,
+missing responses are fetched from the real host and saved first.
+
+    python -m benchmarks.stand_in_server --port 8000 --latency 0.2 --bandwidth 5e6
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RECORDINGS = os.path.join(PROJECT_DIR, "benchmarks", "recordings")
+
+# query parameters that are not part of the recording key (e.g. api keys)
+IGNORED_PARAMS: set = {"key"}
+CHUNK_SIZE: int = 64 * 1024
+
+
+def recording_path(path: str, directory: str = RECORDINGS) -> str:
+    """
+    Location of the recording for a request path (/{host}/{path}?{query}).
+    The query, without ignored parameters, is hashed into the file name
+    """
+
+    parts = urlsplit(path)
+    query = urlencode(
+        sorted((k, v) for k, v in parse_qsl(parts.query) if k not in IGNORED_PARAMS)
+    )
+    local = parts.path.lstrip("/")
+    if local == "" or local.endswith("/"):
+        local += "index"
+    if query:
+        local += f"__{hashlib.sha1(query.encode()).hexdigest()[:12]}"
+
+    return os.path.join(directory, local)
+
+
+@dataclass
+class StandInConfig:
+    """
+    Replay settings
+        latency: seconds before the response starts
+        bandwidth: bytes per second, unlimited if None
+        record: fetch and save responses that have not been recorded
+        drop_after: close the connection after this many bytes of a body
+        drops: number of responses to cut with drop_after
+        max_range: largest body of a 206 response. Longer ranges are answered with
+        their first max_range bytes (and a matching Content-Range)
+    """
+
+    directory: str = RECORDINGS
+    latency: float = 0.0
+    bandwidth: Optional[float] = None
+    record: bool = False
+    drop_after: Optional[int] = None
+    drops: int = 0
+    max_range: Optional[int] = None
+    log: list = field(default_factory=list, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def served(self, path: str, size: int, seconds: float) -> None:
+        """Log a served request as (host, path, bytes, seconds)"""
+
+        host = urlsplit(path).path.lstrip("/").split("/")[0]
+        with self._lock:
+            self.log.append((host, path, size, seconds))
+
+    def take_drop(self) -> Optional[int]:
+        """bytes after which to cut the next response, None to send it whole"""
+
+        with self._lock:
+            if self.drop_after is None or self.drops <= 0:
+                return None
+            self.drops -= 1
+            return self.drop_after
+
+
+def _fetch_upstream(path: str) -> tuple:
+    """Fetch the original url for a request path, returning (body, content type)"""
+
+    import requests
+
+    parts = urlsplit(path)
+    query = f"?{parts.query}" if parts.query else ""
+    response = requests.get(
+        f"https://{parts.path.lstrip('/')}{query}",
+        headers={"User-Agent": "Mozilla/5.0"},
+        timeout=(10, 300),
+    )
+    response.raise_for_status()
+
+    return response.content, response.headers.get("Content-Type", "")
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    config: StandInConfig = StandInConfig()
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def _load(self) -> Optional[tuple]:
+        path = recording_path(self.path, self.config.directory)
+
+        if not os.path.exists(path) and self.config.record:
+            body, content_type = _fetch_upstream(self.path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(body)
+            with open(f"{path}.json", "w") as file:
+                json.dump({"url": self.path, "content_type": content_type}, file)
+
+        if not os.path.exists(path):
+            return None
+
+        with open(path, "rb") as file:
+            body = file.read()
+        try:
+            with open(f"{path}.json") as file:
+                content_type = json.load(file)["content_type"]
+        except FileNotFoundError:
+            content_type = "application/octet-stream"
+
+        return body, content_type
+
+    def _send(
+        self,
+        status: int,
+        body: bytes,
+        content_type: str,
+        headers: dict = None,
+        write: bool = True,
+    ):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        return self._write(body) if write else 0
+
+    def _write(self, body: bytes) -> int:
+        """Write the body in chunks, throttled to the bandwidth. Returns the bytes sent"""
+
+        drop = self.config.take_drop()
+        if drop is not None:
+            body = body[:drop]
+            self.close_connection = True
+
+        for start in range(0, len(body), CHUNK_SIZE):
+            chunk = body[start : start + CHUNK_SIZE]
+            self.wfile.write(chunk)
+            if self.config.bandwidth:
+                time.sleep(len(chunk) / self.config.bandwidth)
+
+        return len(body)
+
+    def _range(self, size: int) -> Optional[tuple]:
+        """(first, last) byte of a single Range request, None to send the whole body"""
+
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range", ""))
+        if match is None or match.groups() == ("", ""):
+            return None
+
+        first, last = match.groups()
+        if first == "":  # suffix range: the last n bytes
+            return max(0, size - int(last)), size - 1
+        return int(first), min(int(last), size - 1) if last else size - 1
+
+    def _respond(self, write: bool) -> None:
+        start = time.perf_counter()
+        time.sleep(self.config.latency)
+
+        recording = self._load()
+        if recording is None:
+            self._send(404, b"not recorded", "text/plain", write=write)
+            self.config.served(self.path, 0, time.perf_counter() - start)
+            return
+
+        body, content_type = recording
+        headers = {
+            "Accept-Ranges": "bytes",
+            "ETag": f'"{hashlib.sha1(body).hexdigest()}"',
+        }
+        byte_range = self._range(len(body))
+        if byte_range is None:
+            size = self._send(200, body, content_type, headers, write)
+        elif byte_range[0] > byte_range[1]:
+            headers["Content-Range"] = f"bytes */{len(body)}"
+            size = self._send(416, b"", content_type, headers, write)
+        else:
+            first, last = byte_range
+            if self.config.max_range is not None:
+                last = min(last, first + self.config.max_range - 1)
+            headers["Content-Range"] = f"bytes {first}-{last}/{len(body)}"
+            body = body[first : last + 1]
+            size = self._send(206, body, content_type, headers, write)
+
+        self.config.served(self.path, size, time.perf_counter() - start)
+
+    def do_GET(self) -> None:
+        self._respond(write=True)
+
+    def do_HEAD(self) -> None:
+        self._respond(write=False)
+
+
+def start(config: StandInConfig, port: int = 0) -> ThreadingHTTPServer:
+    """Start the server in a background thread. Use server.server_address for the port"""
+
+    handler = type("Handler", (StandInHandler,), {"config": config})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--bandwidth", type=float, default=None)
+    parser.add_argument("--record", action="store_true")
+    args = parser.parse_args()
+
+    server = start(
+        StandInConfig(
+            latency=args.latency, bandwidth=args.bandwidth, record=args.record
+        ),
+        port=args.port,
+    )
+    print(f"Serving recordings on http://127.0.0.1:{server.server_address[1]}")
+    threading.Event().wait()
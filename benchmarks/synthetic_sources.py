@@ -0,0 +1,187 @@
+"""
+Synthetic recordings of the remote sources, for running the pipeline benchmark without
+network access or recorded responses (see benchmarks.pipeline --synthetic).
+
+The IPC country table, the World Bank API (WDI) indicators, the CMO and USDA workbooks
+are generated with the shape of the real responses, for real countries and commodities.
+Missing manually downloaded files (FAO fertilizer, IMF WEO) are generated in the
+project copy.
+
+    python -m benchmarks.synthetic_sources /tmp/recordings
+"""
+
+import argparse
+import os
+from urllib.parse import urlencode
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import copies
+from benchmarks.excel import _monthly, _workbook
+from benchmarks.stand_in_server import recording_path
+from scripts import analysis, utils
+from scripts.ipc_data import IPC
+
+COMMODITIES: list = ["Palm oil", "Sunflower oil", "Maize", "Wheat, US HRW"]
+WDI_INDICATORS: list = ["SH.STA.STNT.ME.ZS"]
+WDI_AGGREGATES: dict = {"WLD": "World", "SSF": "Sub-Saharan Africa"}
+
+
+def _path(url: str, directory: str) -> str:
+    return recording_path(f"/{url.split('://', 1)[1]}", directory)
+
+
+def ipc_table(rng) -> list:
+    """IPC/CH country table, as returned by the IPC API"""
+
+    countries = utils.get_country_converter().data.ISO2.dropna()[:60]
+    return [
+        {
+            "country": iso2,
+            "from": "Jan 2022",
+            "to": f"{['Mar', 'Jun', 'Sep', 'Dec'][i % 4]} 2022",
+            "year": 2022,
+            "title": "Acute Food Insecurity" if i % 3 else "Cadre Harmonise",
+            "phases": [{"population": int(p)} for p in rng.integers(0, 1e6, 5)],
+            "condition": "A",
+        }
+        for i, iso2 in enumerate(countries)
+    ]
+
+
+def wdi_indicator(rng, code: str) -> list:
+    """
+    World Bank API response of an indicator for every economy (countries and a few
+    aggregates), years 2000-2022 with gaps, as a single page
+    """
+
+    economies = dict(zip(copies._countries().ISO3, copies._countries().name_short))
+    records = [
+        {
+            "indicator": {"id": code, "value": code},
+            "country": {"id": iso3[:2], "value": name},
+            "countryiso3code": iso3,
+            "date": str(year),
+            "value": None if rng.random() < 0.6 else round(rng.random() * 50, 1),
+            "unit": "",
+            "obs_status": "",
+            "decimal": 1,
+        }
+        for iso3, name in (economies | WDI_AGGREGATES).items()
+        for year in range(2022, 1999, -1)
+    ]
+    meta = {"page": 1, "pages": 1, "per_page": utils.WB_PAGE_SIZE}
+
+    return [meta | {"total": len(records)}, records]
+
+
+def cmo_workbook(rng) -> bytes:
+    prices = _monthly(71, rng)
+    prices[4] = [None] + COMMODITIES + [f"Commodity {i}" for i in range(67)]
+    return _workbook(
+        {
+            "AFOSHEET": [["Notes"]] * 20,
+            "Monthly Prices": prices,
+            "Monthly Indices": _monthly(15, rng),
+        }
+    )
+
+
+def usda_workbook(rng) -> bytes:
+    names = copies._countries().name_short[:180]
+    header = [""] + list(analysis.USDA_COLUMNS[1:]) + [f"Other {i}" for i in range(8)]
+
+    def sheet():
+        rows = [["Share of consumer expenditures spent on food"], [], header]
+        return rows + [
+            [name] + (rng.random(10) * 1e4).round(1).tolist() for name in names
+        ]
+
+    return _workbook({str(year): sheet() for year in range(2015, 2021)})
+
+
+def write_recordings(directory: str) -> None:
+    """Write the synthetic responses of every generated source to a recordings folder"""
+
+    import json
+
+    rng = np.random.default_rng(0)
+    # the query of utils._download_wb_data, for its single page
+    wdi_query = {
+        "source": 2,
+        "format": "json",
+        "per_page": utils.WB_PAGE_SIZE,
+        "page": 1,
+    }
+    responses = {
+        IPC(api_key="stand-in")._get_web_url(): json.dumps(ipc_table(rng)).encode(),
+        **{
+            f"{utils.WB_API}/country/all/indicator/{code}?{urlencode(wdi_query)}": (
+                json.dumps(wdi_indicator(rng, code)).encode()
+            )
+            for code in WDI_INDICATORS
+        },
+        analysis.COMMODITY_URL: cmo_workbook(rng),
+        analysis.USDA_URL: usda_workbook(rng),
+    }
+    for url, body in responses.items():
+        path = _path(url, directory)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(body)
+
+
+def weo_file(rng, path: str) -> None:
+    """Raw WEO file (tab separated, with the footnote row), for real countries"""
+
+    countries = copies._countries().ISO3
+    index = pd.MultiIndex.from_product([countries, ["NGDPD", "NGDPDPC"]])
+    years = range(1980, utils.WEO_YEAR + 6)
+    df = pd.DataFrame(
+        {
+            "WEO Country Code": "0",
+            "ISO": index.get_level_values(0),
+            "WEO Subject Code": index.get_level_values(1),
+            "Country": index.get_level_values(0),
+            "Subject Descriptor": "descriptor",
+            "Subject Notes": "notes",
+            "Units": "U.S. dollars",
+            "Scale": "Billions",
+            "Country/Series-specific Notes": "notes",
+        }
+        | {str(y): [f"{v:,.3f}" for v in rng.random(len(index)) * 1e4] for y in years}
+        | {"Estimates Start After": utils.WEO_YEAR - 1}
+    )
+    footnote = (
+        "International Monetary Fund, World Economic Outlook Database, April 2022"
+    )
+    df.loc[len(df), "WEO Country Code"] = footnote
+    df.to_csv(path, sep="\t", index=False, encoding="iso-8859-1")
+
+
+def write_raw_data(project_dir: str) -> None:
+    """Generate the manually downloaded files missing from a project copy"""
+
+    rng = np.random.default_rng(0)
+    raw_data = os.path.join(project_dir, "raw_data")
+
+    path = os.path.join(raw_data, "FAO_fertilizer.csv")
+    if not os.path.exists(path):
+        fertilizer = copies.fertilizer_data(2).replace(
+            {"Item 0": "Nutrient potash K2O (total)"}
+        )
+        fertilizer.to_csv(path, index=False)
+
+    path = os.path.join(raw_data, f"weo_{utils.WEO_YEAR}_{utils.WEO_RELEASE}.csv")
+    if not os.path.exists(path):
+        weo_file(rng, path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic source recordings")
+    parser.add_argument("directory")
+    args = parser.parse_args()
+
+    write_recordings(args.directory)
+    print(f"Synthetic recordings written to {args.directory}")
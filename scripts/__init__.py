@@ -0,0 +1,11 @@
+"""
+pandas runs with copy-on-write in this package: frames derived from another share its
+memory until one of them is modified, so loaders and caches hand out shallow copies
+and functions never modify the frames they are given.
+"""
+
+import pandas as pd
+
+# copy-on-write is always on from pandas 3
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
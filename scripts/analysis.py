@@ -1,14 +1,12 @@
 """Functions to reproduce food security analysis"""
 
-from scripts import utils, config
+from scripts import utils, config, backend, excel, parsers, sources
+import os
 import pandas as pd
 import numpy as np
-import country_converter as coco
-from bs4 import BeautifulSoup
 from typing import Optional
-import requests
 
-from scripts.ipc_data import IPC
+from scripts.http_client import client
 
 
 def get_stunting_wb() -> pd.DataFrame:
@@ -24,6 +22,7 @@ def get_stunting_wb() -> pd.DataFrame:
 
 
 # FAO Food index
+@sources.cached("fao_food_price_index")
 def __read_fao_food_price_index(
     parser: Optional[str] = "html.parser",
     headers: Optional[dict] = {"User-Agent": "Mozilla/5.0"},
@@ -33,15 +32,19 @@ def __read_fao_food_price_index(
     full_url = "https://www.fao.org/worldfoodsituation/foodpricesindex/en/"
     base_url = "https://www.fao.org/"
 
+    from bs4 import BeautifulSoup
+
     # scrape download link
-    content = requests.get(full_url).content
+    content = client.get(full_url, headers=headers).content
     soup = BeautifulSoup(content, parser)
     href = soup.find_all(text="CSV")[0].parent.get("href")
     download_link = base_url + href
 
     # read csv
     df = pd.read_csv(
-        download_link, skiprows=2, storage_options=headers, parse_dates=["Date"]
+        client.read_bytes(download_link, headers=headers),
+        skiprows=2,
+        parse_dates=["Date"],
     )
 
     return df
@@ -79,14 +82,15 @@ def get_food_price_index(
 
 
 def get_ipc_table():
-    ipc = IPC()
+    from scripts.data import data  # scripts.data imports this module
 
-    df = ipc.get_ipc_ch_data(latest=True, only_valid=True)
+    df = data.ipc_ch_data(latest=True, only_valid=True)
     df.to_csv(f"{config.paths.raw_data}/IPC_table.csv", index=False)
     print("Successfully downloaded IPC table")
 
 
 # IPC tools
+@sources.cached("ipc_manual")
 def get_ipc():
     """
     return clean dataset from IPC: https://www.ipcinfo.org/ipcinfo-website/ipc-dashboard/en/
@@ -126,20 +130,20 @@ def get_ipc():
 def __clean_fao_undernourishment(df: pd.DataFrame) -> pd.DataFrame:
     """cleans undernourishment dataframe"""
 
-    df.columns = df.columns.str.lower()
     df = (
-        df.loc[:, ["area", "item", "year", "value"]]
+        df.rename(columns=str.lower)
+        .loc[:, ["area", "item", "year", "value"]]
         .replace({"China, Taiwan Province of": "Taiwan", "China, mainland": "China"})
         .assign(value_text=lambda d: d.value)
-        .assign(
-            value=lambda d: utils.clean_numeric_column(d.value.str.replace("<", ""))
-        )
+        .assign(value=lambda d: utils.clean_numeric_column(d.value))
         .reset_index(drop=True)
     )
 
     return df
 
 
+@sources.cached("fao_undernourishment")
+@backend.pluggable
 def get_fao_undernourishment() -> pd.DataFrame:
     """
     read FAO undernourishment data from raw_data folder 'fao_undernourishment_data
@@ -156,6 +160,7 @@ def get_fao_undernourishment() -> pd.DataFrame:
 def __clean_usda_data(df: pd.DataFrame, year: str) -> pd.DataFrame:
     """Cleans USDA dataframe"""
 
+    cc = utils.get_country_converter()
     df = (
         df.rename(
             columns={
@@ -168,8 +173,8 @@ def __clean_usda_data(df: pd.DataFrame, year: str) -> pd.DataFrame:
         .dropna(subset="country")
         .dropna(subset=["total_cons_exp", "food_exp"])
         .reset_index(drop=True)
-        .assign(iso_code=lambda d: coco.convert(d.country))
-        .assign(continent=lambda d: coco.convert(d.iso_code, to="continent"))
+        .assign(iso_code=lambda d: cc.convert(d.country))
+        .assign(continent=lambda d: cc.convert(d.iso_code, to="continent"))
     )
 
     return df
@@ -179,22 +184,33 @@ def _calc_avg_food_exp(df: pd.DataFrame) -> pd.DataFrame:
     """Calculates average food expenditure over 2018, 2019, and 2019 from USDA dataframe"""
 
     df = df.groupby(["country", "iso_code", "continent"], as_index=False).agg(
-        {"food_exp": np.sum, "total_cons_exp": np.sum}
+        {"food_exp": "sum", "total_cons_exp": "sum"}
     )
     df["avg_share"] = (df.food_exp / df.total_cons_exp) * 100
 
     return df
 
 
+USDA_COLUMNS: tuple = ("Unnamed: 0", "Consumer expenditures3", "Expenditure on food2")
+
+
+def _usda_column(name: str) -> bool:
+    return name in USDA_COLUMNS
+
+
+USDA_URL = "https://www.ers.usda.gov/media/e2pbwgyg/2015-2020-food-spending_update-july-2021.xlsx"
+
+
+@sources.cached("usda_food_expenditure")
 def get_usda_food_exp() -> pd.DataFrame:
     """Pipeline to extract USDA data"""
-    url = "https://www.ers.usda.gov/media/e2pbwgyg/2015-2020-food-spending_update-july-2021.xlsx"
+    workbook = client.get(USDA_URL).content
     df = pd.DataFrame()
 
-    years = [2020, 2019, 2018]
+    years = ["2020", "2019", "2018"]
+    sheets = excel.read_sheets(workbook, years, skiprows=2, usecols=_usda_column)
     for year in years:
-        df_year = pd.read_excel(url, sheet_name=str(year), skiprows=2)
-        df_year = __clean_usda_data(df_year, str(year))
+        df_year = __clean_usda_data(sheets[year], year)
         df = pd.concat([df, df_year], ignore_index=True)
 
     df = _calc_avg_food_exp(df)
@@ -207,18 +223,39 @@ COMMODITY_URL = (
     "https://thedocs.worldbank.org/en/doc/5d903e848db1d1b83e0ec8f744e55570-"
     "0350012021/related/CMO-Historical-Data-Monthly.xlsx"
 )
+DOWNLOADS_FOLDER = "downloads"  # large workbooks, kept in raw_data but not tracked
+
+
+# only the sheets are snapshotted, the workbook is much larger
+@sources.cached("wb_commodities", snapshot=False)
+def _download_commodity_workbook() -> bytes:
+    """Downloads the CMO workbook, on first use. Interrupted downloads are resumed"""
 
+    folder = os.path.join(config.paths.raw_data, DOWNLOADS_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    path = client.download_file(
+        COMMODITY_URL, os.path.join(folder, "CMO-Historical-Data-Monthly.xlsx")
+    )
+    with open(path, "rb") as file:
+        return file.read()
+
+
+@sources.cached("wb_commodities")
+def _read_commodity_sheet(sheet_name: str) -> pd.DataFrame:
+    """Reads a sheet of the CMO workbook. Missing values ('..') are read as NaN"""
 
-COMMODITY_DATA = pd.read_excel(COMMODITY_URL, sheet_name="Monthly Prices")
-INDEX_DATA = pd.read_excel(COMMODITY_URL, sheet_name="Monthly Indices")
+    return excel.read_sheet(
+        _download_commodity_workbook(), sheet_name, na_values=[".."]
+    )
 
 
-def get_commodity_prices(commodities: list) -> pd.DataFrame:
+def get_commodity_prices(commodities: Optional[list] = None) -> pd.DataFrame:
     """
     Gets the commodity data from the World Bank and returns a clean DataFrame
+        commodities: commodities to keep, default = all
     """
     # read excel
-    df = COMMODITY_DATA.copy()
+    df = _read_commodity_sheet("Monthly Prices")
 
     # cleaning
     df.columns = df.iloc[3]
@@ -228,12 +265,18 @@ def get_commodity_prices(commodities: list) -> pd.DataFrame:
         .reset_index(drop=True)
         .rename(columns={"Rice, Thai 5%": "Rice "})
         .rename(columns={"Wheat, US HRW": "Wheat"})
-        .filter(["period"] + commodities)
-        .replace("..", np.nan)
+        .loc[:, lambda d: ~d.columns.duplicated()]
+    )
+    if commodities is not None:
+        df = df.filter(["period"] + commodities)
+
+    # values are read in object columns, below the header rows of the sheet
+    df = df.assign(
+        **{c: pd.to_numeric(df[c], errors="coerce") for c in df.columns.drop("period")}
     )
 
     # change date format
-    df["period"] = pd.to_datetime(df.period, format="%YM%m")
+    df["period"] = parsers.parse_dates(df.period, format="%YM%m")
 
     return df
 
@@ -241,9 +284,9 @@ def get_commodity_prices(commodities: list) -> pd.DataFrame:
 def get_indices(indices: Optional[list] = None) -> pd.DataFrame:
     """gets index data from World Bank and returns a clean dataframe"""
 
-    df = INDEX_DATA.copy()
+    df = _read_commodity_sheet("Monthly Indices")
 
-    df = df.iloc[9:].reset_index(drop=True).replace("..", np.nan)
+    df = df.iloc[9:].reset_index(drop=True)
     df.columns = [
         "period",
         "Energy",
@@ -265,11 +308,15 @@ def get_indices(indices: Optional[list] = None) -> pd.DataFrame:
 
     # filter indices
     if indices is not None:
-        indices.insert(0, "period")  # add column name for period
-        df = df.loc[:, indices]
+        df = df.loc[:, ["period"] + list(indices)]
+
+    # values are read in object columns, below the header rows of the sheet
+    df = df.assign(
+        **{c: pd.to_numeric(df[c], errors="coerce") for c in df.columns.drop("period")}
+    )
 
     # change date format
-    df["period"] = pd.to_datetime(df.period, format="%YM%m")
+    df["period"] = parsers.parse_dates(df.period, format="%YM%m")
 
     return df
 
@@ -277,18 +324,18 @@ def get_indices(indices: Optional[list] = None) -> pd.DataFrame:
 # Potash
 
 
-def clean_fao_fertilizer(df: pd.DataFrame) -> pd.DataFrame:
-    """Clean FAO fertilizer dataset"""
+@backend.pluggable
+def _reshape_fao_fertilizer(df: pd.DataFrame) -> pd.DataFrame:
+    """Average 2017-2019 values and pivot elements to columns"""
 
-    df = (
+    return (
         df.loc[
             df["Year"].isin([2019, 2018, 2017]),
             ["Area", "Element", "Item", "Year", "Value"],
         ]
-        .groupby(["Area", "Element", "Item"])
-        .agg("mean")["Value"]
-        .reset_index()
-        .pivot(index=["Area", "Item"], columns="Element", values="Value")
+        .groupby(["Area", "Item", "Element"])["Value"]
+        .mean()
+        .unstack("Element")
         .reset_index()
         .rename(
             columns={
@@ -302,15 +349,25 @@ def clean_fao_fertilizer(df: pd.DataFrame) -> pd.DataFrame:
                 "Production": "production",
             }
         )
-        .replace({"China, Taiwan Province of": "Taiwan", "China, mainland": "China"})
+        .assign(
+            country=lambda d: d.country.replace(
+                {"China, Taiwan Province of": "Taiwan", "China, mainland": "China"}
+            )
+        )
     )
 
+
+def clean_fao_fertilizer(df: pd.DataFrame) -> pd.DataFrame:
+    """Clean FAO fertilizer dataset"""
+
     # clean countries
-    df["iso_code"] = coco.convert(df.country)
-    df["continent"] = coco.convert(df.iso_code, to="continent")
-    df.country = coco.convert(df.country, to="name_short")
+    cc = utils.get_country_converter()
 
-    return df
+    return _reshape_fao_fertilizer(df).assign(
+        iso_code=lambda d: cc.convert(d.country),
+        continent=lambda d: cc.convert(d.iso_code, to="continent"),
+        country=lambda d: cc.convert(d.country, to="name_short"),
+    )
 
 
 def _calculations(df: pd.DataFrame) -> pd.DataFrame:
@@ -319,28 +376,42 @@ def _calculations(df: pd.DataFrame) -> pd.DataFrame:
     where there is no domestic use, dependence is set to 0
     """
 
-    df["net_import_quantity"] = df.import_quantity - df.export_quantity
+    df = df.assign(
+        net_import_quantity=lambda d: d.import_quantity - d.export_quantity,
+        # adjust net import  - change net export quantity to 0
+        net_import_quantity_adj=lambda d: d.net_import_quantity.clip(lower=0),
+        # net import dependence in agriculture
+        dependence=lambda d: (d.net_import_quantity_adj / d.ag_use) * 100,
+    ).replace([np.inf, np.nan], 0)
 
-    # adjust net import  - change net export quantity to 0
-    df["net_import_quantity_adj"] = df.net_import_quantity
-    df.loc[df.net_import_quantity_adj < 0, "net_import_quantity_adj"] = 0
-
-    # net import dependence in agriculture
-    df["dependence"] = (df.net_import_quantity_adj / df.ag_use) * 100
-    df.replace([np.inf, np.nan], 0, inplace=True)
-    df.loc[
-        df.dependence > 100, "dependence"
-    ] = 100  # replace values with over 100% dependence with 100
-
-    return df
+    # replace values with over 100% dependence with 100
+    return df.assign(dependence=lambda d: d.dependence.clip(upper=100))
 
 
+@sources.cached("fao_fertilizer")
 def get_fao_fertilizer(
     fertilizer_list: Optional[list] = ["Nutrient potash K2O (total)"],
 ) -> pd.DataFrame:
-    """Pipeline to read and clean FAO fertilizer data"""
+    """
+    Pipeline to read and clean FAO fertilizer data
+        fertilizer_list: fertilizers to keep, None for all
+    """
     df = pd.read_csv(f"{config.paths.raw_data}/FAO_fertilizer.csv")
 
     df = clean_fao_fertilizer(df).pipe(_calculations)
 
+    if fertilizer_list is None:
+        return df
+
     return df[df.fertiliser.isin(fertilizer_list)]
+
+
+# IFPRI trade restrictions
+@sources.cached("ifpri_restrictions")
+def get_ifpri_restrictions() -> pd.DataFrame:
+    """
+    Read IFPRI food and fertilizer export restrictions
+    Data needs to be manually downloaded to raw_data/restrictions_data.csv
+    """
+
+    return pd.read_csv(f"{config.paths.raw_data}/restrictions_data.csv")
@@ -0,0 +1,59 @@
+"""
+Execution backend for the data transformations.
+
+pandas is the default. Functions decorated with `pluggable` are replaced by the function
+with the same name in `scripts.{backend}_backend` when another backend is selected,
+with either `set_backend("polars")` or the DATA_BACKEND environment variable.
+Alternative implementations take and return pandas dataframes, so loaders and chart
+builders do not depend on the backend.
+"""
+
+import importlib
+import os
+from functools import wraps
+
+BACKENDS: tuple = ("pandas", "polars")
+
+_backend: str = os.environ.get("DATA_BACKEND", "pandas")
+
+
+def set_backend(name: str) -> None:
+    """Select the backend used by pluggable functions"""
+
+    global _backend
+
+    if name not in BACKENDS:
+        raise ValueError(f"{name} is not a valid backend. Use one of {BACKENDS}")
+
+    if name != "pandas":
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            raise ImportError(f"The {name} backend needs {name} to be installed")
+
+    _backend = name
+
+
+def get_backend() -> str:
+    return _backend
+
+
+def pluggable(func):
+    """
+    Use the active backend's implementation of a function, if it has one.
+    The implementation is looked up by name, without leading underscores
+    """
+
+    name = func.__name__.lstrip("_")
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if _backend == "pandas":
+            return func(*args, **kwargs)
+
+        module = importlib.import_module(f"scripts.{_backend}_backend")
+        implementation = getattr(module, name, func)
+
+        return implementation(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,230 @@
+"""
+Rebuild the chart set as it would have looked on past dates, with the current code.
+
+    python -m scripts.backfill 2022-06-30 2022-09-30 2022-12-31
+    python -m scripts.backfill --from-dir archive 2022-06-30 2022-09-30
+
+The raw inputs (raw_data and glossaries) of each date come from the git history of the
+repository (the last commit on or before the date that changed them) or from a folder
+of dated copies (<folder>/<YYYY-MM-DD>/raw_data, the latest on or before the date).
+Dates with identical inputs are built once. Each set of inputs is built in its own
+process and offline: remote sources are read from the snapshots in the dated
+raw_data/snapshots (see scripts.sources), and charts without one are reported as failed.
+Results are written to output/backfill/<date>/, with the run report of each date.
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tarfile
+import tempfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional
+
+import pandas as pd
+
+from scripts import config
+
+INPUT_FOLDERS: tuple = ("raw_data", "glossaries")
+BACKFILL_FOLDER: str = "backfill"
+MAX_WORKERS: int = min(4, os.cpu_count() or 1)
+
+
+def _git(*args: str) -> bytes:
+    return subprocess.run(
+        ["git", *args], cwd=config.paths.project_dir, capture_output=True, check=True
+    ).stdout
+
+
+@dataclass
+class Inputs:
+    """
+    Raw inputs of a date
+        date: the date, as YYYY-MM-DD
+        key: fingerprint of the inputs, equal for identical inputs
+        commit: git commit to read the inputs from
+        folder: dated folder to read the inputs from, if not from git
+    """
+
+    date: str
+    key: str
+    commit: Optional[str] = None
+    folder: Optional[str] = None
+
+    @property
+    def origin(self) -> str:
+        return self.commit or self.folder
+
+    def materialize(self, project_dir: str) -> None:
+        """write the inputs to raw_data and glossaries in a project folder"""
+
+        if self.commit is not None:
+            listed = _git("ls-tree", "--name-only", self.commit, "--", *INPUT_FOLDERS)
+            folders = listed.decode().split()
+            archive = _git("archive", self.commit, *folders)
+            with tarfile.open(fileobj=BytesIO(archive)) as tar:
+                tar.extractall(project_dir)
+            return
+
+        for name in INPUT_FOLDERS:
+            source = os.path.join(self.folder, name)
+            if not os.path.isdir(source):  # e.g. glossaries not archived
+                source = os.path.join(config.paths.project_dir, name)
+            shutil.copytree(source, os.path.join(project_dir, name))
+
+
+def git_inputs(dates: list) -> list:
+    """Inputs of each date from the git history of raw_data and glossaries"""
+
+    inputs = []
+    for date in dates:
+        commit = _git(
+            "rev-list", "-1", f"--before={date} 23:59:59", "HEAD", "--", *INPUT_FOLDERS
+        )
+        commit = commit.decode().strip()
+        if not commit:
+            raise ValueError(f"No raw inputs committed on or before {date}")
+
+        tree = _git("ls-tree", "-r", commit, "--", *INPUT_FOLDERS)
+        inputs.append(Inputs(date, hashlib.sha1(tree).hexdigest(), commit=commit))
+
+    return inputs
+
+
+def _folder_key(folder: str) -> str:
+    """hash of the names and contents of the input files in a dated folder"""
+
+    digest = hashlib.sha1()
+    for name in INPUT_FOLDERS:
+        for root, dirs, files in sorted(os.walk(os.path.join(folder, name))):
+            dirs.sort()
+            for file in sorted(files):
+                path = os.path.join(root, file)
+                digest.update(os.path.relpath(path, folder).encode())
+                with open(path, "rb") as f:
+                    digest.update(hashlib.sha1(f.read()).digest())
+
+    return digest.hexdigest()
+
+
+def folder_inputs(dates: list, folder: str) -> list:
+    """Inputs of each date from a folder of dated copies (<folder>/<YYYY-MM-DD>/)"""
+
+    available = sorted(
+        d for d in os.listdir(folder) if re.fullmatch(r"\d{4}-\d{2}-\d{2}", d)
+    )
+    keys = {}
+    inputs = []
+    for date in dates:
+        earlier = [d for d in available if d <= date]
+        if not earlier:
+            raise ValueError(f"No raw inputs in {folder} on or before {date}")
+
+        path = os.path.join(folder, earlier[-1])
+        if path not in keys:
+            keys[path] = _folder_key(path)
+        inputs.append(Inputs(date, keys[path], folder=path))
+
+    return inputs
+
+
+def _build(project_dir: str) -> dict:
+    """
+    build the chart set of a project folder, offline. Runs in a worker process, which
+    may have built other dates before: their datasets and sources are dropped first
+    """
+
+    from scripts import sources
+    from scripts.charts import update_charts
+    from scripts.data import data
+
+    config.paths = config.Paths(project_dir)
+    data.invalidate()
+    sources.clear()
+
+    return update_charts(deadline=None, offline=True)
+
+
+def backfill(
+    dates: list,
+    folder: str = None,
+    directory: str = None,
+    max_workers: int = MAX_WORKERS,
+) -> pd.DataFrame:
+    """
+    Rebuild the chart set for past dates
+        dates: dates to rebuild (YYYY-MM-DD)
+        folder: folder of dated input copies, default = the git history
+        directory: folder for the dated outputs, default = output/backfill
+        max_workers: processes building at the same time
+    Returns the origin of the inputs and the chart statuses of each date
+    """
+
+    dates = sorted({pd.Timestamp(d).strftime("%Y-%m-%d") for d in dates})
+    inputs = folder_inputs(dates, folder) if folder else git_inputs(dates)
+    if directory is None:
+        directory = os.path.join(config.paths.output, BACKFILL_FOLDER)
+
+    # dates with the same inputs are built once
+    groups = defaultdict(list)
+    for i in inputs:
+        groups[i.key].append(i)
+
+    work = tempfile.mkdtemp(prefix="food_security_backfill_")
+    try:
+        projects = {}
+        for key, group in groups.items():
+            projects[key] = os.path.join(work, key[:16])
+            os.makedirs(os.path.join(projects[key], "output"))
+            group[0].materialize(projects[key])
+
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {key: pool.submit(_build, p) for key, p in projects.items()}
+
+        rows = []
+        for key, group in groups.items():
+            try:
+                report, error = futures[key].result(), None
+            except Exception as e:
+                report, error = {"charts": {}}, repr(e)
+                print(f"Could not build inputs of {group[0].date}: {error}")
+
+            statuses = [chart["status"] for chart in report["charts"].values()]
+            for i in group:
+                target = os.path.join(directory, i.date)
+                shutil.rmtree(target, ignore_errors=True)
+                if error is None:
+                    shutil.copytree(os.path.join(projects[key], "output"), target)
+                rows.append(
+                    {
+                        "date": i.date,
+                        "origin": i.origin,
+                        "built_with": group[0].date,
+                        "fresh": statuses.count("fresh"),
+                        "stale": statuses.count("stale"),
+                        "failed": statuses.count("failed"),
+                        "error": error,
+                    }
+                )
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    return pd.DataFrame(rows).sort_values("date", ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the charts for past dates")
+    parser.add_argument("dates", nargs="+", help="dates to rebuild, as YYYY-MM-DD")
+    parser.add_argument("--from-dir", help="folder of dated input copies")
+    parser.add_argument("--output", help="folder for the dated outputs")
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    args = parser.parse_args()
+
+    result = backfill(args.dates, args.from_dir, args.output, args.workers)
+    print(result.to_string(index=False))
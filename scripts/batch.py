@@ -0,0 +1,156 @@
+"""
+Batch generation of chart variants: the same chart for several parameter sets, e.g.
+per commodity group, fertilizer, start date or region.
+
+    from scripts import batch, charts
+
+    batch.run_batch(
+        batch.grid(charts.commodity_chart, commodities=[["Maize"], ["Wheat", "Maize"]])
+        + batch.grid(charts.fao_fpi_main, start_date=["2000-01-01", "2015-01-01"])
+        + batch.grid(charts.potash_dependence_chart, region=[("continent", "Africa")])
+    )
+
+Variants load their data through scripts.data, so each source is loaded and cleaned
+once for the whole batch, and each variant only slices the shared data. Variants are
+built in parallel and written to output/variants/<chart>/<variant>/.
+"""
+
+import itertools
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import pandas as pd
+
+from scripts import config, regions
+from scripts.output import writer
+
+BATCH_FOLDER: str = "variants"
+MAX_WORKERS: int = 8
+
+
+def _slug(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return "+".join(_slug(v) for v in value)
+    return re.sub(r"[^a-z0-9.-]+", "_", str(value).lower()).strip("_")
+
+
+@dataclass
+class Variant:
+    """
+    A chart with one parameter set
+        chart: chart function, writing its files with scripts.output.writer
+        params: keyword arguments for the chart
+        region: (grouping, group) to keep, e.g. ('continent', 'Africa'). Groupings are
+        those of scripts.regions. Every file of the chart must have an iso_code column
+        name: folder of the variant, default = built from params and region
+    """
+
+    chart: Callable
+    params: dict = field(default_factory=dict)
+    region: Optional[tuple] = None
+    name: Optional[str] = None
+
+    @property
+    def folder(self) -> str:
+        if self.name is not None:
+            return self.name
+
+        values = list(self.params.values())
+        if self.region is not None:
+            values.append(self.region[1])
+
+        return "-".join(_slug(v) for v in values) or "default"
+
+
+def grid(chart: Callable, region: list = None, **params) -> list:
+    """
+    Variants of a chart for every combination of parameter values
+        region: (grouping, group) values, see Variant
+        params: lists of values for each keyword argument of the chart
+    """
+
+    names = list(params)
+    combinations = itertools.product(*params.values()) if names else [()]
+
+    return [
+        Variant(chart, dict(zip(names, values)), region=r)
+        for values in combinations
+        for r in (region or [None])
+    ]
+
+
+def _keep_region(df: pd.DataFrame, region: tuple, filename: str) -> pd.DataFrame:
+    """rows of the countries in a region, using the shared country groups lookup"""
+
+    grouping, group = region
+    if grouping not in regions.GROUPINGS:
+        raise ValueError(f"{grouping} is not a valid grouping")
+    if "iso_code" not in df.columns:
+        raise ValueError(f"{filename} has no iso_code column to filter by region")
+
+    lookup = regions.country_groups()[grouping]
+    return df.loc[df.iso_code.map(lookup) == group].reset_index(drop=True)
+
+
+def _build(variant: Variant, directory: str) -> dict:
+    """build a variant and write its files. Errors are returned in the report"""
+
+    start = time.perf_counter()
+    folder = os.path.join(directory, variant.chart.__name__, variant.folder)
+    try:
+        with writer.capture() as captured:
+            variant.chart(**variant.params)
+
+        files = {}
+        for filename, (df, kwargs) in captured.items():
+            if variant.region is not None:
+                df = _keep_region(df, variant.region, filename)
+            files[filename] = (df, kwargs)
+
+        os.makedirs(folder, exist_ok=True)
+        for filename, (df, kwargs) in files.items():
+            df.to_csv(os.path.join(folder, filename), index=False, **kwargs)
+        error = None
+    except Exception as e:
+        error = repr(e)
+        files = {}
+        print(f"Could not build {variant.chart.__name__}/{variant.folder}: {error}")
+
+    return {
+        "chart": variant.chart.__name__,
+        "variant": variant.folder,
+        "params": variant.params,
+        "region": variant.region,
+        "files": sorted(files),
+        "seconds": round(time.perf_counter() - start, 3),
+        "error": error,
+    }
+
+
+def run_batch(
+    variants: list, max_workers: int = MAX_WORKERS, directory: str = None
+) -> pd.DataFrame:
+    """
+    Build chart variants in parallel
+        variants: Variant objects, e.g. from grid()
+        max_workers: variants built at the same time
+        directory: folder to write to, default = output/variants
+    Returns a report with the files, time and error of each variant
+    """
+
+    if directory is None:
+        directory = os.path.join(config.paths.output, BATCH_FOLDER)
+
+    folders = [(v.chart.__name__, v.folder) for v in variants]
+    duplicated = {f"{c}/{v}" for c, v in folders if folders.count((c, v)) > 1}
+    if duplicated:
+        raise ValueError(f"variants with the same folder: {sorted(duplicated)}")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        report = list(pool.map(lambda v: _build(v, directory), variants))
+
+    return pd.DataFrame(report)
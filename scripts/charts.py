@@ -1,29 +1,25 @@
 """Function to create flourish charts"""
 
+import re
+import time
+
 import pandas as pd
-from scripts import utils, config
-from scripts.analysis import (
-    get_stunting_wb,
-    get_fao_undernourishment,
-    get_usda_food_exp,
-    get_ipc,
-    get_food_price_index,
-    get_commodity_prices,
-    get_indices,
-    get_fao_fertilizer,
-)
+from scripts import utils, regions, sources, geometries
+from scripts.output import writer
 from typing import Optional
-import country_converter as coco
 
-from scripts.ipc_data import IPC
+from scripts.data import data
+from scripts.panel import update_panel
+from scripts.price_metrics import price_metrics
+from scripts.undernourishment import PREVALENCE, NUMBER
 
 
 def fao_fpi_main(start_date: str = "2000-01-01") -> None:
     """Creates csv for FAO Food Price Index Chart starting in 2000-01-01"""
 
-    df = get_food_price_index()
-    df.assign(date_popup=lambda d: d.date).loc[df.date >= start_date].to_csv(
-        f"{config.paths.output}/fao_fpi_main.csv", index=False
+    df = data.food_price_index()
+    df.assign(date_popup=lambda d: d.date).loc[df.date >= start_date].pipe(
+        writer.write_csv, "fao_fpi_main.csv"
     )
 
 
@@ -33,43 +29,53 @@ def undernourishment_world() -> None:
     (Chart not used in page)
     """
 
-    df = get_fao_undernourishment()
-
-    pct_df = df.loc[
-        df.item == "Prevalence of undernourishment (percent) (annual value)",
-        ["area", "year", "value", "value_text"],
-    ]
-    mil_df = df.loc[
-        df.item == "Number of people undernourished (million) (annual value)",
-        ["area", "year", "value", "value_text"],
-    ]
-    final = pd.merge(
-        pct_df, mil_df, on=["area", "year"], how="inner", suffixes=("_pct", "_mil")
-    )
-    final[final.area == "World"].to_csv(
-        f"{config.paths.output}/undernourishment_world.csv", index=False
-    )
+    undernourishment = data.undernourishment()
+
+    undernourishment.pivot(
+        items={PREVALENCE: "pct", NUMBER: "mil"}, areas=["World"]
+    ).pipe(writer.write_csv, "undernourishment_world.csv")
+
+
+def _write_map(df: pd.DataFrame, filename: str, shard_by: str = None) -> None:
+    """
+    Write a map csv and, with shard_by, one csv per region with only its countries
+    (e.g. potash_map_africa.csv). In the shared geometries mode, each region also gets
+    its own geometry asset
+        shard_by: grouping to shard by - 'continent' or 'UNregion'
+    """
 
+    writer.write_csv(df, filename)
+    if shard_by is None:
+        return
 
-def stunting_map() -> None:
+    stem = filename.removesuffix(".csv")
+    for region, shard in regions.partition(df, shard_by).items():
+        slug = re.sub(r"[^a-z0-9]+", "_", region.lower()).strip("_")
+        if geometries.get_mode() == "shared":
+            geometries.write_asset(shard.iso_code, slug, shard_by.lower())
+        writer.write_csv(shard, f"{stem}_{slug}.csv")
+
+
+def stunting_map(shard_by: Optional[str] = None) -> None:
     """
     creates stunting map - by country for latest available data point
     (not used in main page)
+        shard_by: also write a map per 'continent' or 'UNregion', default = None
     """
 
-    df = get_stunting_wb()
+    df = data.stunting()
 
     (
         utils.get_latest_values(df, "iso_code", "year")
         .pipe(utils.add_flourish_geometries)
-        .to_csv(f"{config.paths.output}/stunting_map.csv", index=False)
+        .pipe(_write_map, "stunting_map.csv", shard_by)
     )
 
 
 def stunting_top_countries_bar() -> None:
     """Creates a chart for 30 countries with highest stunting values + SSA"""
 
-    df = get_stunting_wb()
+    df = data.stunting()
 
     ssf = df.loc[df.iso_code == "SSF"].pipe(
         utils.get_latest_values, "iso_code", "year"
@@ -84,7 +90,7 @@ def stunting_top_countries_bar() -> None:
     )
 
     df = pd.concat([df, ssf], ignore_index=True)
-    df.to_csv(f"{config.paths.output}/stunting_top_countries_bar.csv", index=False)
+    writer.write_csv(df, "stunting_top_countries_bar.csv")
 
 
 def ipc_charts() -> None:
@@ -97,28 +103,26 @@ def ipc_charts() -> None:
         "Phase 5": "phase_5",
         "Phase 3+": "phase_3plus",
     }
-    df = get_ipc()
+    df = data.ipc_manual()
 
     for phase in phases.values():
-        df_phase = df.copy(deep=True)
         (
-            df_phase.sort_values(by=phase, ascending=False)
+            df.loc[:, ["country", phase, "period_start", "period_end", "source"]]
+            .sort_values(by=phase, ascending=False)
             .reset_index(drop=True)
-            .loc[0:15, ["country", phase, "period_start", "period_end", "source"]]
+            .loc[0:15]
             .dropna(subset=phase)
-            .to_csv(f"{config.paths.output}/ipc_{phase}.csv", index=False)
+            .pipe(writer.write_csv, f"ipc_{phase}.csv")
         )
 
 
 def live_ipc_charts() -> None:
-    ipc = IPC()
-
-    df = ipc.get_ipc_ch_data().assign(
+    df = data.ipc_ch_data().assign(
         from_date=lambda d: d.from_date.dt.strftime("%b %Y"),
         to_date=lambda d: d.to_date.dt.strftime("%b %Y"),
     )
 
-    df.to_csv(f"{config.paths.output}/ipc_data.csv", index=False)
+    writer.write_csv(df, "ipc_data.csv")
 
     def __phase_df(df_: pd.DataFrame, phase: str) -> pd.DataFrame:
         return (
@@ -143,17 +147,67 @@ def live_ipc_charts() -> None:
             )
             .dropna(subset=[phase])
             .loc[lambda d: d[phase] > 0]
-            .to_csv(f"{config.paths.output}/ipc_{phase}.csv", index=False)
+            .pipe(writer.write_csv, f"ipc_{phase}.csv")
         )
 
     for phase in ("phase_2", "phase_3", "phase_4", "phase_5", "phase_3plus"):
         __phase_df(df, phase)
 
 
+def ipc_regional_chart() -> None:
+    """Creates csv with IPC phase totals by continent, UN region and income level"""
+
+    phases = ["phase_1", "phase_2", "phase_3", "phase_4", "phase_5", "phase_3plus"]
+    df = data.ipc_ch_data()
+
+    (
+        regions.aggregate(df, phases)
+        .loc[:, ["grouping", "group", "indicator", "sum", "count"]]
+        .rename(
+            columns={"indicator": "phase", "sum": "population", "count": "countries"}
+        )
+        .pipe(writer.write_csv, "ipc_regional.csv")
+    )
+
+
+def stunting_regional_chart() -> None:
+    """
+    Creates csv with latest stunting prevalence by continent, UN region and income level,
+    weighted by total population
+    """
+
+    stunting = utils.get_latest_values(data.stunting(), "iso_code", "year")
+    population = utils.get_latest_values(
+        data.wb_indicator("SP.POP.TOTL").dropna(subset="value"),
+        "iso_code",
+        "year",
+    )
+    df = stunting.merge(
+        population.loc[:, ["iso_code", "value"]].rename(
+            columns={"value": "population"}
+        ),
+        on="iso_code",
+        how="left",
+    )
+
+    (
+        regions.aggregate(df, ["value"], weight_col="population")
+        .loc[:, ["grouping", "group", "weighted_mean", "mean", "count"]]
+        .rename(
+            columns={
+                "weighted_mean": "value",
+                "mean": "simple_mean",
+                "count": "countries",
+            }
+        )
+        .pipe(writer.write_csv, "stunting_regional.csv")
+    )
+
+
 def food_exp_share_chart() -> None:
     """Creates scatter plot of share of food expenditure vs gdp per capita"""
 
-    df = get_usda_food_exp()
+    df = data.usda_food_exp()
     df = (
         utils.add_gdp_latest(df, iso_col="iso_code", per_capita=True)
         .pipe(utils.add_income_levels)
@@ -169,15 +223,15 @@ def food_exp_share_chart() -> None:
         "income_level_agg",
     ] = "High/higher middle income"
 
-    df.to_csv(f"{config.paths.output}/food_share_chart.csv", index=False)
+    writer.write_csv(df, "food_share_chart.csv")
 
 
 def fao_fpi_scrolly(start_date: str = "2010-01-01") -> None:
     """Creates csv for FAO Food Price Index Chart starting in 2014-01-01 to embed in the scolly story"""
 
-    df = get_food_price_index()
-    df.assign(date_popup=lambda d: d.date).loc[df.date >= start_date].to_csv(
-        f"{config.paths.output}/fao_fpi_scrolly.csv", index=False
+    df = data.food_price_index()
+    df.assign(date_popup=lambda d: d.date).loc[df.date >= start_date].pipe(
+        writer.write_csv, "fao_fpi_scrolly.csv"
     )
 
 
@@ -186,11 +240,11 @@ def commodity_chart(commodities=None) -> None:
 
     if commodities is None:
         commodities = ["Palm oil", "Sunflower oil", "Maize", "Wheat"]
-    df = get_commodity_prices(commodities)
+    df = data.commodity_prices(commodities)
     (
         df.assign(date_popup=lambda d: d.period)
         .loc[df.period >= "2010-01-01"]
-        .to_csv(f"{config.paths.output}/food_commodity_chart.csv", index=False)
+        .pipe(writer.write_csv, "food_commodity_chart.csv")
     )
 
 
@@ -209,47 +263,149 @@ def index_chart(indexes=None) -> None:
             "Other Food",
             "Fertilizers",
         ]
-    df = get_indices(indexes)
-    df.loc[df.period >= "2010-01-01"].to_csv(
-        f"{config.paths.output}/index_chart.csv", index=False
-    )
+    df = data.indices(indexes)
+    df.loc[df.period >= "2010-01-01"].pipe(writer.write_csv, "index_chart.csv")
+
+
+def price_metrics_chart(start_date: str = "2010-01-01") -> None:
+    """
+    Creates csv with month-on-month and year-on-year changes, rolling averages and
+    rebased values for commodity prices, commodity indices and the FAO Food Price Index
+    (Not Used in main page)
+    """
+
+    df = price_metrics()
+    df.loc[df.period >= start_date].pipe(writer.write_csv, "price_metrics.csv")
 
 
 def ifpri_restriction_chart() -> None:
     """Create trade restriction chart from IFPRI"""
 
-    df = pd.read_csv(f"{config.paths.raw_data}/restrictions_data.csv")
+    df = data.ifpri_restrictions()
     (
         df.rename(
             columns={"Ukraine Crisis [2022]": "Russia's war in Ukraine [2022]"}
-        ).to_csv(f"{config.paths.output}/ifpri_restriction.csv", index=False)
+        ).pipe(writer.write_csv, "ifpri_restriction.csv")
     )
 
 
-def potash_dependence_chart() -> None:
-    """Create potash dependence map"""
+def potash_dependence_chart(
+    fertilizer_list: Optional[list] = None, shard_by: Optional[str] = None
+) -> None:
+    """
+    Create potash dependence map
+        fertilizer_list: fertilizers to include, default = potash
+        shard_by: also write a map per 'continent' or 'UNregion', default = None
+    """
 
-    df = get_fao_fertilizer()
+    df = data.fao_fertilizer(fertilizer_list)
 
     (
         df.pipe(utils.add_flourish_geometries)
-        .loc[:, ["flourish_geom", "iso_code", "country", "dependence"]]
-        .assign(country=lambda d: coco.convert(d.iso_code, to="name_short"))
-        .to_csv(f"{config.paths.output}/potash_map.csv", index=False)
+        .loc[:, [*geometries.columns(), "iso_code", "country", "dependence"]]
+        .assign(
+            country=lambda d: utils.get_country_converter().convert(
+                d.iso_code, to="name_short"
+            )
+        )
+        .pipe(_write_map, "potash_map.csv", shard_by)
     )
 
 
-def update_charts() -> None:
-    """pipileine to update charts for the page"""
+# charts used in the page, in the order they are updated
+PAGE_CHARTS: list = [
+    # fao_fpi_main,
+    live_ipc_charts,
+    stunting_top_countries_bar,
+    food_exp_share_chart,
+    # fao_fpi_scrolly,
+    commodity_chart,
+    ifpri_restriction_chart,
+    potash_dependence_chart,
+]
 
-    # fao_fpi_main()
-    live_ipc_charts()
-    stunting_top_countries_bar()
-    food_exp_share_chart()
-    # fao_fpi_scrolly()
-    commodity_chart()
-    ifpri_restriction_chart()
-    potash_dependence_chart()
+
+RUN_DEADLINE: float = 15 * 60
+RUN_REPORT: str = "run_report.json"
+
+
+def _chart_status(error: Optional[str], used: set, run: sources.Run = None) -> str:
+    if error is not None:
+        return "failed"
+    if run is not None and any(
+        run.sources.get(s, {}).get("status") == "stale" for s in used
+    ):
+        return "stale"
+    return "fresh"
+
+
+def update_chart(chart, run: sources.Run = None) -> dict:
+    """
+    Build a chart and write its files. A chart that fails keeps its previous files
+        run: the active run, used for the status of the chart's sources
+    Returns the status, sources, files, error and build time of the chart
+    """
+
+    error = None
+    start = time.perf_counter()
+    with sources.track() as used, writer.capture() as captured:
+        try:
+            chart()
+        except Exception as e:  # keep the previous files of this chart
+            error = repr(e)
+            print(f"Could not update {chart.__name__}: {error}")
+
+    if error is None:
+        for filename, (df, kwargs) in captured.items():
+            writer.write_csv(df, filename, **kwargs)
+
+    return {
+        "status": _chart_status(error, used, run),
+        "sources": sorted(used),
+        "files": sorted(captured) if error is None else [],
+        "error": error,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def update_charts(
+    compress: bool = False, deadline: float = RUN_DEADLINE, offline: bool = False
+) -> dict:
+    """
+    pipileine to update charts for the page
+        compress: also write gzip/brotli copies of each csv, default = False
+        deadline: seconds for the whole run. Sources that miss their budget or the
+        deadline are read from their last snapshot, and their charts marked as stale
+        offline: read remote sources from their snapshots only, default = False
+
+    The country panel (see scripts.panel) is updated from the same sources.
+    Files are only moved to output at the end of the run. Charts that fail keep
+    their previous files. Returns the run report, also written to output/run_report.json
+    """
+
+    writer.compress = compress
+    charts = {}
+
+    with sources.run(deadline, offline=offline) as run, writer.staged():
+        for chart in PAGE_CHARTS:
+            charts[chart.__name__] = update_chart(chart, run)
+
+        # the panel reuses the sources loaded for the charts
+        panel = update_panel(writer.directory)
+
+        report = run.report() | {"charts": charts, "panel": panel}
+        if geometries.get_mode() == "shared":
+            report["geometries"] = geometries.asset_name()
+        writer.write_json(report, RUN_REPORT)
+        sizes = writer.finish()
+
+    if geometries.get_mode() == "shared":
+        geometries.remove_superseded()
+
+    if not sizes.empty:
+        print(sizes.to_string(index=False))
+
+    return report
 
 
 if __name__ == "__main__":
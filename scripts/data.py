@@ -0,0 +1,254 @@
+"""
+Session-wide access to the clean datasets used by the charts.
+
+`data` loads each dataset on first use and keeps it in memory per parameter set, so
+chart functions and notebooks share one load per session:
+
+    from scripts.data import data
+
+    data.stunting()
+    data.commodity_prices(["Maize", "Wheat"])
+
+Datasets taking a selection (commodities, indices, fertilizers) are loaded once in full
+and sliced per call. A dataset is loaded again when one of the sources it was built
+from is refreshed (see scripts.sources), when config.paths points to another project
+folder, or after `invalidate()`. Datasets are evicted, least recently used
+first, when the total size goes above max_bytes.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Optional
+
+import pandas as pd
+
+from scripts import analysis, config, sources, utils
+from scripts.ipc_data import IPC
+from scripts.undernourishment import Undernourishment
+
+MAX_BYTES: int = 512 * 1024**2
+
+
+def _size(value) -> int:
+    """approximate memory used by a dataset, in bytes"""
+
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum())
+    if hasattr(value, "__dict__"):
+        return sum(_size(v) for v in vars(value).values())
+    return sys.getsizeof(value)
+
+
+@dataclass
+class Entry:
+    value: object
+    versions: dict
+    size: int
+
+    @property
+    def is_current(self) -> bool:
+        """True if no source used by the dataset was refreshed since it was loaded"""
+
+        return all(
+            sources.SOURCES[name].version == version
+            for name, version in self.versions.items()
+        )
+
+
+@dataclass
+class FoodSecurityData:
+    """
+    Memoized loaders for the clean datasets
+        max_bytes: memory cap for the kept datasets, default = 512 MB
+    """
+
+    max_bytes: int = MAX_BYTES
+    _entries: OrderedDict = field(default_factory=OrderedDict, repr=False)
+    _loading: dict = field(default_factory=dict, repr=False)
+    _lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+
+    @cached_property
+    def ipc(self) -> IPC:
+        """shared IPC API client"""
+
+        return IPC()
+
+    def _get(self, name: str, loader, *args, **kwargs):
+        """
+        load a dataset, or return the kept one if its sources did not change
+            name: name of the dataset
+            loader: function loading the dataset, called with args and kwargs
+        """
+
+        # datasets of another project folder (config.paths) are not reused
+        key = (
+            name,
+            repr(args),
+            repr(sorted(kwargs.items())),
+            config.paths.project_dir,
+        )
+        with self._lock:
+            loading = self._loading.setdefault(key, threading.Lock())
+
+        # concurrent calls for the same dataset wait for a single load
+        with loading:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.is_current:
+                    self._entries.move_to_end(key)
+                    sources.mark_used(entry.versions)
+                else:
+                    entry = None
+
+            if entry is None:
+                with sources.track() as used:
+                    value = loader(*args, **kwargs)
+                entry = Entry(
+                    value=value,
+                    versions={s: sources.SOURCES[s].version for s in used},
+                    size=_size(value),
+                )
+                # datasets larger than the cap are returned without being kept
+                if entry.size <= self.max_bytes:
+                    with self._lock:
+                        self._entries[key] = entry
+                        self._evict()
+
+        if isinstance(entry.value, (pd.DataFrame, pd.Series)):
+            return entry.value.copy(deep=False)
+        return entry.value
+
+    def _evict(self) -> None:
+        """drop the least recently used datasets until under max_bytes"""
+
+        while self._entries and self.size > self.max_bytes:
+            self._entries.popitem(last=False)
+
+    @property
+    def size(self) -> int:
+        """memory used by the kept datasets, in bytes"""
+
+        return sum(entry.size for entry in self._entries.values())
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """
+        Drop kept datasets, so they are loaded again on next use
+            name: name of the dataset (e.g. 'stunting'), default = all
+        """
+
+        with self._lock:
+            for key in list(self._entries):
+                if name is None or key[0] == name:
+                    del self._entries[key]
+            for key in list(self._loading):
+                if name is None or key[0] == name:
+                    del self._loading[key]
+
+    def summary(self) -> pd.DataFrame:
+        """kept datasets with their parameters, size and sources"""
+
+        return pd.DataFrame(
+            [
+                {
+                    "dataset": name,
+                    "args": args,
+                    "kwargs": kwargs,
+                    "bytes": entry.size,
+                    "sources": sorted(entry.versions),
+                }
+                for (name, args, kwargs, _), entry in self._entries.items()
+            ],
+            columns=["dataset", "args", "kwargs", "bytes", "sources"],
+        )
+
+    # ==================================================================
+    # Datasets
+    # ==================================================================
+
+    def stunting(self) -> pd.DataFrame:
+        """World Bank stunting prevalence (SH.STA.STNT.ME.ZS)"""
+
+        return self._get("stunting", analysis.get_stunting_wb)
+
+    def wb_indicator(self, code: str, database: int = 2) -> pd.DataFrame:
+        """World Bank indicator (see utils.get_wb_indicator)"""
+
+        return self._get("wb_indicator", utils.get_wb_indicator, code, database)
+
+    def food_price_index(self) -> pd.DataFrame:
+        """FAO Food Price Index"""
+
+        return self._get("food_price_index", analysis.get_food_price_index)
+
+    def ipc_manual(self) -> pd.DataFrame:
+        """IPC data downloaded manually to raw_data/IPC_data.csv"""
+
+        return self._get("ipc_manual", analysis.get_ipc)
+
+    def ipc_ch_data(
+        self, latest: bool = True, only_valid: bool = False
+    ) -> pd.DataFrame:
+        """IPC/CH country table from the IPC API"""
+
+        return self._get(
+            "ipc_ch_data",
+            self.ipc.get_ipc_ch_data,
+            latest=latest,
+            only_valid=only_valid,
+        )
+
+    def usda_food_exp(self) -> pd.DataFrame:
+        """USDA food expenditure share, averaged over 2018-2020"""
+
+        return self._get("usda_food_exp", analysis.get_usda_food_exp)
+
+    def commodity_prices(self, commodities: Optional[list] = None) -> pd.DataFrame:
+        """World Bank commodity prices, all if commodities is None"""
+
+        df = self._get("commodity_prices", analysis.get_commodity_prices, None)
+        if commodities is None:
+            return df
+
+        return df.filter(["period"] + list(commodities))
+
+    def indices(self, indices: Optional[list] = None) -> pd.DataFrame:
+        """World Bank commodity indices, all if indices is None"""
+
+        df = self._get("indices", analysis.get_indices, None)
+        if indices is None:
+            return df
+
+        return df.loc[:, ["period"] + list(indices)]
+
+    def fao_fertilizer(self, fertilizer_list: Optional[list] = None) -> pd.DataFrame:
+        """FAO fertilizer data with net import dependence, default = potash"""
+
+        if fertilizer_list is None:
+            fertilizer_list = ["Nutrient potash K2O (total)"]
+
+        df = self._get("fao_fertilizer", analysis.get_fao_fertilizer, None)
+
+        return df.loc[df.fertiliser.isin(fertilizer_list)]
+
+    def gdp_latest(self, per_capita: bool = False, year: int = 2022) -> pd.DataFrame:
+        """latest IMF WEO GDP (per capita) values"""
+
+        return self._get(
+            "gdp_latest", utils.get_gdp_latest, per_capita=per_capita, year=year
+        )
+
+    def ifpri_restrictions(self) -> pd.DataFrame:
+        """IFPRI trade restrictions, downloaded manually to raw_data"""
+
+        return self._get("ifpri_restrictions", analysis.get_ifpri_restrictions)
+
+    def undernourishment(self):
+        """FAO undernourishment data, indexed (see scripts.undernourishment)"""
+
+        return self._get("undernourishment", Undernourishment)
+
+
+data = FoodSecurityData()
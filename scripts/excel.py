@@ -0,0 +1,101 @@
+"""
+Reading sheets from Excel workbooks (the World Bank CMO and income classification
+workbooks, and the USDA food expenditure workbook).
+
+A workbook is opened once for all the sheets read from it, with the calamine engine
+when python-calamine is installed (optional, much faster) and otherwise openpyxl in
+read-only mode. Only the requested sheets, rows and columns are parsed. Parsed sheets
+are kept in memory by workbook hash, so a workbook downloaded again without changes
+is not parsed again.
+"""
+
+import hashlib
+import importlib.util
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import pandas as pd
+
+ENGINES: tuple = ("calamine", "openpyxl")
+MAX_SHEETS: int = 32
+
+_engine: str = os.environ.get("EXCEL_ENGINE") or (
+    "calamine" if importlib.util.find_spec("python_calamine") else "openpyxl"
+)
+_sheets: OrderedDict = OrderedDict()
+_lock = threading.Lock()
+
+
+def set_engine(name: str) -> None:
+    """Select the engine used to parse workbooks"""
+
+    global _engine
+
+    if name not in ENGINES:
+        raise ValueError(f"{name} is not a valid engine. Use one of {ENGINES}")
+
+    if name == "calamine" and importlib.util.find_spec("python_calamine") is None:
+        raise ImportError("The calamine engine needs python-calamine to be installed")
+
+    _engine = name
+
+
+def get_engine() -> str:
+    return _engine
+
+
+def workbook_hash(workbook: bytes) -> str:
+    return hashlib.sha1(workbook).hexdigest()
+
+
+def read_sheets(workbook: bytes, sheets: list, **options) -> dict:
+    """
+    Read sheets from a workbook, opening it once
+        workbook: content of the xlsx file
+        sheets: names of the sheets to read
+        options: pandas parsing options applied to every sheet (header, skiprows,
+        usecols, nrows...)
+    Returns a dict of sheet name: dataframe
+    """
+
+    digest = workbook_hash(workbook)
+    keys = {s: (digest, s, _engine, repr(sorted(options.items()))) for s in sheets}
+
+    with _lock:
+        result = {s: _sheets[k] for s, k in keys.items() if k in _sheets}
+        for key in keys.values():
+            if key in _sheets:
+                _sheets.move_to_end(key)
+
+    missing = [s for s in sheets if s not in result]
+    if missing:
+        with pd.ExcelFile(BytesIO(workbook), engine=_engine) as file:
+            parsed = {s: file.parse(s, **options) for s in missing}
+
+        with _lock:
+            for sheet, df in parsed.items():
+                _sheets[keys[sheet]] = df
+            while len(_sheets) > MAX_SHEETS:
+                _sheets.popitem(last=False)
+        result |= parsed
+
+    return {s: result[s].copy(deep=False) for s in sheets}
+
+
+def read_sheet(workbook: bytes, sheet: str, **options) -> pd.DataFrame:
+    """
+    Read a sheet from a workbook (see read_sheets)
+        workbook: content of the xlsx file
+        sheet: name of the sheet
+    """
+
+    return read_sheets(workbook, [sheet], **options)[sheet]
+
+
+def clear() -> None:
+    """Drop the parsed sheets"""
+
+    with _lock:
+        _sheets.clear()
@@ -0,0 +1,141 @@
+"""
+Country geometries (polygons) for the Flourish maps.
+
+In the default "embed" mode, every map csv carries the polygon of each country in a
+flourish_geom column. In the "shared" mode (`set_mode("shared")` or the MAP_GEOMETRIES
+environment variable), map csvs only carry iso codes and data, and the polygons are
+written once to output/flourish_geometries_<version>.csv, where the version is a hash
+of the glossary file. The asset is only written again when the glossary changes, which
+removes the assets of previous versions, and the run report (output/run_report.json)
+names the current one.
+"""
+
+import hashlib
+import os
+
+import pandas as pd
+
+from scripts import config, sources
+from scripts.output import writer
+
+MODES: tuple = ("embed", "shared")
+GLOSSARY: str = "flourish_geometries_world.json"
+GEOMETRY_COLUMN: str = "flourish_geom"
+
+_mode: str = os.environ.get("MAP_GEOMETRIES", "embed")
+
+
+def set_mode(name: str) -> None:
+    """Select whether maps embed their geometries or share a single asset"""
+
+    global _mode
+
+    if name not in MODES:
+        raise ValueError(f"{name} is not a valid mode. Use one of {MODES}")
+
+    _mode = name
+
+
+def get_mode() -> str:
+    return _mode
+
+
+@sources.cached("flourish_geometries")
+def geometries() -> pd.DataFrame:
+    """Polygon of each country (flourish_geom, iso_code), from the glossary"""
+
+    g = pd.read_json(os.path.join(config.paths.glossaries, GLOSSARY))
+
+    return (
+        g.rename(columns={g.columns[0]: GEOMETRY_COLUMN, g.columns[1]: "iso_code"})
+        .iloc[1:]
+        .drop_duplicates(subset="iso_code", keep="first")
+        .reset_index(drop=True)
+    )
+
+
+@sources.cached("flourish_geometries")
+def version() -> str:
+    """hash of the glossary file"""
+
+    with open(os.path.join(config.paths.glossaries, GLOSSARY), "rb") as file:
+        return hashlib.sha1(file.read()).hexdigest()[:12]
+
+
+def asset_name(shard: str = None, grouping: str = None) -> str:
+    """
+    file name of the shared geometry asset for the current glossary
+        shard: name of the region, for the assets of region shards
+        grouping: grouping of the shards (e.g. 'continent'), as regions may share a name
+    """
+
+    suffix = "".join(f"_{part}" for part in (grouping, shard) if part)
+    return f"flourish_geometries_{version()}{suffix}.csv"
+
+
+def remove_superseded() -> list:
+    """
+    Remove the assets of previous glossary versions, and their compressed copies,
+    from the output folder. Returns the removed file names
+    """
+
+    current = f"flourish_geometries_{version()}"
+    removed = [
+        filename
+        for filename in os.listdir(config.paths.output)
+        if filename.startswith("flourish_geometries_")
+        and not (
+            filename.startswith(f"{current}_") or filename.startswith(f"{current}.")
+        )
+    ]
+    for filename in removed:
+        os.remove(os.path.join(config.paths.output, filename))
+
+    return removed
+
+
+def write_asset(iso_codes=None, shard: str = None, grouping: str = None) -> str:
+    """
+    Write the geometry asset, unless it is already in output. Returns its name.
+    Assets of previous versions are removed once the new one is in output (at the
+    end of a staged run, see charts.update_charts)
+        iso_codes: countries to include, default = all
+        shard: name of the region, for the assets of region shards
+        grouping: grouping of the shards, e.g. 'continent'
+    """
+
+    name = asset_name(shard, grouping)
+    if not any(
+        os.path.exists(os.path.join(folder, name))
+        for folder in (config.paths.output, writer.directory)
+    ):
+        g = geometries()
+        if iso_codes is not None:
+            g = g.loc[g.iso_code.isin(iso_codes)].reset_index(drop=True)
+        writer.write_csv(g, name)
+        if writer.directory == config.paths.output:
+            remove_superseded()
+
+    return name
+
+
+def columns() -> list:
+    """geometry columns of a map csv in the current mode"""
+
+    return [GEOMETRY_COLUMN] if _mode == "embed" else []
+
+
+def add_geometries(df: pd.DataFrame, key_column_name: str = "iso_code") -> pd.DataFrame:
+    """
+    One row per country of the geometries glossary, with the data of df. In the
+    "shared" mode, the polygons are left out and written to the shared asset instead
+        df: DataFrame to add geometries to
+        key_column_name: name of column with iso3 codes to merge on
+    """
+
+    g = geometries().rename(columns={"iso_code": key_column_name})
+    if _mode == "shared":
+        write_asset()
+        g = g.loc[:, [key_column_name]]
+
+    return pd.merge(g, df, on=key_column_name, how="left")
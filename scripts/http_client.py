@@ -0,0 +1,411 @@
+"""Shared HTTP client used to download data from all remote sources"""
+
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+from functools import cached_property
+from typing import Optional
+from urllib.parse import urlsplit
+
+import pandas as pd
+
+CONNECT_TIMEOUT: float = 10
+READ_TIMEOUT: float = 120
+MAX_RETRIES: int = 3
+BACKOFF: float = 1.0  # base in seconds for exponential backoff with full jitter
+MAX_CONCURRENCY: int = 8
+POOL_SIZE: int = 4  # keep-alive connections per host
+RETRY_STATUS: set = {429, 500, 502, 503, 504}
+SEGMENTS: int = 4  # parallel Range requests per file
+MIN_SEGMENT_SIZE: int = 8 * 1024**2
+CHUNK_SIZE: int = 1 << 20
+IDENTITY: dict = {"Accept-Encoding": "identity"}  # byte ranges of the file itself
+
+# Set to e.g. "http://127.0.0.1:8000" to send every request to a local stand-in server.
+# URLs are then rewritten as {SOURCE_MIRROR}/{host}/{path}?{query}
+SOURCE_MIRROR: Optional[str] = os.environ.get("SOURCE_MIRROR")
+
+
+@dataclass
+class HostStats:
+    """Request counters for a single host"""
+
+    requests: int = 0
+    retries: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+
+@dataclass
+class HttpClient:
+    """
+    Pooled HTTP client with timeouts, jittered retries, a global concurrency limit
+    and per-host byte/latency counters
+        mirror: base url of a stand-in server that replaces every remote host
+    """
+
+    mirror: Optional[str] = None
+    connect_timeout: float = CONNECT_TIMEOUT
+    read_timeout: float = READ_TIMEOUT
+    max_retries: int = MAX_RETRIES
+    backoff: float = BACKOFF
+    max_concurrency: int = MAX_CONCURRENCY
+    headers: dict = field(default_factory=lambda: {"User-Agent": "Mozilla/5.0"})
+
+    def __post_init__(self):
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self._stats: dict[str, HostStats] = {}
+
+    @cached_property
+    def session(self):
+        """requests session, created on first use to keep imports fast"""
+
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        return session
+
+    @property
+    def timeout(self) -> tuple:
+        return self.connect_timeout, self.read_timeout
+
+    def resolve(self, url: str) -> str:
+        """Rewrite a url to point to the mirror, if one is set"""
+
+        if self.mirror is None:
+            return url
+
+        parts = urlsplit(url)
+        query = f"?{parts.query}" if parts.query else ""
+        return f"{self.mirror.rstrip('/')}/{parts.netloc}{parts.path}{query}"
+
+    def _record(self, url: str, **counts) -> None:
+        host = urlsplit(url).netloc
+        with self._lock:
+            stats = self._stats.setdefault(host, HostStats())
+            for name, value in counts.items():
+                setattr(stats, name, getattr(stats, name) + value)
+
+    def _sleep(self, attempt: int) -> None:
+        time.sleep(random.uniform(0, self.backoff * 2**attempt))
+
+    def get(self, url: str, *, stream: bool = False, **kwargs):
+        """
+        GET a url, retrying connection errors, timeouts and retryable status codes.
+        Returns a requests.Response
+            url: original url of the source. It is rewritten if a mirror is set
+            stream: do not read the body. Bytes are then not counted, and the response
+            holds a concurrency slot until it is closed (use it as a context manager)
+        """
+
+        return self._request("GET", url, stream=stream, **kwargs)
+
+    def head(self, url: str, **kwargs):
+        """HEAD a url, with the same retries as get. Returns a requests.Response"""
+
+        kwargs.setdefault("allow_redirects", True)
+        return self._request("HEAD", url, **kwargs)
+
+    def _request(self, method: str, url: str, *, stream: bool = False, **kwargs):
+        import requests
+
+        target = self.resolve(url)
+        kwargs.setdefault("timeout", self.timeout)
+
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            # a streamed response keeps its slot until it is closed (see _hold_slot)
+            self._slots.acquire()
+            try:
+                response = self.session.request(method, target, stream=stream, **kwargs)
+                if not stream:
+                    _ = response.content
+            except (requests.ConnectionError, requests.Timeout):
+                self._slots.release()
+                if attempt == self.max_retries:
+                    raise
+                self._record(url, retries=1)
+                self._sleep(attempt)
+                continue
+            except BaseException:
+                self._slots.release()
+                raise
+
+            if stream:
+                self._hold_slot(response)
+            else:
+                self._slots.release()
+
+            self._record(
+                url,
+                requests=1,
+                seconds=time.perf_counter() - start,
+                bytes=0 if stream else len(response.content),
+            )
+            if response.status_code in RETRY_STATUS and attempt < self.max_retries:
+                response.close()
+                self._record(url, retries=1)
+                self._sleep(attempt)
+                continue
+
+            try:
+                response.raise_for_status()
+            except requests.HTTPError:
+                response.close()
+                raise
+            return response
+
+    def _hold_slot(self, response) -> None:
+        """release the concurrency slot of a streamed response when it is closed"""
+
+        close, released = response.close, threading.Lock()
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                if released.acquire(blocking=False):  # only on the first close
+                    self._slots.release()
+
+        response.close = close_and_release
+
+    def read_bytes(self, url: str, **kwargs) -> BytesIO:
+        """Download a file into memory, to be passed to pandas readers"""
+
+        return BytesIO(self.get(url, **kwargs).content)
+
+    def download(self, path: str, url: str) -> None:
+        """Download a url to a file. Argument order matches weo.download's fetch"""
+
+        self.download_file(url, path)
+
+    def download_file(
+        self,
+        url: str,
+        path: str,
+        segments: int = SEGMENTS,
+        sha256: str = None,
+        min_segment_size: int = MIN_SEGMENT_SIZE,
+    ) -> str:
+        """
+        Download a url to a file, in parallel segments (HTTP Range requests) when the
+        server supports them. Data is written to {path}.part, with the progress of each
+        segment in {path}.part.json, so an interrupted download resumes where it stopped
+        on the next call. The file is checked against the expected size and checksum,
+        and only then moved to path
+            segments: maximum number of parallel segments
+            sha256: expected checksum of the file, not checked if None
+            min_segment_size: files are not split into segments smaller than this
+        Returns the path
+        """
+
+        import requests
+
+        part, state_path = f"{path}.part", f"{path}.part.json"
+
+        try:
+            headers = self.head(url, headers=IDENTITY).headers
+        except requests.HTTPError:  # servers that do not answer HEAD requests
+            headers = {}
+        size = int(headers.get("Content-Length", 0))
+        validator = headers.get("ETag") or headers.get("Last-Modified")
+
+        if headers.get("Accept-Ranges") == "bytes" and size > 0:
+            state = _read_state(state_path)
+            if (
+                state is None
+                or (state["size"], state["validator"]) != (size, validator)
+                or not os.path.exists(part)
+            ):
+                count = max(1, min(segments, math.ceil(size / min_segment_size)))
+                bounds = [size * i // count for i in range(count + 1)]
+                state = {
+                    "size": size,
+                    "validator": validator,
+                    "segments": [
+                        {"start": start, "end": end - 1, "done": 0}
+                        for start, end in zip(bounds[:-1], bounds[1:])
+                    ],
+                }
+                with open(part, "wb") as file:
+                    file.truncate(size)
+            self._download_segments(url, part, state, state_path)
+        else:
+            state = None
+            self._download_stream(url, part)
+            size = size or os.path.getsize(part)
+
+        if state is not None and not all(_complete(s) for s in state["segments"]):
+            raise ConnectionError(f"{url} was not fully downloaded, {part} is kept")
+
+        try:
+            _verify(part, size, sha256)
+        except ValueError:
+            for file in (part, state_path):
+                if os.path.exists(file):
+                    os.remove(file)
+            raise
+
+        os.replace(part, path)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+
+        return path
+
+    def _download_stream(self, url: str, path: str) -> None:
+        """stream a url to a file in a single request"""
+
+        size = 0
+        with self.get(url, stream=True) as response, open(path, "wb") as file:
+            start = time.perf_counter()
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                file.write(chunk)
+                size += len(chunk)
+        self._record(url, bytes=size, seconds=time.perf_counter() - start)
+
+    def _download_segments(
+        self, url: str, part: str, state: dict, state_path: str
+    ) -> None:
+        """download the unfinished segments of a file in parallel"""
+
+        lock = threading.Lock()
+
+        def save():
+            with lock:
+                _write_state(state_path, state)
+
+        pending = [s for s in state["segments"] if s["start"] + s["done"] <= s["end"]]
+        save()
+        with ThreadPoolExecutor(max_workers=max(1, len(pending))) as pool:
+            for future in [
+                pool.submit(self._download_segment, url, part, s, save) for s in pending
+            ]:
+                future.result()
+
+    def _download_segment(self, url: str, part: str, segment: dict, save) -> None:
+        """
+        download a byte range into its place in the .part file. After a broken
+        connection (a retry) or a short response that added bytes, the rest of the
+        range is requested again
+        """
+
+        import requests
+
+        attempt = 0
+        while segment["start"] + segment["done"] <= segment["end"]:
+            offset = segment["start"] + segment["done"]
+            done = segment["done"]
+            try:
+                headers = {"Range": f"bytes={offset}-{segment['end']}", **IDENTITY}
+                with self.get(url, stream=True, headers=headers) as response:
+                    if response.status_code != 206:
+                        raise ValueError(f"{url} ignored the Range request")
+                    first, last = _content_range(response.headers)
+                    if first != offset or last > segment["end"]:
+                        raise ValueError(
+                            f"{url} sent bytes {first}-{last} for a request of "
+                            f"bytes {offset}-{segment['end']}"
+                        )
+                    with open(part, "r+b") as file:
+                        file.seek(offset)
+                        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                            chunk = chunk[
+                                : last + 1 - segment["start"] - segment["done"]
+                            ]
+                            file.write(chunk)
+                            segment["done"] += len(chunk)
+                            save()
+                            self._record(url, bytes=len(chunk))
+                error = None
+            except requests.RequestException as e:
+                error = e
+
+            if error is None and segment["done"] > done:
+                continue
+            if attempt == self.max_retries:
+                if error is not None:
+                    raise error
+                raise ConnectionError(
+                    f"{url} sent no data for bytes {offset}-{segment['end']}"
+                )
+            attempt += 1
+            self._record(url, retries=1)
+            self._sleep(attempt - 1)
+
+    def stats(self) -> pd.DataFrame:
+        """Counters per host, as a dataframe"""
+
+        with self._lock:
+            rows = [{"host": host} | vars(s) for host, s in self._stats.items()]
+        return pd.DataFrame(
+            rows, columns=["host", "requests", "retries", "bytes", "seconds"]
+        )
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = {}
+
+
+def _read_state(path: str) -> Optional[dict]:
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_state(path: str, state: dict) -> None:
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(state, file)
+    os.replace(f"{path}.tmp", path)
+
+
+def _content_range(headers) -> tuple:
+    """first and last byte of a 206 response, from its Content-Range header"""
+
+    match = re.fullmatch(
+        r"bytes (\d+)-(\d+)/(\d+|\*)", headers.get("Content-Range", "")
+    )
+    if match is None:
+        raise ValueError(f"Invalid Content-Range: {headers.get('Content-Range')}")
+
+    return int(match.group(1)), int(match.group(2))
+
+
+def _complete(segment: dict) -> bool:
+    return segment["done"] == segment["end"] - segment["start"] + 1
+
+
+def _verify(path: str, size: int, sha256: Optional[str]) -> None:
+    """raise ValueError if a file does not have the expected size or checksum"""
+
+    if os.path.getsize(path) != size:
+        raise ValueError(f"{path} has {os.path.getsize(path)} bytes, expected {size}")
+
+    if sha256 is None:
+        return
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    if digest.hexdigest() != sha256:
+        raise ValueError(f"{path} does not match the expected sha256 checksum")
+
+
+client = HttpClient(mirror=SOURCE_MIRROR)
@@ -1,13 +1,16 @@
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
 
 from dateutil.relativedelta import relativedelta
 
+import numpy as np
 import pandas as pd
-import requests
-from country_converter import convert
+
+from scripts import config, parsers, sources, utils
+from scripts.http_client import client
 
 BASE_URL: str = "https://api.ipcinfo.org/"
 WEB_URL: str = "https://fsr2av3qi2.execute-api.us-east-1.amazonaws.com/ch/"
@@ -15,27 +18,174 @@ WEB_URL: str = "https://fsr2av3qi2.execute-api.us-east-1.amazonaws.com/ch/"
 IPC_VALIDITY = -3
 CH_VALIDITY = -5
 
+AREA_VARIABLES: list = (
+    [
+        "analysis_id",
+        "area_id",
+        "area",
+        "country",
+        "year",
+        "analysis_date",
+        "current_period_dates",
+        "projected_period_dates",
+        "estimated_population",
+    ]
+    + [f"phase{n}_population" for n in range(1, 6)]
+    + [f"phase{n}_population_projected" for n in range(1, 6)]
+)
+AREAS_FOLDER: str = "ipc_areas"
+# AREA_VARIABLES not listed are populations (integers)
+AREA_TYPES: dict = {
+    "area": "string",
+    "country": "string",
+    "analysis_date": "string",
+    "current_period_dates": "string",
+    "projected_period_dates": "string",
+}
+MAX_WORKERS: int = 4
+
+
+@sources.cached("ipc")
+def _get_json(url: str):
+    """json response of an IPC API request"""
+
+    return client.get(url).json()
+
+
+def _flatten_population(data: list, variables: list, wide: bool = False):
+    """
+    Flatten a list of population records in a single pass.
+    Returns a long (indicator, value, country) table, or one row per record if wide=True
+    """
+    columns = {v: [record.get(v) for record in data] for v in variables}
+
+    if wide:
+        return pd.DataFrame(columns)
+
+    indicators = [v for v in variables if v != "country"]
+    values = np.empty((len(data), len(indicators)), dtype=object)
+    for i, indicator in enumerate(indicators):
+        values[:, i] = columns[indicator]
+
+    return pd.DataFrame(
+        {
+            "indicator": np.tile(indicators, len(data)),
+            "value": values.ravel(),
+            "country": np.repeat(
+                np.array(columns["country"], dtype=object), len(indicators)
+            ),
+        }
+    )
+
+
+def _area_records(data: list):
+    """
+    area records from an areas response. Analyses with nested areas are expanded,
+    with the analysis fields added to each area
+    """
+
+    for analysis in data:
+        if "areas" in analysis:
+            fields = {k: v for k, v in analysis.items() if k != "areas"}
+            fields["analysis_id"] = analysis.get("id", analysis.get("analysis_id"))
+            areas = analysis["areas"]
+        else:
+            fields, areas = {}, [analysis]
+
+        for area in areas:
+            record = fields | area
+            record.setdefault("area_id", area.get("id"))
+            record.setdefault("area", area.get("name", area.get("title")))
+            yield record
+
+
+def write_areas(df: pd.DataFrame, directory: str = None) -> None:
+    """
+    Write subnational IPC areas to a parquet store partitioned by country and year.
+    Partitions present in df replace the stored ones, others are kept
+        directory: store folder, default = raw_data/ipc_areas
+    """
+
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    if directory is None:
+        directory = os.path.join(config.paths.raw_data, AREAS_FOLDER)
+
+    schema, partitioning = _area_schema()
+    df = df.reindex(columns=schema.names)
+    df = df.assign(
+        **{
+            name: pd.to_numeric(df[name])
+            for name in schema.names
+            if pa.types.is_integer(schema.field(name).type)
+        }
+    )
+
+    ds.write_dataset(
+        pa.Table.from_pandas(df, schema=schema, preserve_index=False),
+        directory,
+        format="parquet",
+        partitioning=partitioning,
+        existing_data_behavior="delete_matching",
+    )
+
 
-def _build_country_df(data: dict, variables: list):
-    """Take dictionary and build dataframe"""
-    return (
-        pd.DataFrame.from_dict(data, orient="index", columns=["value"])
-        .loc[variables]
-        .reset_index()
-        .rename(columns={"index": "indicator"})
-        .assign(country=lambda d: d.loc[d.indicator == "country", "value"][0])
-        .loc[lambda d: d.indicator != "country"]
-        .reset_index(drop=True)
+def _area_schema() -> tuple:
+    """
+    fixed schema of the areas store, and its partitioning, so that partitions with
+    only missing values in a column can be read with the others
+    """
+
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    types = {"string": pa.string(), "integer": pa.int64()}
+    schema = pa.schema(
+        [(v, types[AREA_TYPES.get(v, "integer")]) for v in AREA_VARIABLES]
+    )
+    partitioning = ds.partitioning(
+        pa.schema([schema.field("country"), schema.field("year")]), flavor="hive"
+    )
+
+    return schema, partitioning
+
+
+def read_areas(
+    countries: list = None, years: list = None, directory: str = None
+) -> pd.DataFrame:
+    """
+    Read subnational IPC areas from the partitioned store. Only the partitions of
+    the requested countries and years are read
+        countries: iso2 codes, default = all
+        years: analysis years, default = all
+        directory: store folder, default = raw_data/ipc_areas
+    """
+
+    import pyarrow.dataset as ds
+
+    if directory is None:
+        directory = os.path.join(config.paths.raw_data, AREAS_FOLDER)
+
+    schema, partitioning = _area_schema()
+    dataset = ds.dataset(
+        directory, schema=schema, format="parquet", partitioning=partitioning
     )
 
+    condition = None
+    for column, values in (("country", countries), ("year", years)):
+        if values is not None:
+            values = [int(v) for v in values] if column == "year" else list(values)
+            clause = ds.field(column).isin(values)
+            condition = clause if condition is None else condition & clause
+
+    return dataset.to_table(filter=condition).to_pandas()
+
 
 def _build_table(data: list):
     """Build a table on IPC levels for all available countries"""
-    # Empty dataframe to hold data
-    df = pd.DataFrame()
-
-    for r, country in enumerate(data):
-        data_: dict = {
+    rows = [
+        {
             "iso2": country["country"],
             "from_date": country["from"],
             "to_date": country["to"],
@@ -48,13 +198,16 @@ def _build_table(data: list):
             "phase_5": country["phases"][4]["population"],
             "condition": country["condition"],
         }
-        df = pd.concat([df, pd.DataFrame(data_, index=[r])], ignore_index=False)
+        for country in data
+    ]
 
+    df = pd.DataFrame(rows)
+    cc = utils.get_country_converter()
     df = df.assign(
-        country_name=convert(df.iso2, to="name_short", not_found=None),
-        iso_code=convert(df.iso2, to="ISO3", not_found=None),
-        from_date=pd.to_datetime(df.from_date, format="%b %Y"),
-        to_date=pd.to_datetime(df.to_date, format="%b %Y"),
+        country_name=cc.convert(df.iso2, to="name_short", not_found=None),
+        iso_code=cc.convert(df.iso2, to="ISO3", not_found=None),
+        from_date=parsers.parse_dates(df.from_date, format="%b %Y"),
+        to_date=parsers.parse_dates(df.to_date, format="%b %Y"),
     )
     return df
 
@@ -84,7 +237,7 @@ class IPC:
     def get_website_table(self) -> list:
 
         url = self._get_web_url()
-        return requests.get(url).json()
+        return _get_json(url)
 
     def get_ipc_ch_data(
         self, latest: bool = True, only_valid: bool = False
@@ -137,9 +290,16 @@ class IPC:
         )
 
     def get_population(
-        self, start_year: int = 2022, end_year: int = 2022, countries: list = None
-    ) -> json:
-        """Get IPC classification population data"""
+        self,
+        start_year: int = 2022,
+        end_year: int = 2022,
+        countries: list = None,
+        wide: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Get IPC classification population data
+            wide: return one row per record instead of a long (indicator, value, country) table
+        """
 
         raw_data: list = []
 
@@ -153,7 +313,7 @@ class IPC:
                     country=country,
                 )
                 try:
-                    raw_data.append(*requests.get(url).json())
+                    raw_data.append(*_get_json(url))
                 except json.decoder.JSONDecodeError:
                     print(f"Data for {country} is not available")
 
@@ -161,21 +321,60 @@ class IPC:
             url = self._get_request_url(
                 call_type="population", format="json", start=start_year, end=end_year
             )
-            _ = requests.get(url).json()
+            _ = _get_json(url)
             for c in _:
                 raw_data.append(c)
 
-        # Empty dataframe to hold results
-        df = pd.DataFrame()
-
         # Analysis variables
         variables: list = ["country", "projected_period_dates", "population"] + [
             f"phase{n}_population_projected" for n in range(1, 6)
         ]
 
-        for _ in raw_data:
-            _ = _build_country_df(data=_, variables=variables)
-            df = pd.concat([_, df], ignore_index=True)
+        return _flatten_population(data=raw_data, variables=variables, wide=wide)
+
+    def _get_areas_page(self, country: str, year: int) -> list:
+        """
+        area records for one country and year, empty if not available.
+        Not kept in memory by scripts.sources: the partitioned store keeps the results
+        """
+
+        url = self._get_request_url(
+            call_type="areas", format="json", country=country, year=year
+        )
+        try:
+            return list(_area_records(client.get(url).json()))
+        except json.decoder.JSONDecodeError:
+            print(f"Area data for {country} {year} is not available")
+            return []
+
+    def get_areas(
+        self,
+        countries: list,
+        years: list,
+        store: bool = True,
+        max_workers: int = MAX_WORKERS,
+    ) -> pd.DataFrame:
+        """
+        Get subnational (area level) IPC analyses, one request per country and year
+            countries: iso2 codes
+            years: analysis years
+            store: write the results to the partitioned store (see write_areas)
+            max_workers: maximum number of concurrent requests
+        """
+
+        pages = [(country, year) for country in countries for year in years]
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = pool.map(lambda page: self._get_areas_page(*page), pages)
+            records = [
+                record | {"country": country, "year": int(year)}
+                for (country, year), page in zip(pages, results)
+                for record in page
+            ]
+
+        df = _flatten_population(data=records, variables=AREA_VARIABLES, wide=True)
+
+        if store and not df.empty:
+            write_areas(df)
 
         return df
 
@@ -0,0 +1,256 @@
+"""Writer for csv files in the output folder, with optional precompressed copies"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Optional
+
+import pandas as pd
+
+from scripts import config
+
+try:
+    import brotli
+except ImportError:  # brotli copies are skipped if the package is not installed
+    brotli = None
+
+GZIP_LEVEL: int = 9
+BROTLI_QUALITY: int = 11
+MANIFEST: str = ".compressed.json"
+STAGING_PREFIX: str = ".staging_"
+STAGING_MAX_AGE: float = 24 * 3600  # seconds, staging folders of killed runs
+
+
+def _file_hash(data: bytes) -> str:
+    """sha256 hash of file contents"""
+
+    return hashlib.sha256(data).hexdigest()
+
+
+def compress_file(
+    path: str, previous: Optional[dict] = None, published: Optional[str] = None
+) -> dict:
+    """
+    Writes gzip and brotli siblings (path.gz, path.br) of a file.
+    If the hash of the file matches the previous entry and the siblings exist,
+    nothing is regenerated.
+        path: path to the file to compress
+        previous: manifest entry from the previous run
+        published: path of the published file, if path is a staged copy of it.
+        Its siblings are kept when the file has not changed
+    """
+
+    with open(path, "rb") as file:
+        data = file.read()
+
+    entry = {"hash": _file_hash(data), "csv_bytes": len(data)}
+    existing = published or path
+    targets = [f"{existing}.gz"] + ([f"{existing}.br"] if brotli is not None else [])
+
+    if (
+        previous is not None
+        and previous.get("hash") == entry["hash"]
+        and all(os.path.exists(t) for t in targets)
+    ):
+        return previous | {"regenerated": False}
+
+    # mtime=0 keeps the gzip output identical for identical inputs
+    with open(f"{path}.gz", "wb") as file:
+        file.write(gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0))
+    entry["gzip_bytes"] = os.path.getsize(f"{path}.gz")
+
+    if brotli is not None:
+        with open(f"{path}.br", "wb") as file:
+            file.write(brotli.compress(data, quality=BROTLI_QUALITY))
+        entry["brotli_bytes"] = os.path.getsize(f"{path}.br")
+
+    return entry | {"regenerated": True}
+
+
+@dataclass
+class OutputWriter:
+    """
+    Writes chart csv files to the output folder.
+    When compress is True, gzip/brotli copies are produced in a worker pool
+    so that compression runs alongside the rest of the pipeline.
+    Inside `capture()`, dataframes are collected in memory instead (see scripts.serve).
+    Inside `staged()`, files are written to a staging folder and only moved to the
+    output folder at the end, so that a failed run never leaves output half-updated.
+    """
+
+    compress: bool = False
+    max_workers: int = 2
+    _pool: Optional[ThreadPoolExecutor] = field(default=None, repr=False)
+    _futures: dict = field(default_factory=dict, repr=False)
+    _manifest: Optional[dict] = field(default=None, repr=False)
+    _local: threading.local = field(default_factory=threading.local, repr=False)
+    _staging: Optional[str] = field(default=None, repr=False)
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(config.paths.output, MANIFEST)
+
+    @property
+    def directory(self) -> str:
+        """folder files are written to: the staging folder, if any, or output"""
+
+        return self._staging or config.paths.output
+
+    def _remove_leftover_staging(self) -> None:
+        """remove staging folders older than STAGING_MAX_AGE, left by killed runs"""
+
+        parent = os.path.dirname(config.paths.output)
+        for folder in (parent, config.paths.output):
+            for entry in os.scandir(folder):
+                if (
+                    entry.is_dir()
+                    and entry.name.startswith(STAGING_PREFIX)
+                    and time.time() - entry.stat().st_mtime > STAGING_MAX_AGE
+                ):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+
+    def _load_manifest(self) -> dict:
+        if self._manifest is None:
+            try:
+                with open(self.manifest_path) as file:
+                    self._manifest = json.load(file)
+            except FileNotFoundError:
+                self._manifest = {}
+        return self._manifest
+
+    def _submit(self, path: str) -> None:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+
+        filename = os.path.basename(path)
+        previous = self._load_manifest().get(filename)
+        published = None
+        if self._staging is not None:
+            published = os.path.join(config.paths.output, filename)
+
+        self._futures[filename] = self._pool.submit(
+            compress_file, path, previous, published
+        )
+
+    def write_csv(self, df: pd.DataFrame, filename: str, **kwargs) -> None:
+        """
+        Write a dataframe to the output folder
+            df: dataframe to write
+            filename: name of the file in the output folder, e.g. 'potash_map.csv'
+        """
+
+        captured = getattr(self._local, "captured", None)
+        if captured is not None:
+            captured[filename] = (df.copy(deep=False), kwargs)
+            return
+
+        path = os.path.join(self.directory, filename)
+        df.to_csv(path, index=False, **kwargs)
+
+        if self.compress:
+            self._submit(path)
+
+    def write_json(self, data, filename: str) -> None:
+        """Write json data (e.g. a run report) to the output folder"""
+
+        with open(os.path.join(self.directory, filename), "w") as file:
+            json.dump(data, file, indent=2, default=str)
+
+    @contextmanager
+    def capture(self):
+        """
+        Collect the files written in the block (in this thread) instead of writing them.
+        Yields a dict of filename: (dataframe, to_csv keyword arguments)
+        """
+
+        previous = getattr(self._local, "captured", None)
+        self._local.captured = {}
+        try:
+            yield self._local.captured
+        finally:
+            self._local.captured = previous
+
+    @contextmanager
+    def staged(self):
+        """
+        Write files to a staging folder in the block. If the block completes, the files
+        (and the compression manifest) replace those in the output folder; if it raises,
+        they are discarded. The staging folder is next to output, so that a killed run
+        does not leave it inside output. Staging folders left by killed runs are removed
+        """
+
+        self._remove_leftover_staging()
+        self._manifest = None  # read again from output, e.g. after a failed run
+        self._staging = tempfile.mkdtemp(
+            prefix=STAGING_PREFIX, dir=os.path.dirname(config.paths.output)
+        )
+        try:
+            yield self._staging
+            self.finish()
+            for filename in sorted(os.listdir(self._staging)):
+                os.replace(
+                    os.path.join(self._staging, filename),
+                    os.path.join(config.paths.output, filename),
+                )
+        finally:
+            if self._pool is not None:  # compression jobs of a failed block
+                self._pool.shutdown(cancel_futures=True)
+                self._pool, self._futures = None, {}
+            shutil.rmtree(self._staging, ignore_errors=True)
+            self._staging = None
+            self._manifest = None
+
+    def finish(self) -> pd.DataFrame:
+        """
+        Wait for pending compression jobs, update the manifest and
+        return a size report for the compressed files
+        """
+
+        if not self._futures:
+            return pd.DataFrame()
+
+        manifest = self._load_manifest()
+        futures: dict[str, Future] = self._futures
+        entries = {filename: future.result() for filename, future in futures.items()}
+
+        for filename, entry in entries.items():
+            manifest[filename] = {k: v for k, v in entry.items() if k != "regenerated"}
+
+        # staged manifests are moved to output with the files they describe
+        with open(os.path.join(self.directory, MANIFEST), "w") as file:
+            json.dump(manifest, file, indent=2, sort_keys=True)
+
+        self._futures = {}
+        self._pool.shutdown()
+        self._pool = None
+
+        return size_report(entries)
+
+
+def size_report(entries: dict) -> pd.DataFrame:
+    """Summarise compressed sizes per file from manifest entries"""
+
+    report = (
+        pd.DataFrame.from_dict(entries, orient="index")
+        .rename_axis("file")
+        .reset_index()
+        .drop(columns="hash")
+        .sort_values("csv_bytes", ascending=False)
+        .reset_index(drop=True)
+    )
+    report["gzip_ratio"] = report.gzip_bytes / report.csv_bytes
+    if "brotli_bytes" in report.columns:
+        report["brotli_ratio"] = report.brotli_bytes / report.csv_bytes
+
+    return report
+
+
+writer = OutputWriter()
@@ -0,0 +1,278 @@
+"""
+Country-level food security panel: one row per country (iso_code) with the latest
+IPC phases, stunting, GDP per capita, income level, food expenditure share and
+potash dependence.
+
+The panel is built from components, one per indicator group. Each component records
+the versions of the sources it was built from (see scripts.sources), so `update()`
+only rebuilds the components whose sources were refreshed. The panel is saved as
+parquet (output/country_panel.parquet) for fast loading.
+"""
+
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from scripts import config, sources, utils
+from scripts.data import data
+
+PANEL_FILE: str = "country_panel.parquet"
+METADATA_KEY: bytes = b"food_security_panel"
+
+
+# ==================================================================
+# Components: functions returning one row per iso_code
+# ==================================================================
+
+
+def _ipc() -> pd.DataFrame:
+    phases = ["phase_1", "phase_2", "phase_3", "phase_4", "phase_5", "phase_3plus"]
+
+    return (
+        data.ipc_ch_data(latest=True)
+        .loc[:, ["iso_code", "to_date", "source"] + phases]
+        .rename(columns={p: f"ipc_{p}" for p in phases})
+        .rename(columns={"to_date": "ipc_period_end", "source": "ipc_source"})
+    )
+
+
+def _stunting() -> pd.DataFrame:
+    return (
+        utils.get_latest_values(data.stunting(), "iso_code", "year")
+        .loc[:, ["iso_code", "value", "year"]]
+        .rename(columns={"value": "stunting_pct", "year": "stunting_year"})
+    )
+
+
+def _gdp_per_capita() -> pd.DataFrame:
+    return data.gdp_latest(per_capita=True).rename(columns={"value": "gdp_per_capita"})
+
+
+def _income_level() -> pd.DataFrame:
+    return (
+        utils.get_income_levels()
+        .drop_duplicates("iso_code", keep="last")
+        .loc[:, ["iso_code", "income_level"]]
+    )
+
+
+def _food_exp_share() -> pd.DataFrame:
+    return (
+        data.usda_food_exp()
+        .loc[:, ["iso_code", "avg_share"]]
+        .rename(columns={"avg_share": "food_exp_share"})
+    )
+
+
+def _potash_dependence() -> pd.DataFrame:
+    return (
+        data.fao_fertilizer()
+        .loc[:, ["iso_code", "dependence"]]
+        .rename(columns={"dependence": "potash_dependence"})
+    )
+
+
+COMPONENTS: dict = {
+    "ipc": _ipc,
+    "stunting": _stunting,
+    "gdp_per_capita": _gdp_per_capita,
+    "income_level": _income_level,
+    "food_exp_share": _food_exp_share,
+    "potash_dependence": _potash_dependence,
+}
+
+
+def _hash(df: pd.DataFrame) -> str:
+    hashed = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return hashlib.sha1(hashed.tobytes() + str(list(df.columns)).encode()).hexdigest()
+
+
+# ==================================================================
+# Panel
+# ==================================================================
+
+
+@dataclass
+class Panel:
+    """
+    ISO3-keyed wide panel built from COMPONENTS
+        path: parquet file, default = output/country_panel.parquet
+    """
+
+    path: str = None
+    components: dict = field(default_factory=dict)
+    versions: dict = field(default_factory=dict)
+    hashes: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        if self.path is None:
+            self.path = os.path.join(config.paths.output, PANEL_FILE)
+
+    def _is_current(self, name: str) -> bool:
+        """True if the component was built from the current versions of its sources"""
+
+        if name not in self.versions:
+            return False
+
+        return all(
+            sources.SOURCES[source].version == version
+            for source, version in self.versions[name].items()
+        )
+
+    def update(self, names: list = None) -> list:
+        """
+        Rebuild the components whose sources changed since they were built.
+        Components that fail keep their previous data
+            names: components to update, default = all
+        Returns the names of the components whose data changed
+        """
+
+        changed = []
+        for name in names or COMPONENTS:
+            if self._is_current(name):
+                continue
+
+            try:
+                with sources.track() as used:
+                    df = COMPONENTS[name]().drop_duplicates("iso_code", keep="last")
+            except Exception as error:
+                self.errors[name] = repr(error)
+                print(f"Could not build panel component {name}: {error!r}")
+                continue
+
+            self.errors.pop(name, None)
+            self.versions[name] = {s: sources.SOURCES[s].version for s in used}
+            if self.hashes.get(name) != _hash(df):
+                self.components[name] = df.set_index("iso_code")
+                self.hashes[name] = _hash(df)
+                changed.append(name)
+
+        return changed
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        """the panel, one row per country"""
+
+        if not self.components:
+            return pd.DataFrame(columns=["iso_code", "country_name"])
+
+        df = pd.concat(list(self.components.values()), axis=1, join="outer")
+        df = utils.keep_countries(df.rename_axis("iso_code").reset_index())
+        names = utils.get_country_converter().convert(
+            df.iso_code.tolist(), to="name_short", not_found=None
+        )
+
+        return (
+            df.assign(country_name=names)
+            .loc[:, lambda d: ["iso_code", "country_name"] + list(d.columns[1:-1])]
+            .sort_values("iso_code", ignore_index=True)
+        )
+
+    def save(self, directory: str = None) -> str:
+        """
+        Write the panel to parquet, with the columns and hash of each component
+            directory: folder to write to, default = the folder of path
+        """
+
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        path = os.path.join(directory or os.path.dirname(self.path), PANEL_FILE)
+        metadata = {
+            name: {
+                "columns": list(df.columns),
+                "hash": self.hashes[name],
+                "sources": sorted(self.versions.get(name, {})),
+            }
+            for name, df in self.components.items()
+        }
+
+        table = pa.Table.from_pandas(self.frame, preserve_index=False)
+        table = table.replace_schema_metadata(
+            (table.schema.metadata or {}) | {METADATA_KEY: json.dumps(metadata)}
+        )
+        pq.write_table(table, path)
+
+        return path
+
+    @classmethod
+    def load(cls, path: str = None) -> "Panel":
+        """
+        Read a saved panel. Components are restored with their hashes and the names of
+        their sources, and are rebuilt on the next update (source versions only hold
+        within a session)
+        """
+
+        import pyarrow.parquet as pq
+
+        panel = cls(path=path)
+        if not os.path.exists(panel.path):
+            return panel
+
+        table = pq.read_table(panel.path)
+        metadata = json.loads(table.schema.metadata[METADATA_KEY])
+        df = table.to_pandas().set_index("iso_code")
+
+        for name, entry in metadata.items():
+            panel.components[name] = df.loc[:, entry["columns"]].dropna(how="all")
+            panel.hashes[name] = entry["hash"]
+            if "sources" in entry:
+                panel.versions[name] = {source: None for source in entry["sources"]}
+
+        return panel
+
+
+_panel: Panel = None
+
+
+def _current_panel() -> Panel:
+    """the panel of this session, read from the output folder on first use"""
+
+    global _panel
+
+    if _panel is None or _panel.path != os.path.join(config.paths.output, PANEL_FILE):
+        _panel = Panel.load()
+
+    return _panel
+
+
+def update_panel(directory: str = None, refreshed: list = None) -> dict:
+    """
+    Update the components whose sources changed and save the panel if any changed
+        directory: folder to save to, default = output
+        refreshed: only update the components built from these sources, and those whose
+        sources are not known, default = all
+    Returns the names of the changed components and the errors
+    """
+
+    panel = _current_panel()
+    if refreshed is None:
+        changed = panel.update()
+    else:
+        names = [
+            name
+            for name in COMPONENTS
+            if name not in panel.versions or set(panel.versions[name]) & set(refreshed)
+        ]
+        changed = panel.update(names) if names else []
+    if changed:
+        panel.save(directory)
+
+    return {"changed": changed, "errors": dict(panel.errors)}
+
+
+def get_panel(refresh: bool = False) -> pd.DataFrame:
+    """
+    Country-level food security panel
+        refresh: update the components whose sources changed first, and save the panel.
+        Otherwise, the saved panel is read
+    """
+
+    if refresh:
+        update_panel()
+
+    return _current_panel().frame
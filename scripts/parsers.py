@@ -0,0 +1,104 @@
+"""
+Vectorized parsers for numbers and dates found in the raw data.
+
+Values are parsed once per unique value and the results are broadcast back to every row,
+which is much faster than parsing row by row when values repeat (dates, flags, markers).
+"""
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+# values treated as missing data
+MISSING: set = {"", "..", "-", "--", "n/a", "N/A", "NA", "nan"}
+
+# optional qualifier (e.g. '<2.5'), number with optional thousands separators and
+# exponent, and an optional trailing flag (e.g. '12.3 F', '45*')
+NUMBER_PATTERN: str = (
+    r"^(?P<qualifier>[<>]=?)?\s*"
+    r"(?P<number>[-+]?(?:\d[\d,]*)?\.?\d+(?:[eE][-+]?\d+)?)"
+    r"\s*(?P<flag>[A-Za-z*]*)$"
+)
+
+
+def _broadcast(codes: np.ndarray, values: np.ndarray, fill) -> np.ndarray:
+    """values for each row from values for each unique, using factorize codes"""
+
+    result = values.take(np.where(codes >= 0, codes, 0))
+    return np.where(codes >= 0, result, fill)
+
+
+def parse_numbers(
+    values: pd.Series, *, details: bool = False, errors: str = "raise"
+) -> pd.Series | pd.DataFrame:
+    """
+    Parse numbers such as '1,234', '<2.5', '45.2 F', '..' or '--' to floats.
+    Missing markers become NaN.
+        values: series to parse
+        details: also return the qualifier ('<', '>', ...) and flag of each value
+        errors: 'raise' for values that are not numbers, or 'coerce' to set them to NaN
+    Returns a float series, or a dataframe with value, qualifier and flag columns if details
+    """
+
+    if is_numeric_dtype(values):
+        numbers = values.astype("float64")
+        if not details:
+            return numbers
+        return pd.DataFrame(
+            {"value": numbers, "qualifier": None, "flag": None}, index=values.index
+        )
+
+    codes, uniques = pd.factorize(values)
+    text = pd.Series(uniques, dtype="object").astype(str).str.strip()
+
+    # plain numbers only need the thousands separators removed. Only the rest
+    # (qualifiers, flags, missing markers) go through the slower pattern
+    missing = text.isin(MISSING)
+    plain = text.str.replace(",", "", regex=False).mask(missing, None)
+    try:
+        numbers = plain.astype("float64")
+    except ValueError:
+        numbers = pd.to_numeric(plain, errors="coerce")
+    rest = numbers.isna() & ~missing
+    parts = text[rest].str.extract(NUMBER_PATTERN)
+
+    invalid = parts.number.isna()
+    if invalid.any() and errors == "raise":
+        value = text[parts.index[invalid][0]]
+        raise ValueError(f"Unable to parse {value!r} as a number")
+
+    numbers[rest] = pd.to_numeric(parts.number.str.replace(",", "", regex=False))
+    result = pd.Series(
+        _broadcast(codes, numbers.to_numpy(dtype="float64"), np.nan),
+        index=values.index,
+        name=values.name,
+    )
+
+    if not details:
+        return result
+
+    parts = parts.reindex(text.index).replace("", np.nan).astype("object")
+    parts = parts.where(parts.notna(), None)
+    return pd.DataFrame(
+        {
+            "value": result,
+            "qualifier": _broadcast(codes, parts.qualifier.to_numpy(), None),
+            "flag": _broadcast(codes, parts.flag.to_numpy(), None),
+        },
+        index=values.index,
+    )
+
+
+def parse_dates(values: pd.Series, format: str) -> pd.Series:
+    """
+    Parse dates with a format (e.g. '%YM%m', '%b %Y'), converting each unique value once
+    """
+
+    codes, uniques = pd.factorize(values)
+    dates = pd.to_datetime(pd.Index(uniques, dtype="object"), format=format)
+
+    return pd.Series(
+        dates.take(codes, allow_fill=True, fill_value=pd.NaT),
+        index=values.index,
+        name=values.name,
+    )
@@ -0,0 +1,128 @@
+"""
+polars implementations of pluggable transformations (see scripts.backend).
+Each function matches the pandas function with the same name (without leading
+underscores): it takes and returns pandas dataframes, and runs lazily in between so
+that filters and column selections are applied before reshaping.
+"""
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from scripts import config
+
+COUNTRY_NAMES: dict = {
+    "China, Taiwan Province of": "Taiwan",
+    "China, mainland": "China",
+}
+
+
+def get_latest_values(
+    df: pd.DataFrame, grouping_col: str, date_col: str
+) -> pd.DataFrame:
+    """returns a dataframe with only latest values per group"""
+
+    return (
+        pl.from_pandas(df)
+        .lazy()
+        .filter(pl.col(date_col) == pl.col(date_col).max().over(grouping_col))
+        .collect()
+        .to_pandas()
+    )
+
+
+def get_fao_undernourishment() -> pd.DataFrame:
+    """read and clean FAO undernourishment data, reading only the needed columns"""
+
+    df = (
+        pl.scan_csv(
+            f"{config.paths.raw_data}/FAO_undernourishment_data.csv",
+            infer_schema=False,
+        )
+        .select(
+            area=pl.col("Area").replace(COUNTRY_NAMES),
+            item=pl.col("Item"),
+            year=pl.col("Year"),
+            value=pl.col("Value")
+            .str.replace_all("<", "")
+            .str.replace_all(",", "")
+            .cast(pl.Float64),
+            value_text=pl.col("Value"),
+        )
+        .collect()
+        .to_pandas()
+    )
+
+    # keep missing text values as NaN, like pandas.read_csv
+    return df.assign(value_text=lambda d: d.value_text.fillna(np.nan))
+
+
+def weo_indicator_latest(
+    df: pd.DataFrame, indicator: str, target_year: int, min_year: int
+) -> pd.DataFrame:
+    """
+    latest values of an indicator between min_year and target_year from raw WEO data.
+    Only the indicator's rows and the requested years are reshaped
+    """
+
+    years = [
+        str(c)
+        for c in df.columns
+        if str(c).isdigit() and min_year <= int(c) <= target_year
+    ]
+
+    return (
+        pl.from_pandas(
+            df.loc[:, ["ISO", "WEO Subject Code"] + years].rename(columns=str),
+            include_index=False,
+        )
+        .lazy()
+        .filter(pl.col("WEO Subject Code") == indicator)
+        .drop("WEO Subject Code")
+        .unpivot(index="ISO", variable_name="year", value_name="value")
+        .select(
+            iso_code=pl.col("ISO"),
+            year=pl.col("year").cast(pl.Int32),
+            value=pl.col("value")
+            .cast(pl.String)
+            .str.replace_all(",", "")
+            .cast(pl.Float64, strict=False),
+        )
+        .filter(pl.col("value").is_not_null() & pl.col("value").is_not_nan())
+        .filter(pl.col("year") == pl.col("year").max().over("iso_code"))
+        .select("iso_code", "value")
+        .collect()
+        .to_pandas()
+    )
+
+
+def reshape_fao_fertilizer(df: pd.DataFrame) -> pd.DataFrame:
+    """Average 2017-2019 values and pivot elements to columns"""
+
+    df = (
+        pl.from_pandas(df.loc[:, ["Area", "Element", "Item", "Year", "Value"]])
+        .lazy()
+        .filter(pl.col("Year").is_in([2019, 2018, 2017]))
+        .group_by(["Area", "Element", "Item"])
+        .agg(pl.col("Value").mean())
+        .collect()
+        .pivot(on="Element", index=["Area", "Item"], values="Value", sort_columns=True)
+        .sort(["Area", "Item"])
+        .with_columns(pl.col("Area").replace(COUNTRY_NAMES))
+        .rename(
+            {
+                "Area": "country",
+                "Item": "fertiliser",
+                "Agricultural Use": "ag_use",
+                "Export Quantity": "export_quantity",
+                "Import Quantity": "import_quantity",
+                "Export Value": "export_value",
+                "Import Value": "import_value",
+                "Production": "production",
+            },
+            strict=False,
+        )
+        .to_pandas()
+    )
+
+    return df.rename_axis(columns="Element")
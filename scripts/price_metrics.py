@@ -0,0 +1,148 @@
+"""Derived metrics (changes, rolling averages, rebasing) for monthly price series"""
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from scripts.data import data
+
+WINDOWS: tuple = (3, 12)
+BASE_PERIOD: str = "2010-01-01"
+MAX_CACHE: int = 32
+
+_cache: dict = {}
+
+
+def _version(df: pd.DataFrame) -> str:
+    """hash of the contents of a dataframe, used as its version"""
+
+    hashed = pd.util.hash_pandas_object(df, index=True).to_numpy()
+    return hashlib.sha1(hashed.tobytes() + str(list(df.columns)).encode()).hexdigest()
+
+
+def _lagged_change(values: np.ndarray, lag: int) -> np.ndarray:
+    """percentage change against the value `lag` rows before, for all series"""
+
+    change = np.full_like(values, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        change[lag:] = (values[lag:] / values[:-lag] - 1) * 100
+
+    return change
+
+
+def _rolling_means(values: np.ndarray, windows: tuple) -> np.ndarray:
+    """
+    rolling means for all windows and series, shape (windows, rows, series).
+    A window with any missing value gives NaN
+    """
+
+    rows = values.shape[0]
+    missing = np.isnan(values)
+    totals = np.vstack(
+        [
+            np.zeros((1, values.shape[1])),
+            np.cumsum(np.where(missing, 0, values), axis=0),
+        ]
+    )
+    gaps = np.vstack([np.zeros((1, values.shape[1])), np.cumsum(missing, axis=0)])
+
+    windows = np.asarray(windows)
+    end = np.arange(1, rows + 1)
+    start = np.clip(end[None, :] - windows[:, None], 0, None)
+
+    means = (totals[end][None, :, :] - totals[start]) / windows[:, None, None]
+    incomplete = (gaps[end][None, :, :] - gaps[start] > 0) | (
+        end[None, :] < windows[:, None]
+    )[:, :, None]
+
+    return np.where(incomplete, np.nan, means)
+
+
+def derived_metrics(
+    df: pd.DataFrame,
+    date_col: str = "period",
+    windows: tuple = WINDOWS,
+    base_period: str = BASE_PERIOD,
+) -> pd.DataFrame:
+    """
+    Month-on-month and year-on-year changes (%), rolling means and values rebased
+    to base_period = 100, for every series (column) of a monthly dataframe.
+    Results are memoized per version of the input data.
+        df: monthly data, one row per month and one column per series
+        date_col: name of the date column
+        windows: rolling mean windows, in months
+        base_period: month used as 100 for the rebased series
+    Returns a tidy dataframe with period, series, metric and value columns
+    """
+
+    key = (_version(df), date_col, tuple(windows), base_period)
+    if key in _cache:
+        return _cache[key].copy(deep=False)
+
+    df = df.sort_values(date_col)
+    periods = pd.to_datetime(df[date_col]).to_numpy()
+    series = [c for c in df.columns if c != date_col]
+    values = df[series].apply(pd.to_numeric, errors="coerce").to_numpy(dtype="float64")
+
+    metrics = {
+        "value": values,
+        "mom_pct": _lagged_change(values, 1),
+        "yoy_pct": _lagged_change(values, 12),
+    }
+    for window, means in zip(windows, _rolling_means(values, windows)):
+        metrics[f"rolling_mean_{window}m"] = means
+
+    base = np.flatnonzero(periods == np.datetime64(base_period))
+    if len(base):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            metrics["rebased"] = values / values[base[0]] * 100
+
+    stacked = np.stack(list(metrics.values()))  # (metrics, rows, series)
+    n_metrics, n_rows, n_series = stacked.shape
+
+    result = pd.DataFrame(
+        {
+            "period": np.tile(np.repeat(periods, n_series), n_metrics),
+            "series": np.tile(series, n_metrics * n_rows),
+            "metric": np.repeat(list(metrics), n_rows * n_series),
+            "value": stacked.ravel(),
+        }
+    )
+
+    if len(_cache) >= MAX_CACHE:
+        _cache.pop(next(iter(_cache)))
+    _cache[key] = result
+
+    return result.copy(deep=False)
+
+
+def price_metrics(
+    commodities: list = None, indices: list = None, **kwargs
+) -> pd.DataFrame:
+    """
+    Derived metrics for World Bank commodity prices, World Bank commodity indices and
+    the FAO Food Price Index, as a single tidy table with a source column
+        commodities: commodity columns to include, default = those in the commodity chart
+        indices: index columns to include, all if None
+        kwargs: passed to derived_metrics
+    """
+
+    if commodities is None:
+        commodities = ["Palm oil", "Sunflower oil", "Maize", "Wheat"]
+
+    sources = {
+        "World Bank commodity prices": data.commodity_prices(commodities),
+        "World Bank commodity indices": data.indices(indices),
+        "FAO Food Price Index": data.food_price_index().rename(
+            columns={"date": "period"}
+        ),
+    }
+
+    return pd.concat(
+        [
+            derived_metrics(df, **kwargs).assign(source=source)
+            for source, df in sources.items()
+        ],
+        ignore_index=True,
+    ).loc[:, ["source", "series", "metric", "period", "value"]]
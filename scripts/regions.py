@@ -0,0 +1,142 @@
+"""Aggregation of country level indicators by region and income group"""
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from scripts import sources, utils
+
+GROUPINGS: tuple = ("continent", "UNregion", "income_level")
+
+
+def country_groups() -> pd.DataFrame:
+    """
+    Country to group lookup, indexed by iso3 code.
+    Continent and UN region come from country_converter, income level from
+    the latest World Bank classification
+    """
+
+    sources.mark_used(["income_levels"])
+    return _country_groups(sources.SOURCES["income_levels"].version)
+
+
+# built once per version of the income levels glossary
+@lru_cache(maxsize=4)
+def _country_groups(version: int) -> pd.DataFrame:
+    cc = utils.get_country_converter()
+    df = cc.data.loc[:, ["ISO3", "continent", "UNregion"]].rename(
+        columns={"ISO3": "iso_code"}
+    )
+
+    return (
+        utils.add_income_levels(df)
+        .drop_duplicates("iso_code")
+        .set_index("iso_code")
+        .sort_index()
+    )
+
+
+def membership(groupings: tuple = GROUPINGS) -> tuple:
+    """
+    Membership matrix of countries in groups, built once per set of groupings.
+    Returns (groups, matrix) where groups is a dataframe with the grouping and group
+    of each matrix row, and matrix is a 0/1 array of shape (groups, countries)
+    in the order of country_groups().index
+    """
+
+    sources.mark_used(["income_levels"])
+    return _membership(tuple(groupings), sources.SOURCES["income_levels"].version)
+
+
+@lru_cache(maxsize=16)
+def _membership(groupings: tuple, version: int) -> tuple:
+    lookup = country_groups()
+    groups, rows = [], []
+
+    for grouping in groupings:
+        column = lookup[grouping]
+        for group in sorted(column.dropna().unique()):
+            groups.append((grouping, group))
+            rows.append((column == group).to_numpy())
+
+    return (
+        pd.DataFrame(groups, columns=["grouping", "group"]),
+        np.array(rows, dtype="float64"),
+    )
+
+
+def partition(df: pd.DataFrame, grouping: str, iso_col: str = "iso_code") -> dict:
+    """
+    Split country level data by group, in a single pass over the rows.
+    Rows whose iso code is not a country are left out
+        grouping: 'continent', 'UNregion' or 'income_level'
+    Returns a dict of group: dataframe, sorted by group
+    """
+
+    lookup = country_groups()
+    if grouping not in lookup.columns:
+        raise ValueError(f"{grouping} is not valid. Use one of {GROUPINGS}")
+
+    keys = df[iso_col].map(lookup[grouping])
+    return {
+        group: part.reset_index(drop=True)
+        for group, part in df.groupby(keys, sort=True)
+    }
+
+
+def aggregate(
+    df: pd.DataFrame,
+    value_cols: list,
+    weight_col: str = None,
+    groupings: tuple = GROUPINGS,
+    iso_col: str = "iso_code",
+) -> pd.DataFrame:
+    """
+    Sums, counts, means and (optionally) weighted means of indicators for every group
+    of every grouping, in a single pass over the data.
+    Rows whose iso code is not a country (e.g. World Bank aggregates) are ignored.
+        df: country level data, one row per country
+        value_cols: columns to aggregate
+        weight_col: column with weights (e.g. population) for weighted means
+        groupings: groupings to aggregate by, default = continent, UN region and income level
+    Returns a long dataframe with grouping, group, indicator, sum, count, mean
+    and weighted_mean columns
+    """
+
+    groups, matrix = membership(tuple(groupings))
+
+    # map each row to its column in the membership matrix. Unknown codes get an empty column
+    positions = country_groups().index.get_indexer(df[iso_col])
+    row_membership = np.where(positions >= 0, matrix[:, positions], 0)
+
+    values = df[value_cols].to_numpy(dtype="float64")
+    present = ~np.isnan(values)
+    values = np.where(present, values, 0)
+
+    sums = row_membership @ values
+    counts = row_membership @ present
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+
+        if weight_col is not None:
+            weights = np.nan_to_num(df[weight_col].to_numpy(dtype="float64"))
+            weighted_sums = row_membership @ (values * weights[:, None])
+            weight_totals = row_membership @ (present * weights[:, None])
+            weighted_means = weighted_sums / weight_totals
+
+    result = {
+        "sum": sums.ravel(),
+        "count": counts.ravel().astype("int64"),
+        "mean": means.ravel(),
+    }
+    if weight_col is not None:
+        result["weighted_mean"] = weighted_means.ravel()
+
+    return pd.concat(
+        [
+            groups.loc[groups.index.repeat(len(value_cols))].reset_index(drop=True),
+            pd.DataFrame({"indicator": np.tile(value_cols, len(groups))} | result),
+        ],
+        axis=1,
+    )
@@ -0,0 +1,266 @@
+"""
+Local server for previewing the chart data.
+
+    python -m scripts.serve --port 8000
+
+Sources stay loaded in memory (see scripts.sources) and are refreshed on their own
+schedule. Each chart is built once at start-up and rebuilt only when a source it uses
+is refreshed; until then its files are served from memory, with ETags.
+
+    GET  /                  files with their ETag, chart and build time
+    GET  /<name>.csv        chart data as csv
+    GET  /<name>.json       chart data as json records
+    GET  /sources           status of each source
+    POST /refresh           refresh stale sources and rebuild the charts using them
+    POST /refresh/<source>  refresh a source now
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scripts import sources
+from scripts.charts import PAGE_CHARTS
+from scripts.output import GZIP_LEVEL, writer
+
+CHECK_INTERVAL: float = 60.0
+CONTENT_TYPES: dict = {"csv": "text/csv; charset=utf-8", "json": "application/json"}
+
+
+@dataclass
+class File:
+    """A file served from memory"""
+
+    body: bytes
+    gzipped: bytes
+    etag: str
+    content_type: str
+    chart: str
+    built_at: float
+
+
+def _file(body: bytes, content_type: str, chart: str) -> File:
+    return File(
+        body=body,
+        gzipped=gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0),
+        etag=f'"{hashlib.sha256(body).hexdigest()[:32]}"',
+        content_type=content_type,
+        chart=chart,
+        built_at=time.time(),
+    )
+
+
+@dataclass
+class ChartCache:
+    """
+    Chart files kept in memory, with the sources used by each chart
+        charts: chart functions to build
+    """
+
+    charts: list = field(default_factory=lambda: list(PAGE_CHARTS))
+    files: dict = field(default_factory=dict)
+    used: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _refreshing: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def build(self, chart) -> None:
+        """Build a chart and swap in its files. Files are kept if the build fails"""
+
+        name = chart.__name__
+        try:
+            with sources.track() as used, writer.capture() as captured:
+                chart()
+        except Exception as error:
+            self.errors[name] = repr(error)
+            print(f"Could not build {name}: {error!r}")
+            return
+
+        files = {}
+        for filename, (df, kwargs) in captured.items():
+            stem = filename.removesuffix(".csv")
+            csv = df.to_csv(index=False, **kwargs).encode("utf-8")
+            records = df.to_json(orient="records", date_format="iso").encode("utf-8")
+            files[f"{stem}.csv"] = _file(csv, CONTENT_TYPES["csv"], name)
+            files[f"{stem}.json"] = _file(records, CONTENT_TYPES["json"], name)
+
+        with self._lock:
+            self.files.update(files)
+            self.used[name] = used
+            self.errors.pop(name, None)
+
+    def build_all(self) -> None:
+        for chart in self.charts:
+            self.build(chart)
+
+    def refresh(self, names: list = None) -> list:
+        """
+        Refresh sources and rebuild the charts that use them, and charts that failed
+            names: sources to refresh, default = the stale sources
+        Returns the names of the rebuilt charts
+        """
+
+        with self._refreshing:
+            refreshed = set(sources.refresh(names))
+            rebuild = [
+                chart
+                for chart in self.charts
+                if self.used.get(chart.__name__, set()) & refreshed
+                or chart.__name__ in self.errors
+            ]
+            for chart in rebuild:
+                self.build(chart)
+
+        return [chart.__name__ for chart in rebuild]
+
+    def index(self) -> list:
+        with self._lock:
+            return [
+                {
+                    "file": filename,
+                    "etag": file.etag,
+                    "chart": file.chart,
+                    "built_at": file.built_at,
+                }
+                for filename, file in sorted(self.files.items())
+            ]
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """whether an Accept-Encoding header allows gzip, i.e. with a q-value above 0"""
+
+    qvalues = {}
+    for part in accept_encoding.split(","):
+        coding, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            qvalues[coding.lower()] = q
+
+    return qvalues.get("gzip", qvalues.get("x-gzip", qvalues.get("*", 0.0))) > 0
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """whether an If-None-Match header matches an ETag (weak comparison)"""
+
+    if if_none_match.strip() == "*":
+        return True
+
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return etag.removeprefix("W/") in tags
+
+
+class Handler(BaseHTTPRequestHandler):
+    cache: ChartCache = None
+
+    def _send(
+        self, status: int, body: bytes = b"", content_type: str = None, headers=None
+    ) -> None:
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if content_type is not None:
+            self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data, status: int = 200) -> None:
+        self._send(status, json.dumps(data, indent=2).encode(), CONTENT_TYPES["json"])
+
+    def do_GET(self) -> None:
+        path = self.path.split("?")[0].strip("/")
+
+        if path == "":
+            return self._send_json(self.cache.index())
+        if path == "sources":
+            return self._send_json(sources.status())
+
+        file = self.cache.files.get(path)
+        if file is None:
+            return self._send_json({"error": f"{path} not found"}, status=404)
+
+        # each encoding is a different representation, with its own ETag
+        headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+        if accepts_gzip(self.headers.get("Accept-Encoding", "")):
+            body, etag = file.gzipped, f'{file.etag[:-1]}-gz"'
+            headers["Content-Encoding"] = "gzip"
+        else:
+            body, etag = file.body, file.etag
+        headers["ETag"] = etag
+
+        if etag_matches(self.headers.get("If-None-Match", ""), etag):
+            headers.pop("Content-Encoding", None)
+            return self._send(304, headers=headers)
+
+        self._send(200, body, file.content_type, headers)
+
+    def do_POST(self) -> None:
+        path = self.path.split("?")[0].strip("/")
+
+        if path == "refresh":
+            names = None
+        elif path.startswith("refresh/") and path[8:] in sources.SOURCES:
+            names = [path[8:]]
+        else:
+            return self._send_json({"error": f"{path} not found"}, status=404)
+
+        rebuilt = self.cache.refresh(names)
+        self._send_json({"rebuilt": rebuilt, "errors": self.cache.errors})
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def serve(
+    host: str = "127.0.0.1", port: int = 8000, check_interval: float = CHECK_INTERVAL
+) -> None:
+    """
+    Build every page chart and serve the files until interrupted
+        check_interval: seconds between checks for stale sources
+    """
+
+    cache = ChartCache()
+    cache.build_all()
+
+    stop = threading.Event()
+
+    def _refresh_loop():
+        while not stop.wait(check_interval):
+            rebuilt = cache.refresh()
+            if rebuilt:
+                print(f"Rebuilt {', '.join(rebuilt)}")
+
+    threading.Thread(target=_refresh_loop, daemon=True).start()
+
+    handler = type("ChartHandler", (Handler,), {"cache": cache})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Serving {len(cache.files)} files on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the chart data from memory")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--check-interval", type=float, default=CHECK_INTERVAL)
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.check_interval)
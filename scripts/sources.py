@@ -0,0 +1,495 @@
+"""
+In-memory cache for raw data sources.
+
+Functions that download or read raw data are decorated with `cached(name)`, where name
+is one of SOURCES. Results are kept in memory per function and arguments until the
+source is refreshed, so long-running processes (see scripts.serve) only fetch each
+source once. Remote sources expire after their refresh interval, and local sources
+when one of their raw_data or glossaries files changes.
+
+The last good result of each remote source loaded inside `run()` (update_charts) is
+saved to raw_data/snapshots (parquet for frames, json otherwise, next to a .meta.json
+file), and only rewritten when it changes. Loads outside a run (notebooks, benchmarks)
+leave the snapshots as they are.
+Snapshots are committed with the raw data, so that past dates can be rebuilt from them.
+Inside `run(deadline)`, every source has a time budget: a source that fails or misses
+its budget (or the run deadline) is read from its snapshot instead, and marked as stale
+in the run report. In an offline run (see scripts.backfill), remote sources are only
+read from their snapshots.
+"""
+
+import copy
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import wraps
+from io import BytesIO
+from typing import Optional
+
+import pandas as pd
+
+from scripts import config
+
+HOUR: int = 3600
+SECRET_PARAMS: tuple = ("key",)  # url parameters left out of snapshot keys
+
+
+@dataclass
+class Source:
+    """
+    A raw data source
+        name: name of the source
+        refresh: seconds after which loaded data is stale, None for no expiry
+        budget: seconds the source may take during a run, None for no limit
+        files: files (glob patterns) the source reads. Loaded data is stale when any
+        of them changes
+        folder: folder of the files, 'raw_data' or 'glossaries'
+    """
+
+    name: str
+    refresh: Optional[float] = None
+    budget: Optional[float] = None
+    files: tuple = ()
+    folder: str = "raw_data"
+    loaded_at: Optional[float] = None
+    version: int = 0
+    _values: dict = field(default_factory=dict, repr=False)
+    _file_times: dict = field(default_factory=dict, repr=False)
+    _loading: dict = field(default_factory=dict, repr=False)
+    _lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+
+    @property
+    def directory(self) -> str:
+        return getattr(config.paths, self.folder)
+
+    def file_times(self) -> dict:
+        """modification times of the source files"""
+
+        paths = [
+            path
+            for pattern in self.files
+            for path in glob.glob(os.path.join(self.directory, pattern))
+        ]
+        return {path: os.path.getmtime(path) for path in sorted(paths)}
+
+    @property
+    def is_stale(self) -> bool:
+        if self.loaded_at is None:
+            return False
+
+        if self.refresh is not None and time.time() - self.loaded_at > self.refresh:
+            return True
+
+        return bool(self.files) and self.file_times() != self._file_times
+
+    def clear(self) -> None:
+        """drop the loaded data, it is loaded again on next use"""
+
+        with self._lock:
+            self._values.clear()
+            self.loaded_at = None
+            self.version += 1
+
+    def status(self) -> dict:
+        return {
+            "source": self.name,
+            "loaded": self.loaded_at is not None,
+            "loaded_at": self.loaded_at,
+            "refresh": self.refresh,
+            "budget": self.budget,
+            "files": [os.path.join(self.folder, f) for f in self.files],
+            "stale": self.is_stale,
+            "version": self.version,
+        }
+
+
+SOURCES: dict = {
+    s.name: s
+    for s in [
+        Source("ipc", refresh=6 * HOUR, budget=120),
+        Source("fao_food_price_index", refresh=24 * HOUR, budget=60),
+        Source("wb_commodities", refresh=24 * HOUR, budget=180),
+        Source("wb_indicators", refresh=24 * HOUR, budget=180),
+        Source("usda_food_expenditure", refresh=7 * 24 * HOUR, budget=60),
+        Source("weo", files=("weo_*.csv",)),
+        Source("ipc_manual", files=("IPC_data.csv",)),
+        Source("fao_undernourishment", files=("FAO_undernourishment_data.csv",)),
+        Source("fao_fertilizer", files=("FAO_fertilizer.csv",)),
+        Source("ifpri_restrictions", files=("restrictions_data.csv",)),
+        Source("income_levels", folder="glossaries", files=("income_levels.csv",)),
+        Source(
+            "flourish_geometries",
+            folder="glossaries",
+            files=("flourish_geometries_world.json",),
+        ),
+    ]
+}
+
+STATUSES: tuple = ("fresh", "stale", "failed")
+
+_tracking = threading.local()
+_run = None
+
+
+# ==================================================================
+# Runs
+# ==================================================================
+
+
+@dataclass
+class Run:
+    """
+    Time budgets for a run and the status of the sources loaded in it
+        deadline: seconds for the whole run, None for no limit
+        offline: read remote sources from their snapshots only
+    """
+
+    deadline: Optional[float] = None
+    offline: bool = False
+    started: float = field(default_factory=time.monotonic)
+    spent: dict = field(default_factory=lambda: defaultdict(float))
+    sources: dict = field(default_factory=dict)
+
+    def remaining(self, source: Source) -> Optional[float]:
+        """seconds left for a source, within its budget and the run deadline"""
+
+        limits = []
+        if self.deadline is not None:
+            limits.append(self.deadline - (time.monotonic() - self.started))
+        if source.budget is not None:
+            limits.append(source.budget - self.spent[source.name])
+
+        return min(limits) if limits else None
+
+    def record(self, name: str, status: str, **details) -> None:
+        """record the status of a source, keeping the worst status of the run"""
+
+        entry = self.sources.setdefault(name, {"status": status})
+        if STATUSES.index(status) >= STATUSES.index(entry["status"]):
+            entry.update(status=status, **details)
+        entry["seconds"] = round(self.spent[name], 3)
+
+    def report(self) -> dict:
+        return {
+            "deadline": self.deadline,
+            "seconds": round(time.monotonic() - self.started, 3),
+            "sources": self.sources,
+        }
+
+
+@contextmanager
+def run(deadline: float = None, offline: bool = False):
+    """
+    Apply source budgets and an overall deadline to the sources loaded in the block.
+    Yields the Run, with the status of each source
+        deadline: seconds for the whole run, None for no limit
+        offline: read remote sources from their snapshots only
+    """
+
+    global _run
+
+    previous, _run = _run, Run(deadline=deadline, offline=offline)
+    try:
+        yield _run
+    finally:
+        _run = previous
+
+
+# ==================================================================
+# Snapshots
+# ==================================================================
+
+
+def _snapshot_path(name: str, arguments: tuple) -> str:
+    """path of a snapshot, without extension. Secrets are left out of the key"""
+
+    key = re.sub(
+        rf"([?&](?:{'|'.join(SECRET_PARAMS)})=)[^&'\"]*", r"\1", repr(arguments)
+    )
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    return os.path.join(config.paths.raw_data, "snapshots", name, digest)
+
+
+def _encode(value) -> tuple:
+    """
+    snapshot data (bytes) and format of a result. Frames are stored as parquet, with
+    the values of object columns (e.g. raw spreadsheet rows mixing text, numbers and
+    NaN) stored as json, so that they are read back exactly. Column names (e.g. years)
+    are kept in the metadata, as parquet only stores them as strings
+    """
+
+    if isinstance(value, pd.DataFrame):
+        columns = value.columns.tolist()
+        if json.loads(json.dumps(columns)) != columns:
+            raise ValueError("column names can not be stored as json")
+
+        frame = value.set_axis([str(i) for i in range(len(columns))], axis=1)
+        objects = [c for c in frame.columns if frame[c].dtype == object]
+        frame = frame.assign(**{c: frame[c].map(json.dumps) for c in objects})
+        buffer = BytesIO()
+        frame.to_parquet(buffer)
+        meta = {"format": "parquet", "columns": columns, "json_columns": objects}
+        return buffer.getvalue(), meta
+
+    data = json.dumps(value, sort_keys=True, separators=(",", ":")).encode()
+    return data, {"format": "json"}
+
+
+def _decode(data: bytes, meta: dict):
+    if meta["format"] == "json":
+        return json.loads(data)
+
+    df = pd.read_parquet(BytesIO(data))
+    df = df.assign(**{c: df[c].map(json.loads) for c in meta["json_columns"]})
+    return df.set_axis(meta["columns"], axis=1)
+
+
+def _save_snapshot(name: str, arguments: tuple, value) -> None:
+    """
+    save a result as the last good snapshot. Files are only written when the data
+    changes, so unchanged sources leave raw_data/snapshots as it was
+    """
+
+    path = _snapshot_path(name, arguments)
+    try:
+        data, meta = _encode(value)
+    except Exception as error:  # a snapshot that cannot be saved does not fail a run
+        print(f"Could not save a snapshot of {name}: {error!r}")
+        return
+
+    meta["sha256"] = hashlib.sha256(data).hexdigest()
+    if _read_meta(path).get("sha256") == meta["sha256"]:
+        return
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.tmp", "wb") as file:
+        file.write(data)
+    os.replace(f"{path}.tmp", f"{path}.{meta['format']}")
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(meta | {"saved_at": time.time()}, file, indent=2)
+    os.replace(f"{path}.tmp", f"{path}.meta.json")
+
+
+def _read_meta(path: str) -> dict:
+    try:
+        with open(f"{path}.meta.json") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _read_snapshot(name: str, arguments: tuple) -> Optional[dict]:
+    """
+    the last good snapshot of a result (saved_at, value), None if there is none or it
+    cannot be read
+    """
+
+    path = _snapshot_path(name, arguments)
+    meta = _read_meta(path)
+    try:
+        with open(f"{path}.{meta['format']}", "rb") as file:
+            data = file.read()
+        if hashlib.sha256(data).hexdigest() != meta["sha256"]:
+            return None
+        return {"saved_at": meta["saved_at"], "value": _decode(data, meta)}
+    except (OSError, EOFError, ValueError, KeyError, TypeError, ImportError):
+        return None
+
+
+# ==================================================================
+# Cache
+# ==================================================================
+
+
+def _copy(value):
+    """
+    copy of a cached value, so that callers can modify what they get. Frames are
+    copied lazily (copy-on-write)
+    """
+
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    if isinstance(value, (bytes, str, int, float)):
+        return value
+    return copy.deepcopy(value)
+
+
+def _call(func, args: tuple, kwargs: dict, timeout: Optional[float]):
+    """
+    call a function in a daemon thread and wait at most timeout seconds for it.
+    A call that times out is left to finish in the background
+    """
+
+    future = Future()
+    # sources used inside the load count for the caller's track() block
+    used = getattr(_tracking, "used", None)
+
+    def target():
+        _tracking.loading, _tracking.used = True, used
+        try:
+            future.set_result(func(*args, **kwargs))
+        except BaseException as error:
+            future.set_exception(error)
+
+    threading.Thread(target=target, daemon=True).start()
+
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        raise TimeoutError(f"took longer than {timeout:.1f}s") from None
+
+
+def _load(source: Source, func, args: tuple, kwargs: dict, arguments: tuple):
+    """
+    load a result, within the source budget if a run is active. Snapshots are only
+    saved inside a run. arguments identify the snapshot, None if the result is not
+    snapshotted
+    """
+
+    current = _run
+    if current is None or getattr(_tracking, "loading", False):
+        value = func(*args, **kwargs)
+        if arguments is not None and current is not None:
+            _save_snapshot(source.name, arguments, value)
+        return value
+
+    timeout = current.remaining(source)
+    start = time.monotonic()
+    try:
+        if current.offline and arguments is not None:
+            raise ConnectionError("offline run")
+        if timeout is not None and timeout <= 0:
+            raise TimeoutError("no time left in the budget or run deadline")
+        value = _call(func, args, kwargs, timeout)
+    except Exception as error:
+        current.spent[source.name] += time.monotonic() - start
+        snapshot = None if arguments is None else _read_snapshot(source.name, arguments)
+        if snapshot is None:
+            current.record(source.name, "failed", error=repr(error))
+            raise
+
+        saved_at = datetime.fromtimestamp(snapshot["saved_at"]).isoformat()
+        current.record(source.name, "stale", error=repr(error), snapshot=saved_at)
+        print(f"Using snapshot of {source.name} from {saved_at}: {error!r}")
+        return snapshot["value"]
+
+    current.spent[source.name] += time.monotonic() - start
+    current.record(source.name, "fresh")
+    if arguments is not None:
+        _save_snapshot(source.name, arguments, value)
+
+    return value
+
+
+def cached(name: str, snapshot: bool = True):
+    """
+    Keep the results of a function in memory as part of a source
+        name: name of the source in SOURCES
+        snapshot: save the last good result of a run to raw_data/snapshots (remote
+        sources only)
+    """
+
+    source = SOURCES[name]
+    snapshot = snapshot and not source.files
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            mark_used([name])
+
+            arguments = (func.__qualname__, repr(args), repr(sorted(kwargs.items())))
+            key = (config.paths.project_dir,) + arguments
+            with source._lock:
+                if key in source._values:
+                    return _copy(source._values[key])
+                loading = source._loading.setdefault(key, threading.Lock())
+
+            # concurrent calls with the same arguments wait for a single load
+            with loading:
+                with source._lock:
+                    if key in source._values:
+                        return _copy(source._values[key])
+                    if source.loaded_at is None:
+                        source._file_times = source.file_times()
+
+                value = _load(
+                    source, func, args, kwargs, arguments if snapshot else None
+                )
+
+                with source._lock:
+                    source._values[key] = value
+                    source._loading.pop(key, None)
+                    source.loaded_at = source.loaded_at or time.time()
+
+            return _copy(value)
+
+        return wrapper
+
+    return decorator
+
+
+def mark_used(names) -> None:
+    """add sources to those collected by `track`, in this thread"""
+
+    used = getattr(_tracking, "used", None)
+    if used is not None:
+        used.update(names)
+
+
+@contextmanager
+def track():
+    """Collect the names of the sources used in the block"""
+
+    previous = getattr(_tracking, "used", None)
+    used = set()
+    _tracking.used = used
+    try:
+        yield used
+    finally:
+        _tracking.used = previous
+        if previous is not None:
+            previous |= used
+
+
+def stale() -> list:
+    """names of the sources with stale data"""
+
+    return [name for name, source in SOURCES.items() if source.is_stale]
+
+
+def refresh(names: list = None) -> list:
+    """
+    Drop the loaded data of sources, so that it is loaded again on next use
+        names: sources to refresh, default = the stale sources
+    Returns the names of the refreshed sources
+    """
+
+    if names is None:
+        names = stale()
+
+    for name in names:
+        SOURCES[name].clear()
+
+    return list(names)
+
+
+def clear() -> None:
+    """Drop the loaded data of all sources"""
+
+    refresh(list(SOURCES))
+
+
+def status() -> list:
+    """status of every source"""
+
+    return [source.status() for source in SOURCES.values()]
@@ -0,0 +1,99 @@
+"""Indexed access to FAO undernourishment data"""
+
+from dataclasses import dataclass
+
+import pandas as pd
+
+from scripts.analysis import get_fao_undernourishment
+
+PREVALENCE: str = "Prevalence of undernourishment (percent) (annual value)"
+NUMBER: str = "Number of people undernourished (million) (annual value)"
+
+
+@dataclass
+class Undernourishment:
+    """
+    Clean FAO undernourishment data, indexed by (area, item, year), with a wide
+    (area, year) x item pivot built once. Numeric values are kept alongside their
+    original text (e.g. '<2.5') in value_text
+        data: clean data as returned by get_fao_undernourishment. Read from raw_data if None
+    """
+
+    data: pd.DataFrame = None
+
+    def __post_init__(self):
+        if self.data is None:
+            self.data = get_fao_undernourishment()
+
+        self.long = (
+            self.data.loc[:, ["area", "item", "year", "value", "value_text"]]
+            .set_index(["area", "item", "year"])
+            .sort_index()
+        )
+        self.wide = self.long.unstack("item")
+
+    @property
+    def areas(self) -> list:
+        return list(self.long.index.levels[0])
+
+    @property
+    def items(self) -> list:
+        return list(self.long.index.levels[1])
+
+    @property
+    def years(self) -> list:
+        return list(self.long.index.levels[2])
+
+    def _positions(self, areas, items, years) -> pd.Series:
+        """positions in the long index for every requested key, -1 if not available"""
+
+        keys = pd.MultiIndex.from_product(
+            [
+                self.areas if areas is None else areas,
+                items,
+                self.years if years is None else years,
+            ],
+            names=["area", "item", "year"],
+        )
+        return pd.Series(self.long.index.get_indexer(keys), index=keys)
+
+    def get(self, area: str, item: str, year: str) -> tuple:
+        """(value, value_text) for a single area, item and year"""
+
+        row = self.long.loc[(area, item, year)]
+        return row.value, row.value_text
+
+    def query(
+        self, items: list, areas: list = None, years: list = None
+    ) -> pd.DataFrame:
+        """
+        Long table (area, item, year, value, value_text) for these items.
+            areas: areas to keep, all areas if None
+            years: years to keep, all years if None
+        """
+
+        positions = self._positions(areas, items, years)
+        return self.long.iloc[positions[positions >= 0].to_numpy()].reset_index()
+
+    def pivot(
+        self, items: dict, areas: list = None, years: list = None
+    ) -> pd.DataFrame:
+        """
+        Wide table with value_{suffix} and value_text_{suffix} columns per item.
+        Only (area, year) pairs available for all items are kept
+            items: {item: suffix}, e.g. {PREVALENCE: "pct", NUMBER: "mil"}
+            areas: areas to keep, all areas if None
+            years: years to keep, all years if None
+        """
+
+        positions = self._positions(areas, list(items), years)
+        available = (positions >= 0).unstack("item").loc[:, list(items)].all(axis=1)
+        index = available[available].index
+
+        df = self.wide.reindex(index)
+        columns = {}
+        for item, suffix in items.items():
+            columns[f"value_{suffix}"] = df[("value", item)]
+            columns[f"value_text_{suffix}"] = df[("value_text", item)]
+
+        return pd.DataFrame(columns, index=index).reset_index()
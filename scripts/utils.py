@@ -1,10 +1,13 @@
 """Utility functions"""
 
-from scripts import config
-import wbgapi as wb
+from functools import lru_cache
+
+from scripts import config, backend, excel, geometries, parsers, sources
+from scripts.http_client import client
 import pandas as pd
-import weo
-import country_converter as coco
+
+# weo and country_converter are slow to import (country_converter also reads
+# its full classification table), so they are only imported when first needed
 
 
 def add_flourish_geometries(
@@ -12,19 +15,21 @@ def add_flourish_geometries(
 ) -> pd.DataFrame:
     """
     Adds a geometry column to a dataframe based on iso3 code
+    (only iso codes when maps share a geometry asset, see scripts.geometries)
         df: DataFrame to add a column
         key_column_name: name of column with iso3 codes to merge on, default = 'iso_code'
     """
 
-    g = pd.read_json(f"{config.paths.glossaries}/flourish_geometries_world.json")
-    g = (
-        g.rename(columns={g.columns[0]: "flourish_geom", g.columns[1]: key_column_name})
-        .iloc[1:]
-        .drop_duplicates(subset=key_column_name, keep="first")
-        .reset_index(drop=True)
-    )
+    return geometries.add_geometries(df, key_column_name)
+
 
-    return pd.merge(g, df, on=key_column_name, how="left")
+@lru_cache(maxsize=None)
+def get_country_converter():
+    """returns a single shared country_converter.CountryConverter"""
+
+    import country_converter as coco
+
+    return coco.CountryConverter()
 
 
 def remove_unnamed_cols(df: pd.DataFrame) -> pd.DataFrame:
@@ -34,28 +39,26 @@ def remove_unnamed_cols(df: pd.DataFrame) -> pd.DataFrame:
 
 
 def clean_numeric_column(column: pd.Series) -> pd.Series:
-    """removes commas and transforms pandas series to numeric"""
-
-    column = column.str.replace(",", "")
-    column = pd.to_numeric(column)
+    """removes commas and '<' or '>' qualifiers and transforms pandas series to numeric"""
 
-    return column
+    return parsers.parse_numbers(column)
 
 
+@backend.pluggable
 def get_latest_values(
     df: pd.DataFrame, grouping_col: str, date_col: str
 ) -> pd.DataFrame:
     """returns a dataframe with only latest values per group"""
 
     return df.loc[
-        df.groupby(grouping_col)[date_col].transform(max) == df[date_col]
+        df.groupby(grouping_col)[date_col].transform("max") == df[date_col]
     ].reset_index(drop=True)
 
 
 def keep_countries(df: pd.DataFrame, iso_col: str = "iso_code") -> pd.DataFrame:
     """returns a dataframe with only countries"""
 
-    cc = coco.CountryConverter()
+    cc = get_country_converter()
     return df[df[iso_col].isin(cc.data["ISO3"])].reset_index(drop=True)
 
 
@@ -68,12 +71,22 @@ def filter_countries(
         values: list of values to keep
     """
 
-    cc = coco.CountryConverter()
-    if by not in cc.data.columns:
+    if by not in get_country_converter().data.columns:
         raise ValueError(f"{by} is not valid")
 
-    df[by] = coco.convert(df[iso_col], to=by)
-    return df[df[by].isin(values)].drop(columns=by).reset_index(drop=True)
+    keep = df[iso_col].map(country_index(by)).isin(values)
+    return df.loc[keep].reset_index(drop=True)
+
+
+@lru_cache(maxsize=None)
+def country_index(by: str) -> pd.Series:
+    """
+    iso3 code to a country_converter classification, built once per classification
+        by: classification - 'continent', 'UNregion' etc.
+    """
+
+    cc = get_country_converter()
+    return cc.data.drop_duplicates("ISO3").set_index("ISO3")[by]
 
 
 # ============================================================================
@@ -81,50 +94,192 @@ def filter_countries(
 # ============================================================================
 
 
-def get_income_levels() -> pd.DataFrame:
-    """Downloads fresh version of income levels from WB"""
-    url = "https://databank.worldbank.org/data/download/site-content/CLASS.xlsx"
+INCOME_LEVELS_URL = "https://databankfiles.worldbank.org/public/ddpext_download/site-content/OGHIST.xlsx"
+INCOME_GROUPS: dict = {
+    "L": "Low income",
+    "LM": "Lower middle income",
+    "LM*": "Lower middle income",
+    "UM": "Upper middle income",
+    "H": "High income",
+}
+
 
-    df = pd.read_excel(
-        url,
-        sheet_name="List of economies",
-        usecols=["Code", "Income group"],
-        na_values=None,
+def _fiscal_year(label: str) -> int:
+    """converts a fiscal year label (e.g. 'FY89', 'FY24') to a year"""
+
+    year = int(label.strip()[2:4])
+    return 1900 + year if year >= 80 else 2000 + year
+
+
+def update_income_levels() -> pd.DataFrame:
+    """
+    Downloads the historical income classification (OGHIST.xlsx) from the World Bank
+    and compiles it to glossaries/income_levels.csv with one row per country and fiscal year
+    """
+
+    raw = excel.read_sheet(
+        client.get(INCOME_LEVELS_URL).content,
+        "Country Analytical History",
+        header=None,
     )
 
-    df = df.dropna(subset=["Income group"])
+    # the header row is the first row with fiscal year labels
+    header = raw.apply(lambda r: r.astype(str).str.match(r"FY\d\d").sum(), axis=1)
+    header_row = raw.iloc[header.idxmax()]
+    fy_columns = {
+        c: _fiscal_year(v)
+        for c, v in header_row.items()
+        if isinstance(v, str) and v.startswith("FY")
+    }
+
+    df = (
+        raw.iloc[header.idxmax() + 1 :]
+        .loc[lambda d: d[0].astype(str).str.fullmatch(r"[A-Z]{3}")]
+        .loc[:, [0] + list(fy_columns)]
+        .rename(columns={0: "iso_code"} | fy_columns)
+        .melt(id_vars="iso_code", var_name="fiscal_year", value_name="income_level")
+        .assign(income_level=lambda d: d.income_level.map(INCOME_GROUPS))
+        .dropna(subset=["income_level"])
+        .astype({"fiscal_year": "int64"})
+        .sort_values(["iso_code", "fiscal_year"])
+        .reset_index(drop=True)
+    )
+
+    df.to_csv(f"{config.paths.glossaries}/income_levels.csv", index=False)
+    sources.refresh(["income_levels"])
+    print("Successfully updated income levels")
 
     return df
 
 
-def add_income_levels(df: pd.DataFrame, iso_col: str = "iso_code") -> pd.DataFrame:
-    """Add income levels to a dataframe"""
+@sources.cached("income_levels")
+def _read_income_levels() -> pd.DataFrame:
+    """reads the compiled income classification glossary, until the file changes"""
+
+    return pd.read_csv(
+        f"{config.paths.glossaries}/income_levels.csv",
+        dtype={"fiscal_year": "int64"},
+    ).sort_values(["fiscal_year", "iso_code"], ignore_index=True)
 
-    income_levels = (
-        get_income_levels().set_index("Code").loc[:, "Income group"].to_dict()
+
+def get_income_levels(refresh: bool = False) -> pd.DataFrame:
+    """
+    Income classification by country (iso_code) and World Bank fiscal year
+        refresh: download the classification history from the World Bank first
+    """
+
+    if refresh:
+        update_income_levels()
+
+    return _read_income_levels()
+
+
+def add_income_levels(
+    df: pd.DataFrame, iso_col: str = "iso_code", year_col: str = None
+) -> pd.DataFrame:
+    """
+    Add income levels to a dataframe
+        iso_col: name of column with iso3 codes
+        year_col: name of column with years. If given, each row gets the classification
+        in effect that (fiscal) year, i.e. the latest one at or before it.
+        Otherwise, the latest classification is used for all rows
+    """
+
+    income_levels = _read_income_levels()
+
+    if year_col is None:
+        latest = income_levels.drop_duplicates("iso_code", keep="last")
+        return df.assign(
+            income_level=lambda d: d[iso_col].map(
+                latest.set_index("iso_code")["income_level"]
+            )
+        )
+
+    # merge_asof needs both sides sorted on the year, the original order is restored after.
+    # Rows without a year are left out of the merge and get no income level
+    df = df.assign(_order=range(len(df)))
+    known = df[year_col].notna()
+    left = (
+        df.loc[known]
+        .assign(_year=lambda d: d[year_col].astype("int64"))
+        .sort_values("_year", kind="stable")
+    )
+    merged = pd.merge_asof(
+        left,
+        income_levels.rename(columns={"iso_code": "_iso"}),
+        left_on="_year",
+        right_on="fiscal_year",
+        left_by=iso_col,
+        right_by="_iso",
+        direction="backward",
+    ).drop(columns=["_year", "_iso", "fiscal_year"])
+
+    return (
+        pd.concat([merged, df.loc[~known]], ignore_index=True)
+        .sort_values("_order")
+        .drop(columns="_order")
+        .set_axis(df.index)
     )
-    return df.assign(income_level=lambda d: d[iso_col].map(income_levels))
 
 
 # ===================================================
 # World Bank API
 # ===================================================
 
+WB_API = "https://api.worldbank.org/v2"
+WB_PAGE_SIZE = 20000
 
+
+@sources.cached("wb_indicators")
 def _download_wb_data(code: str, database: int = 2) -> pd.DataFrame:
     """
-    Queries indicator from World Bank API
+    Queries indicator from World Bank API, one page at a time through the shared client.
+    Returns one row per economy (iso3 index), with its name (Country) and one column
+    per year
         default database = 2 (World Development Indicators)
     """
 
+    url = f"{WB_API}/country/all/indicator/{code}"
+    params = {"source": database, "format": "json", "per_page": WB_PAGE_SIZE}
+
     try:
-        df = wb.data.DataFrame(
-            series=code, db=database, numericTimeKeys=True, labels=True
+        records, page, pages = [], 1, 1
+        while page <= pages:
+            meta, rows = client.get(url, params=params | {"page": page}).json()
+            records += rows or []
+            page, pages = page + 1, int(meta["pages"])
+
+        df = pd.DataFrame(
+            [
+                {
+                    "economy": r["countryiso3code"],
+                    "Country": r["country"]["value"],
+                    "year": int(r["date"]),
+                    "value": r["value"],
+                }
+                for r in records
+                if r["countryiso3code"]
+            ]
+        ).drop_duplicates(["economy", "year"])
+
+        values = (
+            df.pivot(index="economy", columns="year", values="value")
+            .astype("float64")
+            .sort_index(axis=1)
+            .rename_axis(columns=None)
+        )
+        return (
+            df.drop_duplicates("economy")
+            .set_index("economy")
+            .loc[:, ["Country"]]
+            .join(values)
+            .sort_index()
         )
-        return df
 
-    except:
-        raise Exception(f"Could not retieve {code} indicator from World Bank")
+    except Exception as error:
+        raise ConnectionError(
+            f"Could not retrieve {code} indicator from World Bank"
+        ) from error
 
 
 def _melt_wb_data(df: pd.DataFrame) -> pd.DataFrame:
@@ -161,15 +316,19 @@ WEO_RELEASE = 1
 def _download_weo(year: int = WEO_YEAR, release: int = WEO_RELEASE) -> None:
     """Downloads WEO as a csv to raw data folder as "weo_month_year.csv"""
 
+    import requests
+    import weo
+
     try:
         weo.download(
             year=year,
             release=release,
             directory=config.paths.raw_data,
             filename=f"weo_{year}_{release}.csv",
+            fetch=client.download,
         )
-    except ConnectionError:
-        raise ConnectionError("Could not download weo data")
+    except (OSError, requests.RequestException) as error:
+        raise ConnectionError("Could not download weo data") from error
 
 
 def _clean_weo(df: pd.DataFrame) -> pd.DataFrame:
@@ -193,24 +352,25 @@ def _clean_weo(df: pd.DataFrame) -> pd.DataFrame:
         df.drop(cols_to_drop, axis=1)
         .rename(columns=columns)
         .melt(id_vars=columns.values(), var_name="year", value_name="value")
-        .assign(
-            value=lambda d: d.value.map(
-                lambda x: str(x).replace(",", "").replace("-", "")
-            )
-        )
         .astype({"year": "int32"})
-        .assign(value=lambda d: pd.to_numeric(d.value, errors="coerce"))
+        .assign(value=lambda d: parsers.parse_numbers(d.value, errors="coerce"))
     )
 
 
-def get_weo_indicator_latest(
-    indicator: str, target_year: int = 2022, *, min_year: int = 2018
-) -> pd.DataFrame:
-    """
-    Retrieves values for an indicator for a target year
-    """
+@sources.cached("weo")
+def _read_weo() -> pd.DataFrame:
+    """reads the raw WEO data downloaded to the raw data folder"""
+
+    import weo
+
+    return weo.WEO(f"{config.paths.raw_data}/weo_{WEO_YEAR}_{WEO_RELEASE}.csv").df
 
-    df = weo.WEO(f"{config.paths.raw_data}/weo_{WEO_YEAR}_{WEO_RELEASE}.csv").df
+
+@backend.pluggable
+def _weo_indicator_latest(
+    df: pd.DataFrame, indicator: str, target_year: int, min_year: int
+) -> pd.DataFrame:
+    """latest values of an indicator between min_year and target_year from raw WEO data"""
 
     df = (
         df.pipe(_clean_weo)
@@ -224,11 +384,21 @@ def get_weo_indicator_latest(
         .reset_index(drop=True)
     )
     return df.loc[
-        df.groupby(["iso_code"])["year"].transform(max) == df["year"],
+        df.groupby(["iso_code"])["year"].transform("max") == df["year"],
         ["iso_code", "value"],
     ]
 
 
+def get_weo_indicator_latest(
+    indicator: str, target_year: int = 2022, *, min_year: int = 2018
+) -> pd.DataFrame:
+    """
+    Retrieves values for an indicator for a target year
+    """
+
+    return _weo_indicator_latest(_read_weo(), indicator, target_year, min_year)
+
+
 def get_gdp_latest(per_capita: bool = False, year: int = 2022) -> pd.DataFrame:
     """
     return latest gdp values
@@ -255,9 +425,7 @@ def add_gdp_latest(
     gdp_df = get_gdp_latest(year=year, per_capita=per_capita)
     gdp_dict = gdp_df.set_index("iso_code")["value"].to_dict()
 
-    df[new_col_name] = df[iso_col].map(gdp_dict)
-
-    return df
+    return df.assign(**{new_col_name: df[iso_col].map(gdp_dict)})
 
 
 IPC_COUNTRIES: dict = {
@@ -0,0 +1,192 @@
+"""
+Watch raw_data and glossaries, and rebuild the charts that use a file when it changes.
+
+    python -m scripts.watch
+
+Changed files are mapped to the sources that read them (see scripts.sources), and only
+the charts that used those sources are rebuilt. The sources used by each chart come
+from the last run report (output/run_report.json); charts missing from it are built
+once at start-up. Writes are debounced: charts are rebuilt once the files have not
+changed for `debounce` seconds.
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import time
+from dataclasses import dataclass, field
+
+from scripts import config, sources
+from scripts.charts import (
+    PAGE_CHARTS,
+    RUN_REPORT,
+    ipc_charts,
+    undernourishment_world,
+    update_chart,
+)
+from scripts.output import writer
+from scripts.panel import update_panel
+
+WATCHED_FOLDERS: tuple = ("raw_data", "glossaries")
+INTERVAL: float = 0.5
+DEBOUNCE: float = 1.0
+# the page charts, and the other charts reading manually downloaded files
+WATCHED_CHARTS: list = PAGE_CHARTS + [ipc_charts, undernourishment_world]
+
+
+def _scan() -> dict:
+    """size and modification time of the files in the watched folders"""
+
+    files = {}
+    for folder in WATCHED_FOLDERS:
+        directory = getattr(config.paths, folder)
+        for entry in os.scandir(directory):
+            if entry.is_file() and not entry.name.startswith("."):
+                stat = entry.stat()
+                files[entry.path] = (stat.st_mtime_ns, stat.st_size)
+
+    return files
+
+
+def sources_for(paths) -> list:
+    """names of the sources reading any of the files"""
+
+    return [
+        name
+        for name, source in sources.SOURCES.items()
+        if any(
+            os.path.dirname(path) == source.directory
+            and any(fnmatch.fnmatch(os.path.basename(path), p) for p in source.files)
+            for path in paths
+        )
+    ]
+
+
+@dataclass
+class Watcher:
+    """
+    Rebuilds charts when the files of their sources change
+        charts: chart functions to keep up to date
+        debounce: seconds without changes before rebuilding
+    """
+
+    charts: list = field(default_factory=lambda: list(WATCHED_CHARTS))
+    debounce: float = DEBOUNCE
+    used: dict = field(default_factory=dict)
+    files: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.files = _scan()
+        try:
+            with open(os.path.join(config.paths.output, RUN_REPORT)) as file:
+                report = json.load(file)
+        except FileNotFoundError:
+            report = {}
+
+        for name, entry in report.get("charts", {}).items():
+            self.used[name] = set(entry["sources"])
+
+    def _changed(self) -> set:
+        """files added, changed or removed since the last scan"""
+
+        files = _scan()
+        changed = {
+            path
+            for path in self.files.keys() | files.keys()
+            if self.files.get(path) != files.get(path)
+        }
+        self.files = files
+
+        return changed
+
+    def _build(self, charts: list) -> list:
+        for chart in charts:
+            entry = update_chart(chart)
+            self.used[chart.__name__] = set(entry["sources"])
+
+        return [chart.__name__ for chart in charts]
+
+    def start(self) -> list:
+        """Build the charts whose sources are not known. Returns their names"""
+
+        return self._build([c for c in self.charts if c.__name__ not in self.used])
+
+    def rebuild(self, paths) -> list:
+        """
+        Refresh the sources reading the files and rebuild the charts using them
+            paths: changed files
+        Returns the names of the rebuilt charts
+        """
+
+        refreshed = set(sources.refresh(sources_for(paths)))
+        if not refreshed:
+            return []
+
+        rebuilt = self._build(
+            [c for c in self.charts if self.used.get(c.__name__, set()) & refreshed]
+        )
+        update_panel(refreshed=list(refreshed))
+        writer.finish()
+
+        return rebuilt
+
+    def poll(self) -> list:
+        """Rebuild the charts affected by changes since the last poll, once writes stop"""
+
+        changed = self._changed()
+        if not changed:
+            return []
+
+        while True:
+            time.sleep(self.debounce)
+            more = self._changed()
+            if not more:
+                break
+            changed |= more
+
+        start = time.perf_counter()
+        rebuilt = self.rebuild(changed)
+        names = ", ".join(sorted(os.path.basename(p) for p in changed))
+        if rebuilt:
+            seconds = time.perf_counter() - start
+            print(f"{names} changed: rebuilt {', '.join(rebuilt)} in {seconds:.1f}s")
+        else:
+            print(f"{names} changed: no chart uses it")
+
+        return rebuilt
+
+
+def watch(
+    interval: float = INTERVAL, debounce: float = DEBOUNCE, compress: bool = False
+) -> None:
+    """
+    Rebuild charts as their raw_data and glossaries files change, until interrupted
+        interval: seconds between checks for changes
+        debounce: seconds without changes before rebuilding
+        compress: also write gzip/brotli copies of each csv
+    """
+
+    writer.compress = compress
+    watcher = Watcher(debounce=debounce)
+    built = watcher.start()
+    if built:
+        print(f"Built {', '.join(built)}")
+
+    print(f"Watching {', '.join(WATCHED_FOLDERS)} for changes")
+    try:
+        while True:
+            watcher.poll()
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild charts as raw data changes")
+    parser.add_argument("--interval", type=float, default=INTERVAL)
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE)
+    parser.add_argument("--compress", action="store_true")
+    args = parser.parse_args()
+
+    watch(args.interval, args.debounce, args.compress)